@@ -0,0 +1,179 @@
+r"""End-to-end benchmarks of `Client` against an in-process stub of the API.
+Measures throughput and latency percentiles for public GETs, signed GETs,
+signed POSTs, signing alone and response decoding, and writes the results as
+JSON so that runs can be compared between commits.
+Usage:
+--
+python benchmarks/bench_client.py [--seconds 2] [--threads 1] [--output results.json]
+python benchmarks/bench_client.py --compare before.json after.json
+"""
+import argparse, json, os, platform, subprocess, sys, threading, time
+
+# Benchmark the checkout this script belongs to, installed or not
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path[:0] = [os.path.dirname(HERE), HERE]
+from pareto import Client, UNDERLYING_ETH, ORDER_TYPE_CALL, ORDER_SIDE_BUY  # noqa: E402
+from pareto import utils  # noqa: E402
+from stub_server import DEPTH, StubServer  # noqa: E402
+
+# Older trees have no codec; fall back to the stdlib so they can be measured
+encode = utils.DEFAULT_JSON_CODEC.encode if hasattr(utils, 'DEFAULT_JSON_CODEC') else json.dumps
+decode = utils.DEFAULT_JSON_CODEC.decode if hasattr(utils, 'DEFAULT_JSON_CODEC') else json.loads
+
+PRIVATE_KEY = '0x' + '4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318'
+
+
+def percentile(sorted_values, q):
+    r"""Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return float('nan')
+    index = max(0, min(len(sorted_values) - 1, int(round(q / 100. * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def measure(fn, seconds, threads=1, warmup=20):
+    r"""Call `fn` repeatedly from `threads` threads for `seconds`.
+    Returns throughput in calls per second and latency percentiles in ms.
+    """
+    for _ in range(warmup):
+        fn()
+    latencies = [[] for _ in range(threads)]
+    stop = time.perf_counter() + seconds
+
+    def worker(samples):
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            fn()
+            samples.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    workers = [threading.Thread(target=worker, args=(samples,)) for samples in latencies]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    samples = sorted(s for thread_samples in latencies for s in thread_samples)
+    return {
+        'calls': len(samples),
+        'throughput': len(samples) / elapsed,
+        'mean_ms': 1000. * sum(samples) / max(len(samples), 1),
+        'p50_ms': 1000. * percentile(samples, 50),
+        'p99_ms': 1000. * percentile(samples, 99),
+    }
+
+
+def scenarios(client):
+    r"""Benchmarked operations, keyed by name."""
+    signer = client.private.signer
+    body = {
+        'strike': 5,
+        'quantity': 1.,
+        'price': 10.,
+        'isCall': ORDER_TYPE_CALL,
+        'isBuy': ORDER_SIDE_BUY,
+    }
+    if hasattr(signer, 'add_encoded_headers'):
+        body_text = encode(body)
+        sign = lambda: signer.add_encoded_headers('POST', '/user/create/limit/0', body_text)
+    else:
+        sign = lambda: signer.add_headers('POST', '/user/create/limit/0', body)
+    payload = json.dumps(DEPTH).encode('utf-8')
+    return {
+        'public_get': lambda: client.public.get_depth(UNDERLYING_ETH, 5, ORDER_TYPE_CALL),
+        'signed_get': lambda: client.private.get_orders(UNDERLYING_ETH),
+        'signed_post': lambda: client.private.create_limit_order(UNDERLYING_ETH,
+                                                                 5,
+                                                                 1.,
+                                                                 10.,
+                                                                 ORDER_TYPE_CALL,
+                                                                 ORDER_SIDE_BUY,
+                                                                 ),
+        'sign': sign,
+        'decode': lambda: decode(payload),
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+                                       stderr=subprocess.DEVNULL,
+                                       ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def close(client):
+    r"""Close the client's connections, shared or per client."""
+    if hasattr(client, 'transport'):
+        client.transport.close()
+    else:
+        client.public.session.close()
+        client.private.session.close()
+
+
+def run(seconds, threads, only=None):
+    server = StubServer().start()
+    client = Client(host=server.url, eth_private_key=PRIVATE_KEY)
+    try:
+        results = {}
+        for name, fn in scenarios(client).items():
+            if only and name not in only:
+                continue
+            results[name] = measure(fn, seconds, threads)
+            print(f'{name:>12}: {results[name]["throughput"]:10.1f} /s'
+                  f'  p50 {results[name]["p50_ms"]:8.3f} ms'
+                  f'  p99 {results[name]["p99_ms"]:8.3f} ms')
+    finally:
+        close(client)
+        server.stop()
+    return {
+        'commit': git_commit(),
+        'timestamp': time.time(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'seconds': seconds,
+        'threads': threads,
+        'signing_backend': getattr(getattr(client.private.signer, 'backend', None),
+                                   '__name__', None),
+        'results': results,
+    }
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)['results']
+    with open(after_path) as f:
+        after = json.load(f)['results']
+    print(f'{"":>12}  {"throughput":>10}  {"p50":>8}  {"p99":>8}')
+    for name in before:
+        if name not in after:
+            continue
+        b, a = before[name], after[name]
+        print(f'{name:>12}  {a["throughput"] / b["throughput"]:9.2f}x'
+              f'  {a["p50_ms"] / b["p50_ms"]:7.2f}x  {a["p99_ms"] / b["p99_ms"]:7.2f}x')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=2.)
+    parser.add_argument('--threads', type=int, default=1)
+    parser.add_argument('--only', nargs='*', help='Scenarios to run, default all')
+    parser.add_argument('--output', help='Path of the JSON results file')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'),
+                        help='Print the ratio of two results files and exit')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args.seconds, args.threads, args.only)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+r"""Micro-benchmark for `Signer.sign`.
+Reports signatures per second for the original implementation
+(`JSONEncoderForHTML` + `Account.sign_message` on the raw hex key) and for
+each available backend. tests/test_signer.py checks they sign identically.
+Usage:
+--
+python benchmarks/bench_signer.py [--seconds 2]
+"""
+import argparse, json, os, random, sys, time
+from simplejson.encoder import JSONEncoderForHTML
+from eth_account import Account
+from eth_account.messages import encode_defunct
+
+# Benchmark the checkout this script belongs to, installed or not
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from pareto import signer as signer_module  # noqa: E402
+from pareto.signer import Signer  # noqa: E402
+
+# Older trees have a single signing path and no `backend` argument
+HAS_BACKENDS = hasattr(signer_module, 'get_backend')
+coincurve = getattr(signer_module, 'coincurve', None)
+
+PRIVATE_KEY = '0x' + '4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318'
+
+
+def reference_sign(private_key, method, uri, body, timestamp):
+    r"""Original signing path, the baseline to beat."""
+    message = {
+        'method': method,
+        'requestPath': uri,
+        'body': json.dumps(body),
+        'timestamp': timestamp,
+    }
+    text = JSONEncoderForHTML(separators=(',', ':')).encode(message)
+    signed_message = Account.sign_message(encode_defunct(text=text), private_key)
+    return signed_message.signature.hex()
+
+
+def make_corpus(size, seed=0):
+    r"""Requests resembling real traffic, plus HTML-sensitive characters."""
+    rng = random.Random(seed)
+    corpus = []
+    for i in range(size):
+        body = {
+            'strike': rng.randrange(11),
+            'quantity': round(rng.uniform(0.01, 100), 2),
+            'price': round(rng.uniform(0.01, 500), 2),
+            'isCall': rng.random() < 0.5,
+            'isBuy': rng.random() < 0.5,
+        }
+        if i % 7 == 0:
+            body['note'] = '<a&b>'
+        if i % 2 == 0:
+            corpus.append(('POST', '/user/create/limit/0', body, 1660000000 + i))
+        else:
+            uri = f'/user/orders/0?strike={i % 11}&isCall=True'
+            corpus.append(('GET', uri, {}, 1660000000 + i))
+    return corpus
+
+
+def rate(fn, corpus, seconds):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        for request in corpus:
+            fn(*request)
+        count += len(corpus)
+    return count / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--seconds', type=float, default=2.)
+    parser.add_argument('--corpus', type=int, default=200)
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.corpus)
+    if HAS_BACKENDS:
+        backends = ['native'] + (['coincurve'] if coincurve is not None else [])
+    else:
+        backends = ['default']
+
+    def make_signer(backend):
+        return Signer(PRIVATE_KEY, backend=backend) if HAS_BACKENDS else Signer(PRIVATE_KEY)
+
+    reference = lambda *request: reference_sign(PRIVATE_KEY, *request)
+    print(f'{"reference":>10}: {rate(reference, corpus, args.seconds):10.1f} sig/s')
+    for backend in backends:
+        signer = make_signer(backend)
+        print(f'{backend:>10}: {rate(signer.sign, corpus, args.seconds):10.1f} sig/s')
+
+
+if __name__ == '__main__':
+    main()
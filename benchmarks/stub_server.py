@@ -0,0 +1,133 @@
+r"""In-process stub of the Pareto API for benchmarks.
+Serves every route used by `pareto.client` with small canned payloads over
+HTTP/1.1 keep-alive. Private routes require the signature headers added by
+`Signer`, but signatures are not verified.
+Usage:
+--
+server = StubServer().start()
+client = Client(host=server.url)
+...
+server.stop()
+"""
+import json, re, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+SIGNATURE_HEADERS = ('pareto-ethereum-address', 'pareto-signature', 'pareto-timestamp')
+
+DEPTH = {
+    'bids': [{'price': round(10 - 0.5 * i, 2), 'quantity': 1. + i} for i in range(10)],
+    'asks': [{'price': round(10.5 + 0.5 * i, 2), 'quantity': 1. + i} for i in range(10)],
+}
+STRIKES = {'strikes': [1000. + 100. * i for i in range(11)]}
+MARK = {'calls': [50. - 4. * i for i in range(11)], 'puts': [4. * i + 10. for i in range(11)]}
+GREEKS = {'delta': 0.5, 'gamma': 0.001, 'vega': 1.5, 'theta': -0.2}
+ORDER = {
+    'id': '0b6d6a6a-2a4e-4a4f-9b57-b2b5b0f0d1a1',
+    'strike': 5,
+    'quantity': 1.,
+    'price': 10.,
+    'isCall': True,
+    'isBuy': True,
+}
+
+
+def _expiry():
+    # Three days from now, in ms
+    return int((time.time() + 3 * 24 * 3600) * 1000)
+
+
+# (method, pattern, private, payload factory)
+ROUTES = [
+    ('GET', r'/ping', False, lambda m, b: {'pong': True}),
+    ('GET', r'/public/depth/\d+', False, lambda m, b: DEPTH),
+    ('GET', r'/public/expiry/\d+', False, lambda m, b: {'expiry': _expiry()}),
+    ('GET', r'/public/sigma/\d+', False, lambda m, b: {'sigma': 0.8}),
+    ('GET', r'/public/price/market/\d+', False, lambda m, b: {'price': 10.25}),
+    ('GET', r'/public/price/strikes/\d+', False, lambda m, b: STRIKES),
+    ('GET', r'/public/price/mark/\d+', False, lambda m, b: MARK),
+    ('GET', r'/public/price/greeks/\d+', False, lambda m, b: GREEKS),
+    ('GET', r'/public/price/breakeven/\d+', False, lambda m, b: {'breakeven': 1510.}),
+    ('GET', r'/public/price/margin/\d+', False, lambda m, b: {'margin': 150.}),
+    ('GET', r'/user/order/\d+/[\w-]+', True, lambda m, b: ORDER),
+    ('GET', r'/user/orders/\d+', True, lambda m, b: [ORDER] * 5),
+    ('GET', r'/user/positions/\d+', True, lambda m, b: []),
+    ('GET', r'/user/openinterest/\d+', True, lambda m, b: {'openInterest': 12.}),
+    ('GET', r'/user/availbalance/\d+', True, lambda m, b: {'balance': 10000.}),
+    ('GET', r'/user/accountinfo/\d+', True, lambda m, b: {'balance': 10000., 'margin': 0.}),
+    ('POST', r'/user/create/market/\d+', True, lambda m, b: dict(ORDER, **b)),
+    ('POST', r'/user/create/limit/\d+', True, lambda m, b: dict(ORDER, **b)),
+    ('POST', r'/user/cancel/batch/\d+', True, lambda m, b: {'cancelled': b.get('ids', [])}),
+    ('POST', r'/user/cancel/all/\d+', True, lambda m, b: {'cancelled': []}),
+    ('POST', r'/user/cancel/\d+/[\w-]+', True,
+     lambda m, b: {'cancelled': [m.group(0).rsplit('/', 1)[1]]}),
+]
+COMPILED_ROUTES = [(method, re.compile(pattern + r'$'), private, payload)
+                   for method, pattern, private, payload in ROUTES]
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+        path = self.path.split('?', 1)[0]
+        for route_method, pattern, private, payload in COMPILED_ROUTES:
+            match = pattern.match(path)
+            if route_method != method or match is None:
+                continue
+            if private and not all(self.headers.get(h) for h in SIGNATURE_HEADERS):
+                return self._respond(401, {'error': 'missing signature'})
+            body = json.loads(raw) if raw else {}
+            return self._respond(200, payload(match, body))
+        self._respond(404, {'error': f'no route for {method} {path}'})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class StubServer:
+    r"""Stub API server running on a background thread.
+    Arguments:
+    --
+    host (string, default='127.0.0.1'): Interface to bind
+    port (integer, default=0): Port to bind, 0 for any free port
+    """
+    def __init__(self, host='127.0.0.1', port=0):
+        self._server = _ThreadingServer((host, port), StubHandler)
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
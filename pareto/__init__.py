@@ -8,4 +8,9 @@ from pareto.constants import (ORDER_SIDE_BUY,
                               VALID_ORDER_SIDE,
                               VALID_ORDER_TYPE,
                               VALID_UNDERLYING,
-                              )
\ No newline at end of file
+                              )
+
+try:
+    from pareto.async_client import AsyncClient
+except ImportError:  # aiohttp is an optional dependency
+    pass
@@ -0,0 +1,172 @@
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from pareto import constants
+from pareto.client import PublicClient, PrivateClient
+from pareto.signer import Signer
+from pareto.transport import Transport
+from pareto.utils import BatchResult, DEFAULT_JSON_CODEC
+
+
+class AccountPool:
+    r"""Many accounts behind one connection pool. Every account gets a
+    `PrivateClient` with its own `Signer`, but all of them share one
+    `Transport`, and so one session, scheduler and set of connections,
+    however many accounts there are. Batch helpers call an endpoint for
+    every account concurrently and return results keyed by address.
+    Arguments:
+    --
+    host (string): Host for the endpoint
+    accounts (Iterable[string or Signer]): Private keys or signers
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight, per account
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    scheduler (Optional[RequestScheduler], default: None): Rate limits and
+        prioritizes requests of all accounts. Ignored if `transport` is given
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Encoder and decoder
+        for request and response bodies
+    transport (Optional[Transport], default: None): Shared HTTP transport. If
+        None, one is created from `timeout` and `pool_size`
+    pool_size (integer): Maximum number of connections kept open
+    max_workers (integer): Maximum number of requests in flight in batches
+    """
+    def __init__(self,
+                 host,
+                 accounts=(),
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 singleflight=None,
+                 instrumentation=None,
+                 scheduler=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 transport=None,
+                 pool_size=constants.DEFAULT_POOL_SIZE,
+                 max_workers=constants.DEFAULT_MAX_WORKERS,
+                 ):
+        if host.endswith('/'):
+            host = host[:-1]
+        if transport is None:
+            transport = Transport(pool_size=pool_size,
+                                  read_timeout=timeout,
+                                  json_codec=json_codec,
+                                  scheduler=scheduler,
+                                  )
+        self.host = host
+        self.timeout = timeout
+        self.singleflight = singleflight
+        self.instrumentation = instrumentation
+        self.json_codec = json_codec
+        self.transport = transport
+        self.max_workers = max_workers
+        self.public = PublicClient(host,
+                                   timeout=timeout,
+                                   instrumentation=instrumentation,
+                                   json_codec=json_codec,
+                                   transport=transport,
+                                   )
+        self._clients = {}
+        for account in accounts:
+            self.add(account)
+
+    def add(self, account):
+        r"""Add an account. Returns its `PrivateClient`.
+        Arguments:
+        --
+        account (string or Signer): Private key or signer
+        """
+        signer = account if isinstance(account, Signer) else Signer(account)
+        client = PrivateClient(self.host,
+                               signer,
+                               timeout=self.timeout,
+                               singleflight=self.singleflight,
+                               instrumentation=self.instrumentation,
+                               json_codec=self.json_codec,
+                               transport=self.transport,
+                               )
+        self._clients[signer.address] = client
+        return client
+
+    def remove(self, address):
+        r"""Remove an account by address."""
+        del self._clients[address]
+
+    def __getitem__(self, address):
+        r"""`PrivateClient` of an account."""
+        return self._clients[address]
+
+    def __contains__(self, address):
+        return address in self._clients
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __iter__(self):
+        return iter(self._clients)
+
+    @property
+    def addresses(self):
+        return list(self._clients)
+
+    def map(self, method, *args, addresses=None, **kwargs):
+        r"""Call a `PrivateClient` method for many accounts concurrently.
+        Returns a `BatchResult` per address, in account order.
+        Arguments:
+        --
+        method (string or Callable[..., Response]): Name of the endpoint
+            method, or a function taking the account's client then `args`
+        args: Positional arguments of the method
+        addresses (Optional[Iterable[string]], default=None): Accounts to
+            call, all if None
+        kwargs: Keyword arguments of the method
+        """
+        clients = [self._clients[address]
+                   for address in (self._clients if addresses is None else addresses)]
+        if isinstance(method, str):
+            calls = [getattr(client, method) for client in clients]
+        else:
+            calls = [partial(method, client) for client in clients]
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(copy_context().run, call, *args, **kwargs)
+                       for call in calls]
+            return {client.signer.address: BatchResult.from_future(future)
+                    for client, future in zip(clients, futures)}
+
+    def get_account_info(self, underlying, addresses=None):
+        r"""`get_account_info` of every account, keyed by address."""
+        return self.map('get_account_info', underlying, addresses=addresses)
+
+    def get_available_balance(self, underlying, addresses=None):
+        r"""`get_available_balance` of every account, keyed by address."""
+        return self.map('get_available_balance', underlying, addresses=addresses)
+
+    def get_positions(self, underlying, addresses=None):
+        r"""`get_positions` of every account, keyed by address."""
+        return self.map('get_positions', underlying, addresses=addresses)
+
+    def get_orders(self, underlying, addresses=None):
+        r"""`get_orders` of every account, keyed by address."""
+        return self.map('get_orders', underlying, addresses=addresses)
+
+    def cancel_all(self, underlying, addresses=None):
+        r"""`cancel_all` for every account, keyed by address."""
+        return self.map('cancel_all', underlying, addresses=addresses)
+
+    def deadline(self, budget):
+        r"""Context manager bounding every request made inside the block, on
+        this thread, by a shared budget. Batches inherit it.
+        Arguments:
+        --
+        budget (integer): Number of ms available for all requests in the block
+        """
+        return self.transport.deadline(budget)
+
+    def close(self):
+        r"""Close the shared connection pool."""
+        self.transport.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,538 @@
+import json
+import time
+import asyncio
+from functools import partial
+import aiohttp
+from pareto.signer import Signer
+from pareto.client import PublicClient, PrivateClient
+from pareto import constants
+from pareto.errors import ParetoAPIError, ParetoTimeoutError
+from pareto.transport import deadline, remaining_budget
+from pareto.scheduler import classify
+from pareto.chain import CHAIN_FIELDS, ChainSnapshot, chain_requests
+from pareto.instrumentation import current_trace, instrumented
+from pareto.subscriptions import AsyncPollScheduler
+from pareto.utils import (get_query_path,
+                          Response,
+                          BatchResult,
+                          DEFAULT_HEADERS,
+                          DEFAULT_JSON_CODEC,
+                          )
+
+
+class AsyncClient:
+    r"""Asyncio client for interacting with the Pareto API.
+    All public and private endpoints return awaitables. Every request made
+    by the client runs on the current event loop and shares one pooled
+    `aiohttp.ClientSession`. Use as `async with AsyncClient(...) as client`
+    or call `await client.close()` when done.
+    Arguments:
+    --
+    host (string): Host for the endpoint
+    eth_private_key (Optional[string], default: None): Private key for ETH
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    pool_size (integer): Maximum number of simultaneous connections
+    cache (Optional[ResponseCache], default: None): Cache for public responses
+    hedger (Optional[Hedger], default: None): Hedging policy for public GETs
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    scheduler (Optional[RequestScheduler], default: None): Rate limits and
+        prioritizes requests. Ignored if `transport` is given
+    recorder (Optional[Recorder], default: None): Records all traffic to a
+        capture file. Ignored if `transport` is given
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Encoder and decoder
+        for request and response bodies
+    transport (Optional[AsyncTransport], default: None): Shared HTTP
+        transport. If None, one is created from `timeout` and `pool_size`
+    connect_timeout (integer): Number of ms to wait to establish a connection
+    """
+
+    def __init__(self,
+                 host,
+                 eth_private_key=None,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 pool_size=constants.DEFAULT_POOL_SIZE,
+                 cache=None,
+                 hedger=None,
+                 singleflight=None,
+                 instrumentation=None,
+                 scheduler=None,
+                 recorder=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 transport=None,
+                 connect_timeout=constants.DEFAULT_CONNECT_TIMEOUT,
+                 ):
+        if host.endswith('/'):
+            host = host[:-1]
+
+        if transport is None:
+            transport = AsyncTransport(pool_size=pool_size,
+                                       connect_timeout=connect_timeout,
+                                       read_timeout=timeout,
+                                       json_codec=json_codec,
+                                       scheduler=scheduler,
+                                       recorder=recorder,
+                                       )
+        self.transport = transport
+        self._public = AsyncPublicClient(host,
+                                         transport,
+                                         timeout=timeout,
+                                         cache=cache,
+                                         hedger=hedger,
+                                         singleflight=singleflight,
+                                         instrumentation=instrumentation,
+                                         json_codec=json_codec,
+                                         )
+        self._private = None
+
+        if eth_private_key is not None:
+            signer = Signer(eth_private_key)
+            self._private = AsyncPrivateClient(host,
+                                               signer,
+                                               transport,
+                                               timeout=timeout,
+                                               singleflight=singleflight,
+                                               instrumentation=instrumentation,
+                                               json_codec=json_codec,
+                                               )
+
+    @property
+    def public(self):
+        r"""Get the public module, used for interacting with public endpoints"""
+        return self._public
+
+    @property
+    def private(self):
+        r"""Get the private module, used for interacting with private endpoints"""
+        if self._private is None:
+            raise Exception('Private endpoints not supported ' +
+                            'since private key was not specified')
+        return self._private
+
+    def deadline(self, budget):
+        r"""Context manager bounding every request awaited inside the block, in
+        this task, by a shared budget.
+        Arguments:
+        --
+        budget (integer): Number of ms available for all requests in the block
+        """
+        return deadline(budget)
+
+    async def close(self):
+        r"""Stop subscriptions and close the underlying connection pool."""
+        if self._public._poller is not None:
+            self._public._poller.close()
+        await self.transport.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+
+class AsyncTransport:
+    r"""Asyncio HTTP transport shared by public and private async clients.
+    Holds one `aiohttp.ClientSession`, opened lazily on first use so that it
+    binds to the running event loop.
+    Arguments:
+    --
+    pool_size (integer): Maximum number of simultaneous connections
+    connect_timeout (integer): Number of ms to wait to establish a connection
+    read_timeout (integer): Number of ms to wait between bytes of the response
+    keep_alive (boolean, default=True): Reuse connections between requests
+    json_codec (JSONCodec, default=DEFAULT_JSON_CODEC): Encoder and decoder
+        for bodies
+    scheduler (Optional[RequestScheduler], default=None): Rate limits and
+        prioritizes requests before they are sent
+    recorder (Optional[Recorder], default=None): Records every request and
+        response to a capture file
+    """
+    def __init__(self,
+                 pool_size=constants.DEFAULT_POOL_SIZE,
+                 connect_timeout=constants.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=constants.DEFAULT_API_TIMEOUT,
+                 keep_alive=True,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 scheduler=None,
+                 recorder=None,
+                 ):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keep_alive = keep_alive
+        self.json_codec = json_codec
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self._session = None
+
+    def get(self):
+        r"""Return the open session, creating it if needed."""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size,
+                                             force_close=not self.keep_alive,
+                                             )
+            self._session = aiohttp.ClientSession(connector=connector,
+                                                  headers=DEFAULT_HEADERS,
+                                                  )
+        return self._session
+
+    def timeouts(self, uri, budget=None):
+        r"""Connect and read timeouts, with the total capped by the remaining budget."""
+        return aiohttp.ClientTimeout(total=remaining_budget(uri, budget),
+                                     sock_connect=self.connect_timeout / 1000.,
+                                     sock_read=self.read_timeout / 1000.,
+                                     )
+
+    async def request(self,
+                      uri,
+                      method,
+                      headers=None,
+                      body={},
+                      data=None,
+                      deadline=None,
+                      json_codec=None,
+                      ):
+        r"""Send a request through the shared session.
+        Arguments:
+        --
+        uri (string): Full URI endpoint
+        method (string): GET or POST
+        headers (Optional[Dict[string, any]], default=None): Header information
+        body (Dict[string, any], default={}): Body data
+        data (Optional[bytes], default=None): Already encoded body
+        deadline (Optional[integer], default=None): Number of ms for this call
+        json_codec (Optional[JSONCodec], default=None): Overrides the codec
+        """
+        if self.scheduler is not None:
+            # Time spent queued counts against the deadline
+            budget = remaining_budget(uri, deadline)
+            queued = time.monotonic()
+            await self.scheduler.acquire_async(classify(method, uri), budget, uri)
+            if budget is not None:
+                deadline = (budget - (time.monotonic() - queued)) * 1000.
+        json_codec = json_codec or self.json_codec
+        try:
+            timeout = self.timeouts(uri, deadline)
+            if self.recorder is None:
+                return await make_async_request(self.get(),
+                                                uri,
+                                                method,
+                                                headers,
+                                                body,
+                                                timeout=timeout,
+                                                data=data,
+                                                json_codec=json_codec,
+                                                )
+            if data is None:
+                data = json_codec.encode(body).encode('utf-8')
+            send = partial(make_async_request,
+                           self.get(),
+                           uri,
+                           method,
+                           headers,
+                           timeout=timeout,
+                           data=data,
+                           json_codec=json_codec,
+                           )
+            return await self.recorder.capture_async(method, uri, data, send)
+        except asyncio.TimeoutError as e:
+            raise ParetoTimeoutError(uri, 'request timed out') from e
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+async def make_async_request(session,
+                             uri,
+                             method,
+                             headers=None,
+                             body={},
+                             timeout=None,
+                             data=None,
+                             json_codec=DEFAULT_JSON_CODEC,
+                             ):
+    r"""Make a generic HTTP request on an asyncio session.
+    Arguments:
+    --
+    session (aiohttp.ClientSession): Open session
+    uri (string): full URI endpoint
+    headers (Optional[Dict[string, any]], default=None): Header information
+    body (Dict[string, any], default={}): Body data. Encoded with `json_codec`
+    timeout (Optional[aiohttp.ClientTimeout], default=None): Timeouts
+    data (Optional[bytes], default=None): Already encoded body, sent as is
+        instead of `body`
+    json_codec (JSONCodec): Codec to encode `body` and decode the response
+    """
+    assert method.upper() in ['GET', 'POST'], f'method {method} not supported'
+    if data is None:
+        data = json_codec.encode(body).encode('utf-8')
+    trace = current_trace()
+    if trace is not None:
+        start = time.perf_counter()
+    async with session.request(method.upper(),
+                               uri,
+                               headers=headers,
+                               data=data,
+                               timeout=timeout,
+                               ) as response:
+        content = await response.read()
+        if trace is not None:
+            trace.status = response.status
+            trace.observe('network', time.perf_counter() - start)
+        if not str(response.status).startswith('2'):
+            raise ParetoAPIError(AsyncErrorResponse(response, content))
+
+        return Response(headers=response.headers,
+                        raw=content,
+                        json_codec=json_codec,
+                        trace=trace,
+                        status_code=response.status,
+                        )
+
+
+class AsyncErrorResponse:
+    r"""Adapter exposing an aiohttp response with the attributes read by
+    `ParetoAPIError`.
+    Arguments:
+    --
+    response (aiohttp.ClientResponse): Response object
+    content (bytes): Body of the response
+    """
+    def __init__(self, response, content):
+        self.status_code = response.status
+        self.content = content
+        self.text = content.decode('utf-8', errors='replace')
+        self.headers = response.headers
+        self.request = response.request_info
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class AsyncPublicClient(PublicClient):
+    r"""Asyncio version of `PublicClient`. Endpoint methods perform the same
+    argument validation and return awaitables.
+    Arguments:
+    --
+    host (string): Host URL path
+    transport (AsyncTransport): Shared HTTP transport
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    cache (Optional[ResponseCache], default: None): Cache for responses
+    hedger (Optional[Hedger], default: None): Hedging policy for GETs
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight, keyed by URI
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Decoder for responses
+    """
+    def __init__(self,
+                 host,
+                 transport,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 cache=None,
+                 hedger=None,
+                 singleflight=None,
+                 instrumentation=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 ):
+        self.host = host
+        self.timeout = timeout
+        self.cache = cache
+        self.hedger = hedger
+        self.singleflight = singleflight
+        self.instrumentation = instrumentation
+        self.json_codec = json_codec
+        self.transport = transport
+        self._poller = None
+
+    def _new_poller(self):
+        # Subscriptions are async iterators polled on the running event loop
+        return AsyncPollScheduler()
+
+    async def _get(self, request_path, headers=None, params={}, deadline=None):
+        r"""General GET request
+        Arguments:
+        --
+        request_path (string): endpoint e.g. /ping. Includes URI params
+        params (Dict[string, any]): Map of query parameters
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        uri = get_query_path(f'{self.host}{request_path}', params)
+        if self.cache is not None:
+            response = self.cache.get(request_path, uri)
+            if response is not None:
+                return response
+        send = partial(self.transport.request,
+                       uri,
+                       'GET',
+                       headers=headers,
+                       deadline=deadline,
+                       json_codec=self.json_codec,
+                       )
+        if self.hedger is not None:
+            send = partial(self.hedger.run_async, send)
+        if self.singleflight is not None:
+            send = partial(self.singleflight.do_async, uri, send)
+        response = await send()
+        if self.cache is not None:
+            self.cache.put(request_path, uri, response)
+        return response
+
+    async def get_chain_snapshot(self,
+                                 underlying,
+                                 fields=CHAIN_FIELDS,
+                                 max_workers=constants.DEFAULT_MAX_WORKERS,
+                                 ):
+        r"""Fetch depth, greeks and sigma for every strike and type concurrently.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        fields (Iterable[string]): Subset of `chain.CHAIN_FIELDS` to fetch
+        max_workers (integer): Maximum number of requests in flight
+        """
+        requests = chain_requests(underlying, fields)
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def fetch(method, args):
+            async with semaphore:
+                return await getattr(self, method)(*args)
+
+        started = time.time()
+        results = await asyncio.gather(*[fetch(method, args)
+                                         for _, _, method, args in requests])
+        return ChainSnapshot.from_results(underlying, started, requests, results)
+
+
+class AsyncPrivateClient(PrivateClient):
+    r"""Asyncio version of `PrivateClient`. Endpoint methods perform the same
+    argument validation and signing, and return awaitables.
+    Arguments:
+    --
+    host (string): Host URL path
+    signer (Signer): Class to sign transactions for authentication
+    transport (AsyncTransport): Shared HTTP transport
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight, keyed by signer address and URI
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Encoder and decoder
+        for request and response bodies
+    """
+    def __init__(self,
+                 host,
+                 signer,
+                 transport,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 singleflight=None,
+                 instrumentation=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 ):
+        self.host = host
+        self.signer = signer
+        self.timeout = timeout
+        self.singleflight = singleflight
+        self.instrumentation = instrumentation
+        self.json_codec = json_codec
+        self.transport = transport
+        self.listeners = []
+
+    async def _get(self, request_path, headers=None, params={}, deadline=None):
+        r"""General GET request
+        Arguments:
+        --
+        request_path (string): Endpoint e.g. /ping. Includes URI params
+        params (Dict[string, any]): Dictionary of query parameters
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        request_path = get_query_path(request_path, params)
+
+        async def send():
+            request = self._prepare('GET', request_path, {}, headers)
+            return await self._send(request, deadline=deadline)
+
+        if self.singleflight is None:
+            return await send()
+        # Only coalesce requests signed by the same key
+        key = (self.signer.address, f'{self.host}{request_path}')
+        return await self.singleflight.do_async(key, send)
+
+    async def _post(self, request_path, headers=None, body={}, deadline=None):
+        r"""General POST request
+        Arguments:
+        --
+        request_path (string): Endpoint e.g. /ping. Includes URI params
+        body (Dict[string, any]): Dictionary of body parameters
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        request = self._prepare('POST', request_path, body, headers)
+        return await self._send(request, deadline=deadline)
+
+    async def _send(self, request, deadline=None):
+        r"""Send a prepared request.
+        Arguments:
+        --
+        request (PreparedRequest): Signed request
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        response = await self.transport.request(request.uri,
+                                                request.method,
+                                                request.headers,
+                                                data=request.data,
+                                                deadline=deadline,
+                                                json_codec=self.json_codec,
+                                                )
+        self._notify(request, response)
+        return response
+
+    @instrumented
+    async def create_limit_orders(self,
+                                  underlying,
+                                  orders,
+                                  max_workers=constants.DEFAULT_MAX_WORKERS,
+                                  ):
+        r"""Create many limit orders, pipelining signing with sending.
+        See `PrivateClient.create_limit_orders`.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        orders (Iterable[Dict[string, any]]): Keyword arguments of
+            `create_limit_order`
+        max_workers (integer): Maximum number of requests in flight
+        """
+        legs = [self._limit_order(underlying, **order) for order in orders]
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        semaphore = asyncio.Semaphore(max_workers)
+
+        async def send(request):
+            async with semaphore:
+                return await self._send(request)
+
+        tasks = []
+        for request in self._prepare_many('POST', legs):
+            tasks.append(asyncio.ensure_future(send(request)))
+            # Let the request start before signing the next order
+            await asyncio.sleep(0)
+        results = await asyncio.gather(*tasks, return_exceptions=True)
+        return [BatchResult(error=result) if isinstance(result, BaseException)
+                else BatchResult(response=result)
+                for result in results]
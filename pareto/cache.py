@@ -0,0 +1,139 @@
+import time
+import threading
+from collections import OrderedDict
+
+# Seconds to keep a response, keyed by endpoint path prefix
+DEFAULT_TTLS = {
+    '/public/expiry/': 60.0,
+    '/public/price/strikes/': 60.0,
+    '/public/price/mark/': 1.0,
+}
+DEFAULT_MAX_SIZE = 1024
+
+EXPIRY_PREFIX = '/public/expiry/'
+
+
+def parse_expiry(data):
+    r"""Extract the expiry unix timestamp (seconds) from a `get_expiry` response.
+    Returns None if the payload is not understood.
+    Arguments:
+    --
+    data (any): Decoded response data
+    """
+    if isinstance(data, dict):
+        data = data.get('expiry')
+    if isinstance(data, bool) or not isinstance(data, (int, float)):
+        return None
+    # Treat millisecond timestamps the same as second timestamps
+    if data > 1e12:
+        data = data / 1000.
+    return data
+
+
+class ResponseCache:
+    r"""Opt-in bounded LRU cache for public GET responses.
+    Only endpoints with a configured TTL are cached. Entries never outlive the
+    active expiry returned by `get_expiry`, and the whole cache is cleared
+    whenever that expiry changes, so nothing is served across a rollover.
+    Arguments:
+    --
+    ttls (Optional[Dict[string, float]], default=DEFAULT_TTLS): Seconds to keep
+        a response, keyed by endpoint path prefix e.g. /public/price/mark/
+    max_size (integer, default=1024): Maximum number of cached responses
+    clock (Callable[[], float], default=time.time): Current unix time in
+        seconds, comparable with expiry timestamps
+    """
+    def __init__(self, ttls=None, max_size=DEFAULT_MAX_SIZE, clock=time.time):
+        self.ttls = dict(DEFAULT_TTLS if ttls is None else ttls)
+        self.max_size = max_size
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._entries = OrderedDict()
+        self._expiry = None
+        self._lock = threading.Lock()
+
+    def ttl(self, request_path):
+        r"""TTL in seconds for an endpoint, or None if it is not cacheable.
+        Arguments:
+        --
+        request_path (string): Endpoint e.g. /public/price/mark/0
+        """
+        match = None
+        for prefix in self.ttls:
+            if request_path.startswith(prefix):
+                if match is None or len(prefix) > len(match):
+                    match = prefix
+        return None if match is None else self.ttls[match]
+
+    def get(self, request_path, uri):
+        r"""Return a cached response or None. Counts a hit or miss for
+        cacheable endpoints.
+        Arguments:
+        --
+        request_path (string): Endpoint e.g. /public/price/mark/0
+        uri (string): Full URI including query parameters
+        """
+        if self.ttl(request_path) is None:
+            return None
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(uri)
+            if entry is not None:
+                expires, response = entry
+                if expires > now:
+                    self._entries.move_to_end(uri)
+                    self.hits += 1
+                    return response
+                del self._entries[uri]
+            self.misses += 1
+        return None
+
+    def put(self, request_path, uri, response):
+        r"""Store a fresh response if its endpoint is cacheable.
+        Arguments:
+        --
+        request_path (string): Endpoint e.g. /public/price/mark/0
+        uri (string): Full URI including query parameters
+        response (Response): Response to cache
+        """
+        ttl = self.ttl(request_path)
+        if request_path.startswith(EXPIRY_PREFIX):
+            self._observe_expiry(parse_expiry(response.data))
+        if ttl is None:
+            return
+        now = self.clock()
+        expires = now + ttl
+        with self._lock:
+            if self._expiry is not None and self._expiry > now:
+                expires = min(expires, self._expiry)
+            self._entries[uri] = (expires, response)
+            self._entries.move_to_end(uri)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def _observe_expiry(self, expiry):
+        r"""Clear every entry when the active expiry rolls over."""
+        if expiry is None:
+            return
+        with self._lock:
+            if self._expiry is not None and expiry != self._expiry:
+                self._entries.clear()
+                self.invalidations += 1
+            self._expiry = expiry
+
+    def clear(self):
+        r"""Drop every cached response."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        r"""Counters for monitoring the cache."""
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'invalidations': self.invalidations,
+                'size': len(self._entries),
+            }
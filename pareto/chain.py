@@ -0,0 +1,90 @@
+import time
+from pareto import constants
+
+CHAIN_FIELDS = ('depth', 'greeks', 'sigma')
+
+
+def chain_requests(underlying, fields=CHAIN_FIELDS):
+    r"""Enumerate the endpoint calls needed to snapshot a whole chain.
+    Returns a list of `(field, key, method_name, args)` tuples where `key`
+    identifies the entry inside the snapshot.
+    Arguments:
+    --
+    underlying: see `constants.VALID_UNDERLYING`
+    fields (Iterable[string]): Subset of `CHAIN_FIELDS`
+    """
+    assert underlying in constants.VALID_UNDERLYING
+    for field in fields:
+        assert field in CHAIN_FIELDS, f'unknown chain field {field}'
+
+    requests = []
+    for strike in constants.VALID_STRIKE:
+        for order_type in constants.VALID_ORDER_TYPE:
+            if 'depth' in fields:
+                requests.append(('depth',
+                                 (strike, order_type),
+                                 'get_depth',
+                                 (underlying, strike, order_type),
+                                 ))
+            if 'greeks' in fields:
+                requests.append(('greeks',
+                                 (strike, order_type),
+                                 'get_greeks',
+                                 (underlying, strike, order_type),
+                                 ))
+            if 'sigma' in fields:
+                for order_side in constants.VALID_ORDER_SIDE:
+                    requests.append(('sigma',
+                                     (strike, order_type, order_side),
+                                     'get_sigma',
+                                     (underlying, strike, order_type, order_side),
+                                     ))
+    return requests
+
+
+class ChainSnapshot:
+    r"""Point-in-time view of a whole option chain.
+    Depth and greeks are keyed by `(strike, order_type)`, sigma by
+    `(strike, order_type, order_side)`. Values are the `data` of each response.
+    Arguments:
+    --
+    underlying: see `constants.VALID_UNDERLYING`
+    started (float): Unix time at which the first request was sent
+    timestamp (float): Unix time at which the last response was received
+    """
+    def __init__(self, underlying, started, timestamp):
+        self.underlying = underlying
+        self.started = started
+        self.timestamp = timestamp
+        self.depth = {}
+        self.greeks = {}
+        self.sigma = {}
+
+    @classmethod
+    def from_results(cls, underlying, started, requests, results):
+        r"""Assemble a snapshot from `chain_requests` and their responses.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        started (float): Unix time at which the first request was sent
+        requests (List[tuple]): Output of `chain_requests`
+        results (List[Response]): Responses in the same order as `requests`
+        """
+        snapshot = cls(underlying, started, time.time())
+        for (field, key, _, _), response in zip(requests, results):
+            getattr(snapshot, field)[key] = response.data
+        return snapshot
+
+    @property
+    def latency(self):
+        r"""Wall-clock seconds taken to fetch the snapshot."""
+        return self.timestamp - self.started
+
+    def __repr__(self):
+        return 'ChainSnapshot(underlying={}, timestamp={}, depth={}, greeks={}, sigma={})'.format(
+            self.underlying,
+            self.timestamp,
+            len(self.depth),
+            len(self.greeks),
+            len(self.sigma),
+        )
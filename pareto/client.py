@@ -1,6 +1,18 @@
+import time
+from contextvars import copy_context
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
 from pareto.signer import Signer
 from pareto import constants
-from pareto.utils import get_query_path, create_session, make_request
+from pareto.chain import CHAIN_FIELDS, ChainSnapshot, chain_requests
+from pareto.instrumentation import current_trace, instrumented
+from pareto.subscriptions import PollScheduler
+from pareto.transport import Transport
+from pareto.utils import (get_query_path,
+                          BatchResult,
+                          PreparedRequest,
+                          DEFAULT_JSON_CODEC,
+                          )
 
 
 class Client:
@@ -9,21 +21,76 @@ class Client:
     --
     host (string): Host for the endpoint
     eth_private_key (Optional[string], default: None): Private key for ETH
-    timeout (integer): Number of ms to wait prior to timeout
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    cache (Optional[ResponseCache], default: None): Cache for public responses
+    hedger (Optional[Hedger], default: None): Hedging policy for public GETs
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    scheduler (Optional[RequestScheduler], default: None): Rate limits and
+        prioritizes requests. Ignored if `transport` is given
+    recorder (Optional[Recorder], default: None): Records all traffic to a
+        capture file. Ignored if `transport` is given
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Encoder and decoder
+        for request and response bodies
+    transport (Optional[Transport], default: None): Shared HTTP transport. If
+        None, one is created from `timeout` and `pool_size`
+    pool_size (integer): Maximum number of connections kept open
+    connect_timeout (integer): Number of ms to wait to establish a connection
     """
 
-    def __init__(self, host, eth_private_key=None, timeout=constants.DEFAULT_API_TIMEOUT):
+    def __init__(self,
+                 host,
+                 eth_private_key=None,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 cache=None,
+                 hedger=None,
+                 singleflight=None,
+                 instrumentation=None,
+                 scheduler=None,
+                 recorder=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 transport=None,
+                 pool_size=constants.DEFAULT_POOL_SIZE,
+                 connect_timeout=constants.DEFAULT_CONNECT_TIMEOUT,
+                 ):
         if host.endswith('/'):
             host = host[:-1]
 
-        # Create public and private versions
-        self._public = PublicClient(host, timeout=timeout)
+        if transport is None:
+            transport = Transport(pool_size=pool_size,
+                                  connect_timeout=connect_timeout,
+                                  read_timeout=timeout,
+                                  json_codec=json_codec,
+                                  scheduler=scheduler,
+                                  recorder=recorder,
+                                  )
+        self.transport = transport
+
+        # Create public and private versions, sharing one connection pool
+        self._public = PublicClient(host,
+                                    timeout=timeout,
+                                    cache=cache,
+                                    hedger=hedger,
+                                    singleflight=singleflight,
+                                    instrumentation=instrumentation,
+                                    json_codec=json_codec,
+                                    transport=transport,
+                                    )
         self._private = None
 
         if eth_private_key is not None:
             signer = Signer(eth_private_key)
             # Open private only if the key is provided
-            self._private = PrivateClient(host, signer, timeout=timeout)
+            self._private = PrivateClient(host,
+                                          signer,
+                                          timeout=timeout,
+                                          singleflight=singleflight,
+                                          instrumentation=instrumentation,
+                                          json_codec=json_codec,
+                                          transport=transport,
+                                          )
 
     @property
     def public(self):
@@ -38,39 +105,93 @@ class Client:
                             'since private key was not specified')
         return self._private
 
+    def deadline(self, budget):
+        r"""Context manager bounding every request made inside the block, on
+        this thread, by a shared budget.
+        Arguments:
+        --
+        budget (integer): Number of ms available for all requests in the block
+        """
+        return self.transport.deadline(budget)
+
 
 class PublicClient:
     r"""Public client for interacting with the Pareto public API.
     Arguments:
     --
     host (string): Host URL path
-    timeout (integer): Number of ms to wait prior to timeout
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    cache (Optional[ResponseCache], default: None): Cache for responses
+    hedger (Optional[Hedger], default: None): Hedging policy for GETs
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight, keyed by URI
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Decoder for responses
+    transport (Optional[Transport], default: None): Shared HTTP transport
     """
-    def __init__(self, host, timeout=constants.DEFAULT_API_TIMEOUT):
+    def __init__(self,
+                 host,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 cache=None,
+                 hedger=None,
+                 singleflight=None,
+                 instrumentation=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 transport=None,
+                 ):
         self.host = host
         self.timeout = timeout
-        self.session = create_session()
-
-    def _get(self, request_path, headers=None, params={}):
+        self.cache = cache
+        self.hedger = hedger
+        self.singleflight = singleflight
+        self.instrumentation = instrumentation
+        self.json_codec = json_codec
+        if transport is None:
+            transport = Transport(read_timeout=timeout, json_codec=json_codec)
+        self.transport = transport
+        self.session = transport.session
+        self._poller = None
+
+    def _get(self, request_path, headers=None, params={}, deadline=None):
         r"""General GET request
         Arguments:
         --
         request_path (string): endpoint e.g. /ping. Includes URI params
         params (Dict[string, any]): Map of query parameters
+        deadline (Optional[integer]): Number of ms available for this call
         """
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
         uri = get_query_path(f'{self.host}{request_path}', params)
-        return make_request(self.session,
-                            uri,
-                            'GET',
-                            headers=headers,
-                            timeout=self.timeout,
-                            )
-
+        if self.cache is not None:
+            response = self.cache.get(request_path, uri)
+            if response is not None:
+                return response
+        send = partial(self.transport.request,
+                       uri,
+                       'GET',
+                       headers=headers,
+                       deadline=deadline,
+                       json_codec=self.json_codec,
+                       )
+        if self.hedger is not None:
+            send = partial(self.hedger.run, send)
+        if self.singleflight is not None:
+            send = partial(self.singleflight.do, uri, send)
+        response = send()
+        if self.cache is not None:
+            self.cache.put(request_path, uri, response)
+        return response
+
+    @instrumented
     def ping(self):
         r"""Endpoint to ping server to check communication."""
         uri = '/ping'
         return self._get(uri)
 
+    @instrumented
     def get_depth(self, underlying, strike, order_type):
         r"""Endpoint to get the depth of the order book.
         Arguments:
@@ -89,6 +210,7 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_expiry(self, underlying):
         r"""Endpoint to get the active expiry of the order book.
         Arguments:
@@ -99,6 +221,7 @@ class PublicClient:
         uri = f'/public/expiry/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_sigma(self, underlying, strike, order_type, order_side):
         r"""Endpoint to look up an implied volatility.
         Arguments:
@@ -120,6 +243,7 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_price(self,
                   underlying,
                   strike,
@@ -151,6 +275,7 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_strikes(self, underlying):
         r"""Endpoint to get market price of a potential order.
         Arguments:
@@ -161,6 +286,7 @@ class PublicClient:
         uri = f'/public/price/strikes/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_mark(self, underlying):
         r"""Endpoint to get Black-Scholes mark price of active call and put strikes.
         Arguments:
@@ -171,6 +297,7 @@ class PublicClient:
         uri = f'/public/price/mark/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_greeks(self, underlying, strike, order_type):
         r"""Endpoint to get greeks of a specified option.
         Arguments:
@@ -189,6 +316,7 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_breakeven(self,
                       underlying,
                       strike,
@@ -215,6 +343,7 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_initial_margin_new_order(self,
                                      underlying,
                                      strike,
@@ -246,6 +375,90 @@ class PublicClient:
         }
         return self._get(uri, params=params)
 
+    def get_chain_snapshot(self,
+                           underlying,
+                           fields=CHAIN_FIELDS,
+                           max_workers=constants.DEFAULT_MAX_WORKERS,
+                           ):
+        r"""Fetch depth, greeks and sigma for every strike and type concurrently.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        fields (Iterable[string]): Subset of `chain.CHAIN_FIELDS` to fetch
+        max_workers (integer): Maximum number of requests in flight
+        """
+        requests = chain_requests(underlying, fields)
+        started = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(getattr(self, method), *args)
+                       for _, _, method, args in requests]
+            results = [future.result() for future in futures]
+        return ChainSnapshot.from_results(underlying, started, requests, results)
+
+    def subscribe_depth(self,
+                        underlying,
+                        strike,
+                        order_type,
+                        min_interval=constants.DEFAULT_MIN_POLL_INTERVAL,
+                        max_interval=constants.DEFAULT_MAX_POLL_INTERVAL,
+                        max_pending=1,
+                        ):
+        r"""Subscribe to changes of the order book depth. Returns an iterator
+        of `get_depth` responses, yielding only when the payload changed.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        min_interval (integer): Fastest polling interval in ms
+        max_interval (integer): Slowest polling interval in ms, reached while
+            the depth does not change
+        max_pending (integer, default=1): Updates kept for a slow consumer
+        """
+        assert underlying in constants.VALID_UNDERLYING
+        assert strike in constants.VALID_STRIKE
+        assert order_type in constants.VALID_ORDER_TYPE
+        return self.poller.subscribe(('depth', underlying, strike, order_type),
+                                     partial(self.get_depth, underlying, strike, order_type),
+                                     min_interval=min_interval,
+                                     max_interval=max_interval,
+                                     max_pending=max_pending,
+                                     )
+
+    def subscribe_mark(self,
+                       underlying,
+                       min_interval=constants.DEFAULT_MIN_POLL_INTERVAL,
+                       max_interval=constants.DEFAULT_MAX_POLL_INTERVAL,
+                       max_pending=1,
+                       ):
+        r"""Subscribe to changes of the mark prices. Returns an iterator of
+        `get_mark` responses, yielding only when the payload changed.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        min_interval (integer): Fastest polling interval in ms
+        max_interval (integer): Slowest polling interval in ms
+        max_pending (integer, default=1): Updates kept for a slow consumer
+        """
+        assert underlying in constants.VALID_UNDERLYING
+        return self.poller.subscribe(('mark', underlying),
+                                     partial(self.get_mark, underlying),
+                                     min_interval=min_interval,
+                                     max_interval=max_interval,
+                                     max_pending=max_pending,
+                                     )
+
+    @property
+    def poller(self):
+        r"""Scheduler shared by every subscription of this client, created on
+        first use."""
+        if self._poller is None:
+            self._poller = self._new_poller()
+        return self._poller
+
+    def _new_poller(self):
+        return PollScheduler()
+
 
 class PrivateClient:
     r"""Private client for interacting with the Pareto private API.
@@ -253,59 +466,156 @@ class PrivateClient:
     --
     host (string): Host URL path
     signer (Signer): Class to sign transactions for authentication
-    timeout (integer): Number of ms to wait prior to timeout
+    timeout (integer): Number of ms to wait for a response (read timeout)
+    singleflight (Optional[SingleFlight], default: None): Coalesces identical
+        GETs in flight, keyed by signer address and URI
+    instrumentation (Optional[Instrumentation], default: None): Collects
+        latency histograms and request counters
+    json_codec (JSONCodec, default: DEFAULT_JSON_CODEC): Encoder and decoder
+        for request and response bodies
+    transport (Optional[Transport], default: None): Shared HTTP transport
     """
-    def __init__(self, host, signer, timeout=constants.DEFAULT_API_TIMEOUT):
+    def __init__(self,
+                 host,
+                 signer,
+                 timeout=constants.DEFAULT_API_TIMEOUT,
+                 singleflight=None,
+                 instrumentation=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 transport=None,
+                 ):
         self.host = host
         self.signer = signer
         self.timeout = timeout
-        self.session = create_session()
-
-    def _get(self, request_path, headers=None, params={}):
+        self.singleflight = singleflight
+        self.instrumentation = instrumentation
+        self.json_codec = json_codec
+        if transport is None:
+            transport = Transport(read_timeout=timeout, json_codec=json_codec)
+        self.transport = transport
+        self.session = transport.session
+        self.listeners = []
+
+    def _get(self, request_path, headers=None, params={}, deadline=None):
         r"""General GET request
         Arguments:
         --
         request_path (string): Endpoint e.g. /ping. Includes URI params
         params (Dict[string, any]): Dictionary of query parameters
+        deadline (Optional[integer]): Number of ms available for this call
         """
-        uri = get_query_path(f'{self.host}{request_path}', params)
-        if headers is None:
-            headers = {}
-        headers = self.signer.add_headers('GET',
-                                          get_query_path(request_path, params),
-                                          {},
-                                          headers,
-                                          )
-        return make_request(self.session,
-                            uri,
-                            'GET',
-                            headers=headers,
-                            timeout=self.timeout,
-                            )
-
-    def _post(self, request_path, headers=None, body={}):
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        request_path = get_query_path(request_path, params)
+
+        def send():
+            request = self._prepare('GET', request_path, {}, headers)
+            return self._send(request, deadline=deadline)
+
+        if self.singleflight is None:
+            return send()
+        # Only coalesce requests signed by the same key
+        key = (self.signer.address, f'{self.host}{request_path}')
+        return self.singleflight.do(key, send)
+
+    def _post(self, request_path, headers=None, body={}, deadline=None):
         r"""General POST request
         Arguments:
         --
         request_path (string): Endpoint e.g. /ping. Includes URI params
         body (Dict[string, any]): Dictionary of body parameters
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        request = self._prepare('POST', request_path, body, headers)
+        return self._send(request, deadline=deadline)
+
+    def _prepare(self, method, request_path, body={}, headers=None):
+        r"""Encode the body once, and sign those exact bytes.
+        Arguments:
+        --
+        method (string): GET or POST
+        request_path (string): Endpoint e.g. /ping. Includes query string
+        body (Dict[string, any]): Dictionary of body parameters
+        headers (Optional[Dict[string, any]]): Headers to extend
+        """
+        body_text = self.json_codec.encode(body)
+        trace = current_trace()
+        if trace is None:
+            headers = self.signer.add_encoded_headers(method, request_path, body_text, headers)
+        else:
+            start = time.perf_counter()
+            headers = self.signer.add_encoded_headers(method, request_path, body_text, headers)
+            trace.observe('sign', time.perf_counter() - start)
+        return PreparedRequest(method,
+                               f'{self.host}{request_path}',
+                               headers,
+                               body_text.encode('utf-8'),
+                               body,
+                               )
+
+    def _prepare_many(self, method, requests):
+        r"""Lazily prepare many requests, signing through `Signer.iter_headers`.
+        Arguments:
+        --
+        method (string): GET or POST
+        requests (Iterable[tuple]): `(request_path, body)` tuples
         """
-        uri = f'{self.host}{request_path}'
-        if headers is None:
-            headers = {}
-        headers = self.signer.add_headers('POST',
-                                          request_path, 
-                                          body,
-                                          headers,
+        requests = [(path, body, self.json_codec.encode(body)) for path, body in requests]
+        headers = self.signer.iter_headers((method, path, body_text, {})
+                                           for path, _, body_text in requests)
+        trace = current_trace()
+        start = time.perf_counter()
+        for (path, body, body_text), header in zip(requests, headers):
+            if trace is not None:
+                # Time spent producing this header, excluding the caller
+                trace.observe('sign', time.perf_counter() - start)
+            yield PreparedRequest(method,
+                                  f'{self.host}{path}',
+                                  header,
+                                  body_text.encode('utf-8'),
+                                  body,
+                                  )
+            start = time.perf_counter()
+
+    def _send(self, request, deadline=None):
+        r"""Send a prepared request.
+        Arguments:
+        --
+        request (PreparedRequest): Signed request
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        response = self.transport.request(request.uri,
+                                          request.method,
+                                          request.headers,
+                                          data=request.data,
+                                          deadline=deadline,
+                                          json_codec=self.json_codec,
                                           )
-        return make_request(self.session,
-                            uri,
-                            'POST',
-                            headers,
-                            body,
-                            timeout=self.timeout,
-                            )
+        self._notify(request, response)
+        return response
+
+    def add_listener(self, callback):
+        r"""Register `callback(request, response)`, called after every
+        successful POST, e.g. to track orders.
+        Arguments:
+        --
+        callback (Callable[[PreparedRequest, Response], None]): Function to call
+        """
+        self.listeners.append(callback)
+
+    def remove_listener(self, callback):
+        self.listeners = [c for c in self.listeners if c is not callback]
 
+    def _notify(self, request, response):
+        if request.method == 'POST':
+            for callback in self.listeners:
+                callback(request, response)
+
+    @instrumented
     def get_order_by_id(self, underlying, id):
         r"""Endpoint to get order by id.
         Arguments:
@@ -317,6 +627,7 @@ class PrivateClient:
         uri = f'/user/order/{underlying}/{id}'
         return self._get(uri)
 
+    @instrumented
     def get_orders(self, underlying):
         r"""Endpoint to get unmatched (open) orders owned by caller.
         Does not return any matched or expired orders.
@@ -328,6 +639,7 @@ class PrivateClient:
         uri = f'/user/orders/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_positions(self, underlying):
         r"""Endpoint to get positions owned by caller.
         Does not return any open (unmatched) orders.
@@ -339,6 +651,7 @@ class PrivateClient:
         uri = f'/user/positions/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_open_interest(self,
                           underlying,
                           strike,
@@ -365,6 +678,7 @@ class PrivateClient:
         }
         return self._get(uri, params=params)
 
+    @instrumented
     def get_available_balance(self, underlying):
         r"""Endpoint to get available balance in caller's margin account.
         Arguments:
@@ -375,6 +689,7 @@ class PrivateClient:
         uri = f'/user/availbalance/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def get_account_info(self, underlying):
         r"""Endpoint to get information on caller's margin account.
         Arguments:
@@ -385,6 +700,7 @@ class PrivateClient:
         uri = f'/user/accountinfo/{underlying}'
         return self._get(uri)
 
+    @instrumented
     def create_market_order(self,
                             underlying,
                             strike,
@@ -416,6 +732,7 @@ class PrivateClient:
         }
         return self._post(uri, body=body)
 
+    @instrumented
     def create_limit_order(self,
                            underlying,
                            strike,
@@ -434,6 +751,52 @@ class PrivateClient:
         order_type: see `constants.VALID_ORDER_TYPE`
         order_side: see `constants.VALID_ORDER_SIDE`
         """
+        uri, body = self._limit_order(underlying,
+                                      strike,
+                                      quantity,
+                                      price,
+                                      order_type,
+                                      order_side,
+                                      )
+        return self._post(uri, body=body)
+
+    @instrumented
+    def create_limit_orders(self,
+                            underlying,
+                            orders,
+                            max_workers=constants.DEFAULT_MAX_WORKERS,
+                            ):
+        r"""Create many limit orders, pipelining signing with sending.
+        Every order is validated before anything is sent. Each order is signed
+        while earlier ones are in flight (or all at once if the signer has a
+        pool attached). Returns one `BatchResult` per order, in input order.
+        Arguments:
+        --
+        underlying: see `constants.VALID_UNDERLYING`
+        orders (Iterable[Dict[string, any]]): Keyword arguments of
+            `create_limit_order` i.e. strike, quantity, price, order_type
+            and order_side
+        max_workers (integer): Maximum number of requests in flight
+        """
+        legs = [self._limit_order(underlying, **order) for order in orders]
+        trace = current_trace()
+        if trace is not None:
+            trace.validated()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            # Each leg is sent in a copy of this context, so it shares the trace
+            futures = [executor.submit(copy_context().run, self._send, request)
+                       for request in self._prepare_many('POST', legs)]
+            return [BatchResult.from_future(future) for future in futures]
+
+    def _limit_order(self,
+                     underlying,
+                     strike,
+                     quantity,
+                     price,
+                     order_type,
+                     order_side,
+                     ):
+        r"""Validate a limit order and build its endpoint and body."""
         assert underlying in constants.VALID_UNDERLYING
         assert strike in constants.VALID_STRIKE
         assert order_type in constants.VALID_ORDER_TYPE
@@ -450,8 +813,9 @@ class PrivateClient:
             'isCall': order_type,
             'isBuy': order_side,
         }
-        return self._post(uri, body=body)
+        return uri, body
 
+    @instrumented
     def cancel_order_by_id(self, underlying, id):
         r"""Endpoint to cancel an existing order.
         Arguments:
@@ -463,6 +827,7 @@ class PrivateClient:
         uri = f'/user/cancel/{underlying}/{id}'
         return self._post(uri)
 
+    @instrumented
     def cancel_batch(self, underlying, ids):
         r"""Endpoint to cancel a batch of orders
         Arguments:
@@ -470,17 +835,28 @@ class PrivateClient:
         underlying: see `constants.VALID_UNDERLYING`
         ids: String identifiers
         """
+        uri, body = self._cancel_batch(underlying, ids)
+        return self._post(uri, body=body)
+
+    def _cancel_batch(self, underlying, ids):
+        r"""Validate a batch cancel and build its endpoint and body."""
         assert underlying in constants.VALID_UNDERLYING
         uri = f'/user/cancel/batch/{underlying}'
         body = {'ids': ids}
-        return self._post(uri, body=body)
+        return uri, body
 
+    @instrumented
     def cancel_all(self, underlying):
         r"""Endpoint to cancel all open orders
         Arguments:
         --
         underlying: see `constants.VALID_UNDERLYING`
         """
+        uri, body = self._cancel_all(underlying)
+        return self._post(uri, body=body)
+
+    def _cancel_all(self, underlying):
+        r"""Validate a cancel of all orders and build its endpoint and body."""
         assert underlying in constants.VALID_UNDERLYING
         uri = f'/user/cancel/all/{underlying}'
-        return self._post(uri)
+        return uri, {}
@@ -2,7 +2,18 @@
 API_HOST_LOCAL = 'localhost:8080'
 
 # ---- API Defaults ----
+# Timeouts are in milliseconds
 DEFAULT_API_TIMEOUT = 3000
+DEFAULT_CONNECT_TIMEOUT = 1000
+DEFAULT_POOL_SIZE = 100
+DEFAULT_MAX_WORKERS = 10
+# Number of per-host connection pools kept by a transport
+DEFAULT_HOST_POOLS = 10
+# Bounds of the adaptive polling interval of subscriptions
+DEFAULT_MIN_POLL_INTERVAL = 50
+DEFAULT_MAX_POLL_INTERVAL = 1000
+# Age after which pre-signed requests are signed again
+DEFAULT_SIGNATURE_MAX_AGE = 5000
 
 # ---- Internal checks ---
 
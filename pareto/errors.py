@@ -33,3 +33,21 @@ class TransactionReverted(ParetoError):
     """
     def __init__(self, tx_receipt):
         self.tx_receipt = tx_receipt
+
+
+class ParetoTimeoutError(ParetoError):
+    r"""Request did not complete within its timeout or deadline budget.
+    Arguments:
+    --
+    uri (string): Full URI endpoint
+    msg (string): Description of the timeout
+    """
+    def __init__(self, uri, msg):
+        self.uri = uri
+        self.msg = msg
+
+    def __str__(self):
+        return self.__repr__()
+
+    def __repr__(self):
+        return 'ParetoTimeoutError(uri={}, msg={})'.format(self.uri, self.msg)
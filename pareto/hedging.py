@@ -0,0 +1,156 @@
+import math
+import time
+import asyncio
+import threading
+from collections import deque
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pareto import constants
+
+
+class Hedger:
+    r"""Hedged requests for idempotent GETs.
+    The first attempt is sent immediately. If it has not answered once the
+    configured percentile of recent latencies has elapsed, a duplicate is sent
+    on another pooled connection; whichever succeeds first is returned and the
+    other is cancelled (or, for a blocking request already on the wire, its
+    result is discarded). Only use with public GETs, never with POSTs.
+    Arguments:
+    --
+    percentile (float, default=95): Latency percentile after which to hedge
+    window (integer, default=256): Number of recent latencies tracked
+    initial_delay (integer, default=50): Number of ms to wait before hedging
+        until `min_samples` latencies have been observed
+    min_delay (integer, default=1): Lower bound in ms on the hedge delay
+    min_samples (integer, default=20): Latencies needed before using the percentile
+    max_workers (integer): Threads available to blocking requests
+    """
+    def __init__(self,
+                 percentile=95,
+                 window=256,
+                 initial_delay=50,
+                 min_delay=1,
+                 min_samples=20,
+                 max_workers=constants.DEFAULT_POOL_SIZE,
+                 ):
+        assert 0 < percentile < 100
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.requests = 0
+        self.fired = 0
+        self.won = 0
+        self.failed = 0
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._max_workers = max_workers
+
+    def delay(self):
+        r"""Seconds to wait for the first attempt before hedging."""
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if len(latencies) < self.min_samples:
+            delay = self.initial_delay / 1000.
+        else:
+            index = math.ceil(self.percentile / 100. * len(latencies)) - 1
+            delay = latencies[index]
+        return max(delay, self.min_delay / 1000.)
+
+    def _record(self, latency, fired=False, won=False, failed=False):
+        r"""Count a request and keep its latency, whether it succeeded or not,
+        so the hedge delay follows every outcome."""
+        with self._lock:
+            self._latencies.append(latency)
+            self.requests += 1
+            self.fired += fired
+            self.won += won
+            self.failed += failed
+
+    def _submit(self, fn):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(self._max_workers)
+        # Each attempt runs in a copy of the caller's context, e.g. its deadline
+        return self._executor.submit(copy_context().run, fn)
+
+    def run(self, fn):
+        r"""Call a blocking request function with hedging.
+        Arguments:
+        --
+        fn (Callable[[], Response]): Sends the request
+        """
+        start = time.monotonic()
+        primary = self._submit(fn)
+        done, _ = wait([primary], timeout=self.delay())
+        if done:
+            failed = primary.exception() is not None
+            self._record(time.monotonic() - start, failed=failed)
+            return primary.result()
+
+        backup = self._submit(fn)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self._record(time.monotonic() - start, fired=True, won=future is backup)
+                    return future.result()
+                if error is None or future is primary:
+                    error = future.exception()
+        self._record(time.monotonic() - start, fired=True, failed=True)
+        raise error
+
+    async def run_async(self, fn):
+        r"""Await a request coroutine with hedging.
+        Arguments:
+        --
+        fn (Callable[[], Awaitable[Response]]): Creates the request coroutine
+        """
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn())
+        tasks = [primary]
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=self.delay())
+            if done:
+                failed = primary.cancelled() or primary.exception() is not None
+                self._record(time.monotonic() - start, failed=failed)
+                return primary.result()
+
+            backup = asyncio.ensure_future(fn())
+            tasks.append(backup)
+            pending = {primary, backup}
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._record(time.monotonic() - start, fired=True, won=task is backup)
+                        return task.result()
+                    if error is None or task is primary:
+                        error = task.exception()
+            self._record(time.monotonic() - start, fired=True, failed=True)
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    def stats(self):
+        r"""Counters for monitoring hedging."""
+        with self._lock:
+            return {
+                'requests': self.requests,
+                'hedges_fired': self.fired,
+                'hedges_won': self.won,
+                'failed': self.failed,
+            }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
@@ -0,0 +1,254 @@
+import asyncio
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+from pareto.errors import ParetoTimeoutError
+
+PHASES = ('validate', 'sign', 'network', 'decode', 'total')
+
+# Upper bounds in seconds of the latency histogram buckets
+DEFAULT_BUCKETS = (.0001, .00025, .0005, .001, .0025, .005, .01,
+                   .025, .05, .1, .25, .5, 1., 2.5, 5.)
+
+# Trace of the endpoint call running in the current thread or asyncio task
+_trace = ContextVar('pareto_trace', default=None)
+
+
+def current_trace():
+    r"""Trace of the instrumented call in progress, or None."""
+    return _trace.get()
+
+
+class Trace:
+    r"""Timings of one endpoint call, filled in as the request goes through
+    each phase. A phase may be observed several times, e.g. for hedged
+    requests or batches. Phases observed after the call completed, such as
+    decoding a lazy `Response`, go straight to the instrumentation.
+    Arguments:
+    --
+    endpoint (string): Name of the endpoint method
+    instrumentation (Optional[Instrumentation], default=None): Receives the
+        trace once the call completes
+    """
+    __slots__ = ('endpoint', 'instrumentation', 'start', 'samples', 'status',
+                 'finished', '_validated')
+
+    def __init__(self, endpoint, instrumentation=None):
+        self.endpoint = endpoint
+        self.instrumentation = instrumentation
+        self.start = time.perf_counter()
+        self.samples = []
+        self.status = None
+        self.finished = False
+        self._validated = False
+
+    def observe(self, phase, seconds):
+        if self.finished and self.instrumentation is not None:
+            self.instrumentation.observe(self.endpoint, phase, seconds)
+        else:
+            self.samples.append((phase, seconds))
+
+    def validated(self):
+        r"""Mark the end of argument validation, the first time it is reached."""
+        if not self._validated:
+            self._validated = True
+            self.observe('validate', time.perf_counter() - self.start)
+
+
+class Histogram:
+    r"""Cumulative latency histogram.
+    Arguments:
+    --
+    buckets (Sequence[float]): Ascending upper bounds in seconds
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.
+        self.count = 0
+
+    def observe(self, seconds):
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                self.counts[i] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def snapshot(self):
+        return {
+            'buckets': dict(zip(self.buckets, self.counts)),
+            'sum': self.sum,
+            'count': self.count,
+        }
+
+
+def _status(error):
+    if isinstance(error, ParetoTimeoutError):
+        return 'timeout'
+    if isinstance(error, AssertionError):
+        return 'invalid'
+    status = getattr(error, 'status_code', None)
+    return 'error' if status is None else str(status)
+
+
+class Instrumentation:
+    r"""Per-endpoint latency histograms broken down by phase, and request
+    counters by status. Pass to `Client(instrumentation=...)`.
+    Phases are 'validate' (argument checks), 'sign' (request signing),
+    'network' (sending and reading the response), 'decode' (JSON decoding,
+    recorded when `Response.data` is first read) and 'total'. Statuses are
+    the HTTP status code, 'timeout', 'invalid' for rejected arguments,
+    'error' for other failures, or 'local' for responses served from the
+    cache or a coalesced request.
+    Arguments:
+    --
+    buckets (Sequence[float], default=DEFAULT_BUCKETS): Histogram bounds in seconds
+    hooks (Iterable[Callable[[Trace], None]], default=()): Called with the
+        trace of every completed call
+    """
+    def __init__(self, buckets=DEFAULT_BUCKETS, hooks=()):
+        self.buckets = tuple(buckets)
+        self.hooks = list(hooks)
+        self._histograms = {}
+        self._requests = {}
+        self._errors = {}
+        self._lock = threading.Lock()
+
+    def add_hook(self, hook):
+        r"""Register `hook(trace)`, called after every instrumented call."""
+        self.hooks.append(hook)
+
+    def _histogram(self, endpoint, phase):
+        histogram = self._histograms.get((endpoint, phase))
+        if histogram is None:
+            histogram = self._histograms[(endpoint, phase)] = Histogram(self.buckets)
+        return histogram
+
+    def observe(self, endpoint, phase, seconds):
+        r"""Add one phase latency outside of a trace."""
+        with self._lock:
+            self._histogram(endpoint, phase).observe(seconds)
+
+    def record(self, trace):
+        r"""Add a completed trace to the histograms and counters."""
+        status = str(trace.status)
+        key = (trace.endpoint, status)
+        with self._lock:
+            for phase, seconds in trace.samples:
+                self._histogram(trace.endpoint, phase).observe(seconds)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            if not status.startswith('2') and status != 'local':
+                self._errors[key] = self._errors.get(key, 0) + 1
+        for hook in self.hooks:
+            hook(trace)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._requests = {}
+            self._errors = {}
+
+    def snapshot(self):
+        r"""Histograms and counters as a dict, keyed by endpoint."""
+        with self._lock:
+            histograms = {key: h.snapshot() for key, h in self._histograms.items()}
+            requests = dict(self._requests)
+            errors = dict(self._errors)
+        endpoints = {}
+
+        def entry(endpoint):
+            return endpoints.setdefault(endpoint, {'phases': {}, 'requests': {}, 'errors': {}})
+
+        for (endpoint, phase), histogram in histograms.items():
+            entry(endpoint)['phases'][phase] = histogram
+        for name, counters in (('requests', requests), ('errors', errors)):
+            for (endpoint, status), count in counters.items():
+                entry(endpoint)[name][status] = count
+        return endpoints
+
+    def to_prometheus(self, prefix='pareto'):
+        r"""Snapshot in the Prometheus text exposition format.
+        Arguments:
+        --
+        prefix (string, default='pareto'): Prefix of the metric names
+        """
+        snapshot = self.snapshot()
+        lines = [
+            f'# HELP {prefix}_request_phase_seconds Latency of each phase of a request',
+            f'# TYPE {prefix}_request_phase_seconds histogram',
+        ]
+        for endpoint, entry in sorted(snapshot.items()):
+            for phase, histogram in sorted(entry['phases'].items()):
+                labels = f'endpoint="{endpoint}",phase="{phase}"'
+                for bound, count in histogram['buckets'].items():
+                    lines.append(f'{prefix}_request_phase_seconds_bucket'
+                                 f'{{{labels},le="{bound}"}} {count}')
+                lines.append(f'{prefix}_request_phase_seconds_bucket'
+                             f'{{{labels},le="+Inf"}} {histogram["count"]}')
+                lines.append(f'{prefix}_request_phase_seconds_sum'
+                             f'{{{labels}}} {histogram["sum"]}')
+                lines.append(f'{prefix}_request_phase_seconds_count'
+                             f'{{{labels}}} {histogram["count"]}')
+        for name, help_text in (('requests', 'Endpoint calls by status'),
+                                ('errors', 'Failed endpoint calls by status')):
+            lines.append(f'# HELP {prefix}_{name}_total {help_text}')
+            lines.append(f'# TYPE {prefix}_{name}_total counter')
+            for endpoint, entry in sorted(snapshot.items()):
+                for status, count in sorted(entry[name].items()):
+                    lines.append(f'{prefix}_{name}_total'
+                                 f'{{endpoint="{endpoint}",status="{status}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _finish(instrumentation, trace, error=None):
+    trace.observe('total', time.perf_counter() - trace.start)
+    if error is not None:
+        trace.status = _status(error)
+    elif trace.status is None:
+        trace.status = 'local'
+    trace.finished = True
+    instrumentation.record(trace)
+
+
+async def _traced(instrumentation, trace, coroutine):
+    token = _trace.set(trace)
+    try:
+        result = await coroutine
+    except BaseException as error:
+        _finish(instrumentation, trace, error)
+        raise
+    finally:
+        _trace.reset(token)
+    _finish(instrumentation, trace)
+    return result
+
+
+def instrumented(method):
+    r"""Decorate an endpoint method of a client so that its calls are traced
+    when the client has an `instrumentation` set. Costs one attribute lookup
+    otherwise. Works for endpoints returning awaitables too.
+    """
+    endpoint = method.__name__
+
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        instrumentation = self.instrumentation
+        if instrumentation is None:
+            return method(self, *args, **kwargs)
+        trace = Trace(endpoint, instrumentation)
+        token = _trace.set(trace)
+        try:
+            result = method(self, *args, **kwargs)
+        except BaseException as error:
+            _finish(instrumentation, trace, error)
+            raise
+        finally:
+            _trace.reset(token)
+        if asyncio.iscoroutine(result):
+            return _traced(instrumentation, trace, result)
+        _finish(instrumentation, trace)
+        return result
+    return wrapper
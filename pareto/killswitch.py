@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+from pareto import constants
+
+
+class KillSwitch:
+    r"""Keeps a signed `cancel_all` request ready to send, and optionally a
+    `cancel_batch` for tracked order ids. A background thread signs them
+    again before their `pareto-timestamp` gets older than `max_age`, so
+    `fire` only does network I/O. With `keep_warm`, the connection is kept
+    open by pinging at the same interval.
+    Use as `with KillSwitch(client.private, underlying) as switch:` or call
+    `start` and `stop`.
+    Arguments:
+    --
+    client (PrivateClient): Client whose key signs the requests
+    underlying: see `constants.VALID_UNDERLYING`
+    max_age (integer): Number of ms after which requests are signed again
+    keep_warm (boolean, default=True): Ping to keep a pooled connection open.
+        Ignored for async clients
+    """
+    def __init__(self,
+                 client,
+                 underlying,
+                 max_age=constants.DEFAULT_SIGNATURE_MAX_AGE,
+                 keep_warm=True,
+                 ):
+        self.client = client
+        self.underlying = underlying
+        self.max_age = max_age
+        self.keep_warm = keep_warm and not asyncio.iscoroutinefunction(client.transport.request)
+        self._all_request = client._cancel_all(underlying)
+        self._ids = []
+        # Bumped by `track`, so a stale batch is never armed
+        self._generation = 0
+        self._armed = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.arm()
+
+    def _sign(self, uri, body):
+        return self.client._prepare('POST', uri, body)
+
+    def _stale(self, request):
+        r"""Whether a signed request is too old to send. Measured from its
+        `pareto-timestamp`, which is floored to the second, so the age is
+        never underestimated."""
+        age = time.time() - int(request.headers['pareto-timestamp'])
+        return age * 1000. >= self.max_age
+
+    def arm(self):
+        r"""Sign the requests now."""
+        armed = {'all': self._sign(*self._all_request)}
+        with self._lock:
+            ids = list(self._ids)
+            generation = self._generation
+        if ids:
+            armed['batch'] = self._sign(*self.client._cancel_batch(self.underlying, ids))
+        with self._lock:
+            if generation != self._generation:
+                # `track` changed the ids while signing
+                armed.pop('batch', None)
+            self._armed.update(armed)
+
+    def track(self, ids):
+        r"""Set the order ids cancelled by `fire_batch`. They are signed on the
+        background thread.
+        Arguments:
+        --
+        ids (Iterable[string]): Order identifiers
+        """
+        with self._lock:
+            self._ids = list(ids)
+            self._generation += 1
+            self._armed.pop('batch', None)
+        self._wakeup.set()
+
+    def _take(self, name):
+        r"""Armed request, signed again inline if it is stale or missing."""
+        with self._lock:
+            armed = self._armed.pop(name, None)
+        if armed is None or self._stale(armed):
+            if name == 'all':
+                uri, body = self._all_request
+            else:
+                uri, body = self.client._cancel_batch(self.underlying, list(self._ids))
+            armed = self._sign(uri, body)
+        # Never send the same signature twice
+        self._wakeup.set()
+        return armed
+
+    def fire(self, deadline=None):
+        r"""Send the pre-signed `cancel_all`.
+        Arguments:
+        --
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        return self.client._send(self._take('all'), deadline=deadline)
+
+    def fire_batch(self, deadline=None):
+        r"""Send the pre-signed `cancel_batch` for the tracked ids.
+        Arguments:
+        --
+        deadline (Optional[integer]): Number of ms available for this call
+        """
+        assert self._ids, 'no tracked order ids'
+        return self.client._send(self._take('batch'), deadline=deadline)
+
+    def _run(self):
+        # Sign again at half the maximum age, leaving margin for clock skew
+        interval = self.max_age / 2000.
+        while not self._stopped.is_set():
+            self._wakeup.wait(interval)
+            self._wakeup.clear()
+            if self._stopped.is_set():
+                return
+            try:
+                self.arm()
+                if self.keep_warm:
+                    self.client.transport.request(f'{self.client.host}/ping', 'GET')
+            except Exception:
+                # Keep the switch alive, `fire` signs inline if needed
+                pass
+
+    def start(self):
+        if self._thread is None:
+            self._stopped.clear()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
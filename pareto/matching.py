@@ -0,0 +1,260 @@
+r"""Price-time priority matching engine over the option books of one underlying.
+Prices and quantities are kept as integer hundredths, the precision the
+client rounds to, so matching never accumulates float error. Each side of a
+book keeps its price levels in a sorted list with the best price last, and
+each level a FIFO queue of orders. Cancelled orders are only flagged and
+skipped when they reach the front of their queue.
+"""
+import itertools
+import uuid
+from bisect import bisect_left, insort
+from collections import deque
+from pareto import constants
+
+# Prices and quantities are multiples of 0.01
+SCALE = 100
+
+
+def to_units(value):
+    return int(round(float(value) * SCALE))
+
+
+def from_units(units):
+    return units / SCALE
+
+
+class RestingOrder:
+    r"""Order known to the engine.
+    Arguments:
+    --
+    id (string): Order identifier
+    owner (string): Address of the account placing it
+    strike: see `constants.VALID_STRIKE`
+    order_type: see `constants.VALID_ORDER_TYPE`
+    order_side: see `constants.VALID_ORDER_SIDE`
+    price (Optional[integer]): Limit price in hundredths, None for market orders
+    quantity (integer): Quantity in hundredths
+    """
+    __slots__ = ('id', 'owner', 'strike', 'order_type', 'order_side', 'price',
+                 'quantity', 'remaining', 'sequence', 'active')
+
+    def __init__(self, id, owner, strike, order_type, order_side, price, quantity, sequence):
+        self.id = id
+        self.owner = owner
+        self.strike = strike
+        self.order_type = order_type
+        self.order_side = order_side
+        self.price = price
+        self.quantity = quantity
+        self.remaining = quantity
+        self.sequence = sequence
+        self.active = True
+
+    def to_data(self):
+        r"""Payload in the format of the order endpoints."""
+        return {
+            'id': self.id,
+            'strike': self.strike,
+            'quantity': from_units(self.remaining),
+            'price': None if self.price is None else from_units(self.price),
+            'isCall': self.order_type,
+            'isBuy': self.order_side,
+            'filled': from_units(self.quantity - self.remaining),
+        }
+
+
+class Fill:
+    r"""Trade between a resting maker and an incoming taker.
+    Arguments:
+    --
+    maker (RestingOrder): Resting order
+    taker (RestingOrder): Incoming order
+    price (integer): Trade price in hundredths, the maker's price
+    quantity (integer): Traded quantity in hundredths
+    """
+    __slots__ = ('maker', 'taker', 'price', 'quantity')
+
+    def __init__(self, maker, taker, price, quantity):
+        self.maker = maker
+        self.taker = taker
+        self.price = price
+        self.quantity = quantity
+
+
+class _Level:
+    __slots__ = ('orders', 'quantity', 'count')
+
+    def __init__(self):
+        self.orders = deque()
+        self.quantity = 0
+        self.count = 0
+
+
+class BookSide:
+    r"""Price levels of one side of a book. Levels are keyed so that the best
+    price is always last: bid prices as is, ask prices negated.
+    Arguments:
+    --
+    order_side: see `constants.VALID_ORDER_SIDE`
+    """
+    def __init__(self, order_side):
+        self.order_side = order_side
+        self._sign = 1 if order_side == constants.ORDER_SIDE_BUY else -1
+        self.levels = {}
+        self.keys = []
+
+    def __bool__(self):
+        return bool(self.keys)
+
+    def best(self):
+        r"""Best price in hundredths, or None if the side is empty."""
+        return self._sign * self.keys[-1] if self.keys else None
+
+    def add(self, order):
+        level = self.levels.get(order.price)
+        if level is None:
+            level = self.levels[order.price] = _Level()
+            insort(self.keys, self._sign * order.price)
+        level.orders.append(order)
+        level.quantity += order.remaining
+        level.count += 1
+
+    def remove(self, order):
+        r"""Take a cancelled order's quantity off its level."""
+        level = self.levels[order.price]
+        level.quantity -= order.remaining
+        level.count -= 1
+        if not level.count:
+            self._drop(order.price)
+
+    def _drop(self, price):
+        del self.levels[price]
+        key = self._sign * price
+        del self.keys[bisect_left(self.keys, key)]
+
+    def match(self, taker, limit):
+        r"""Fill `taker` against this side from the best price down to `limit`
+        (None for no limit). Returns the fills, in execution order."""
+        fills = []
+        while taker.remaining and self.keys:
+            price = self._sign * self.keys[-1]
+            if limit is not None and self._sign * price < self._sign * limit:
+                break
+            level = self.levels[price]
+            orders = level.orders
+            while taker.remaining and orders:
+                maker = orders[0]
+                if not maker.active:
+                    orders.popleft()
+                    continue
+                quantity = min(maker.remaining, taker.remaining)
+                maker.remaining -= quantity
+                taker.remaining -= quantity
+                level.quantity -= quantity
+                fills.append(Fill(maker, taker, price, quantity))
+                if not maker.remaining:
+                    maker.active = False
+                    orders.popleft()
+                    level.count -= 1
+            if not level.count:
+                self.keys.pop()
+                del self.levels[price]
+        return fills
+
+    def depth(self, levels=None):
+        r"""`(price, quantity)` pairs from the best price, in hundredths."""
+        keys = self.keys if levels is None else self.keys[-levels:]
+        return [(self._sign * key, self.levels[self._sign * key].quantity)
+                for key in reversed(keys)]
+
+
+class Book:
+    r"""Order book of one option.
+    Arguments:
+    --
+    strike: see `constants.VALID_STRIKE`
+    order_type: see `constants.VALID_ORDER_TYPE`
+    """
+    def __init__(self, strike, order_type):
+        self.strike = strike
+        self.order_type = order_type
+        self.bids = BookSide(constants.ORDER_SIDE_BUY)
+        self.asks = BookSide(constants.ORDER_SIDE_SELL)
+
+    def side(self, order_side):
+        return self.bids if order_side == constants.ORDER_SIDE_BUY else self.asks
+
+    def mid(self):
+        r"""Mid price in hundredths, or None unless both sides have orders."""
+        if not (self.bids and self.asks):
+            return None
+        return (self.bids.best() + self.asks.best()) / 2.
+
+
+class MatchingEngine:
+    r"""Books for every strike and option type of one underlying, matched in
+    price-time priority. Not thread safe; callers serialize access.
+    Arguments:
+    --
+    strikes (List[integer], default=constants.VALID_STRIKE): Strikes listed
+    """
+    def __init__(self, strikes=constants.VALID_STRIKE):
+        self.books = {(strike, order_type): Book(strike, order_type)
+                      for strike in strikes
+                      for order_type in constants.VALID_ORDER_TYPE}
+        self.orders = {}
+        self._sequence = itertools.count()
+
+    def book(self, strike, order_type):
+        return self.books[(strike, order_type)]
+
+    def submit(self, owner, strike, order_type, order_side, quantity, price=None):
+        r"""Match an order, resting the remainder of a limit order. A market
+        order's unfilled remainder is dropped. Returns the order and its fills.
+        Arguments:
+        --
+        owner (string): Address of the account placing it
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        order_side: see `constants.VALID_ORDER_SIDE`
+        quantity (integer): Quantity in hundredths
+        price (Optional[integer], default=None): Limit price in hundredths,
+            None for a market order
+        """
+        assert quantity > 0
+        assert price is None or price > 0
+        book = self.book(strike, order_type)
+        order = RestingOrder(str(uuid.uuid4()), owner, strike, order_type, order_side,
+                             price, quantity, next(self._sequence))
+        opposite = book.asks if order_side == constants.ORDER_SIDE_BUY else book.bids
+        fills = opposite.match(order, price)
+        for fill in fills:
+            if not fill.maker.active:
+                self.orders.pop(fill.maker.id, None)
+        if order.remaining and price is not None:
+            book.side(order_side).add(order)
+            self.orders[order.id] = order
+        else:
+            order.active = False
+        return order, fills
+
+    def cancel(self, id, owner=None):
+        r"""Cancel a resting order. Returns it, or None if it is not open or
+        belongs to another owner.
+        Arguments:
+        --
+        id (string): Order identifier
+        owner (Optional[string], default=None): Required owner of the order
+        """
+        order = self.orders.get(id)
+        if order is None or (owner is not None and order.owner != owner):
+            return None
+        del self.orders[id]
+        order.active = False
+        self.book(order.strike, order.order_type).side(order.order_side).remove(order)
+        return order
+
+    def open_orders(self, owner=None):
+        r"""Resting orders in time priority, optionally of one owner."""
+        return [order for order in self.orders.values()
+                if owner is None or order.owner == owner]
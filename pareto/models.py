@@ -0,0 +1,188 @@
+r"""Compact typed views of response payloads.
+Models use `__slots__` and only keep the fields they name, so converting a
+large payload keeps far fewer objects alive than the decoded dicts. Field
+names follow the request parameters, e.g. `isCall` becomes `order_type`.
+"""
+
+
+def _get(data, *names, default=None):
+    for name in names:
+        if name in data:
+            return data[name]
+    return default
+
+
+def _items(data, *names):
+    r"""List payload that is either bare or wrapped in a dict."""
+    if isinstance(data, dict):
+        return _get(data, *names, default=[]) or []
+    return data or []
+
+
+class DepthLevel:
+    r"""One price level of an order book.
+    Arguments:
+    --
+    price (float): Price of the level
+    quantity (float): Total size at the level
+    """
+    __slots__ = ('price', 'quantity')
+
+    def __init__(self, price, quantity):
+        self.price = price
+        self.quantity = quantity
+
+    @classmethod
+    def from_data(cls, level):
+        r"""Parse a `{'price': .., 'quantity': ..}` object or `[price, size]` pair."""
+        if isinstance(level, dict):
+            return cls(float(level['price']), float(_get(level, 'quantity', 'size')))
+        price, quantity = level[:2]
+        return cls(float(price), float(quantity))
+
+    def __iter__(self):
+        yield self.price
+        yield self.quantity
+
+    def __repr__(self):
+        return f'DepthLevel(price={self.price}, quantity={self.quantity})'
+
+
+class Depth:
+    r"""Both sides of a `get_depth` payload, in the order received.
+    Arguments:
+    --
+    bids (List[DepthLevel]): Buy levels
+    asks (List[DepthLevel]): Sell levels
+    """
+    __slots__ = ('bids', 'asks')
+
+    def __init__(self, bids, asks):
+        self.bids = bids
+        self.asks = asks
+
+    @classmethod
+    def from_data(cls, data):
+        if isinstance(data, Depth):
+            return data
+        return cls([DepthLevel.from_data(level) for level in _items(data, 'bids', 'buys')],
+                   [DepthLevel.from_data(level) for level in _items(data, 'asks', 'sells')])
+
+    def to_numpy(self):
+        r"""`(bids, asks)` float arrays of shape (n, 2) with price and quantity
+        columns. Requires numpy.
+        """
+        import numpy as np
+        return tuple(np.array([(level.price, level.quantity) for level in levels],
+                              dtype=float).reshape(-1, 2)
+                     for levels in (self.bids, self.asks))
+
+    def __repr__(self):
+        return f'Depth(bids={self.bids}, asks={self.asks})'
+
+
+class Order:
+    r"""An open or newly created order.
+    Arguments:
+    --
+    id (string): Order identifier
+    strike: see `constants.VALID_STRIKE`
+    quantity (float): Number of units
+    price (float): Limit price
+    order_type: see `constants.VALID_ORDER_TYPE`
+    order_side: see `constants.VALID_ORDER_SIDE`
+    """
+    __slots__ = ('id', 'strike', 'quantity', 'price', 'order_type', 'order_side')
+
+    def __init__(self, id, strike, quantity, price, order_type, order_side):
+        self.id = id
+        self.strike = strike
+        self.quantity = quantity
+        self.price = price
+        self.order_type = order_type
+        self.order_side = order_side
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(_get(data, 'id', 'orderId'),
+                   _get(data, 'strike'),
+                   _get(data, 'quantity', 'size'),
+                   _get(data, 'price'),
+                   _get(data, 'isCall', 'order_type'),
+                   _get(data, 'isBuy', 'order_side'),
+                   )
+
+    @classmethod
+    def many(cls, data):
+        r"""Parse a `get_orders` payload, bare or wrapped in a dict."""
+        return [cls.from_data(order) for order in _items(data, 'orders')]
+
+    def __repr__(self):
+        return (f'Order(id={self.id!r}, strike={self.strike}, quantity={self.quantity}, '
+                f'price={self.price}, order_type={self.order_type}, '
+                f'order_side={self.order_side})')
+
+
+class Position:
+    r"""A position in one option.
+    Arguments:
+    --
+    strike: see `constants.VALID_STRIKE`
+    quantity (float): Number of units
+    price (float): Average entry price
+    order_type: see `constants.VALID_ORDER_TYPE`
+    order_side: see `constants.VALID_ORDER_SIDE`
+    """
+    __slots__ = ('strike', 'quantity', 'price', 'order_type', 'order_side')
+
+    def __init__(self, strike, quantity, price, order_type, order_side):
+        self.strike = strike
+        self.quantity = quantity
+        self.price = price
+        self.order_type = order_type
+        self.order_side = order_side
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(_get(data, 'strike'),
+                   _get(data, 'quantity', 'size'),
+                   _get(data, 'price', 'entryPrice'),
+                   _get(data, 'isCall', 'order_type'),
+                   _get(data, 'isBuy', 'order_side'),
+                   )
+
+    @classmethod
+    def many(cls, data):
+        r"""Parse a `get_positions` payload, bare or wrapped in a dict."""
+        return [cls.from_data(position) for position in _items(data, 'positions')]
+
+    def __repr__(self):
+        return (f'Position(strike={self.strike}, quantity={self.quantity}, '
+                f'price={self.price}, order_type={self.order_type}, '
+                f'order_side={self.order_side})')
+
+
+class Greeks:
+    r"""Greeks of one option, from `get_greeks`. Missing values are None.
+    Arguments:
+    --
+    delta (Optional[float]): Delta
+    gamma (Optional[float]): Gamma
+    vega (Optional[float]): Vega
+    theta (Optional[float]): Theta
+    """
+    __slots__ = ('delta', 'gamma', 'vega', 'theta')
+
+    def __init__(self, delta=None, gamma=None, vega=None, theta=None):
+        self.delta = delta
+        self.gamma = gamma
+        self.vega = vega
+        self.theta = theta
+
+    @classmethod
+    def from_data(cls, data):
+        return cls(*(_get(data, name) for name in cls.__slots__))
+
+    def __repr__(self):
+        return (f'Greeks(delta={self.delta}, gamma={self.gamma}, '
+                f'vega={self.vega}, theta={self.theta})')
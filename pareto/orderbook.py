@@ -0,0 +1,226 @@
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from itertools import accumulate
+from pareto.models import Depth
+
+BID = 'bid'
+ASK = 'ask'
+
+
+def parse_depth(data):
+    r"""Aggregate a `get_depth` payload into `{price: size}` maps.
+    Levels may be `{'price': .., 'quantity': ..}` objects or `[price, size]`
+    pairs. Returns `(bids, asks)`.
+    Arguments:
+    --
+    data (Dict[string, any] or Depth): Decoded response data, or its model
+    """
+    depth = Depth.from_data(data)
+    books = []
+    for levels in (depth.bids, depth.asks):
+        book = {}
+        for level in levels:
+            book[level.price] = book.get(level.price, 0.) + level.quantity
+        books.append(book)
+    return books[0], books[1]
+
+
+class BookSide:
+    r"""Price levels of one side of a book, stored as parallel sorted arrays.
+    Prices are ascending on both sides, so the best bid is the last level and
+    the best ask the first. `cumulative[i]` is the total size from the best
+    level up to and including level `i`.
+    Arguments:
+    --
+    side (string): BID or ASK
+    """
+    __slots__ = ('side', 'prices', 'sizes', 'cumulative')
+
+    def __init__(self, side, prices=None, sizes=None):
+        self.side = side
+        self.prices = prices if prices is not None else array('d')
+        self.sizes = sizes if sizes is not None else array('d')
+        if side == BID:
+            self.cumulative = array('d', accumulate(reversed(self.sizes)))
+            self.cumulative.reverse()
+        else:
+            self.cumulative = array('d', accumulate(self.sizes))
+
+    def __len__(self):
+        return len(self.prices)
+
+    def best(self):
+        r"""Best `(price, size)`, or None if the side is empty."""
+        if not self.prices:
+            return None
+        i = -1 if self.side == BID else 0
+        return self.prices[i], self.sizes[i]
+
+    def levels(self):
+        r"""Map of price to size."""
+        return dict(zip(self.prices, self.sizes))
+
+    def size_to_depth(self, depth):
+        r"""Total size of the best `depth` levels."""
+        n = len(self.prices)
+        depth = min(depth, n)
+        if depth <= 0:
+            return 0.
+        return self.cumulative[n - depth] if self.side == BID else self.cumulative[depth - 1]
+
+    def size_to_price(self, price):
+        r"""Total size at prices at least as good as `price`."""
+        if self.side == BID:
+            i = bisect_left(self.prices, price)
+            return self.cumulative[i] if i < len(self.prices) else 0.
+        i = bisect_right(self.prices, price) - 1
+        return self.cumulative[i] if i >= 0 else 0.
+
+    def apply(self, levels):
+        r"""Return a new side with `levels` applied as a diff, and the changes
+        as `(side, price, old_size, new_size)` tuples.
+        Arguments:
+        --
+        levels (Dict[float, float]): Complete map of price to size
+        """
+        changes = []
+        for price, size in zip(self.prices, self.sizes):
+            new_size = levels.get(price, 0.)
+            if new_size != size:
+                changes.append((self.side, price, size, new_size))
+        existing = set(self.prices)
+        for price, size in levels.items():
+            if price not in existing and size > 0:
+                changes.append((self.side, price, 0., size))
+        if not changes:
+            return self, changes
+
+        prices = array('d', self.prices)
+        sizes = array('d', self.sizes)
+        for _, price, old_size, new_size in changes:
+            i = bisect_left(prices, price)
+            if old_size == 0.:
+                prices.insert(i, price)
+                sizes.insert(i, new_size)
+            elif new_size <= 0.:
+                del prices[i]
+                del sizes[i]
+            else:
+                sizes[i] = new_size
+        return BookSide(self.side, prices, sizes), changes
+
+
+class OrderBook:
+    r"""Mirrored order book for one strike and type. Sides are replaced
+    rather than mutated, so readers never see a partially applied side.
+    """
+    def __init__(self):
+        self.bids = BookSide(BID)
+        self.asks = BookSide(ASK)
+        self.version = 0
+
+    def best_bid(self):
+        r"""Best bid `(price, size)`, or None."""
+        return self.bids.best()
+
+    def best_ask(self):
+        r"""Best ask `(price, size)`, or None."""
+        return self.asks.best()
+
+    def side(self, side):
+        return self.bids if side == BID else self.asks
+
+    def apply(self, data):
+        r"""Apply a `get_depth` payload, returning the changed levels.
+        Arguments:
+        --
+        data (Dict[string, any] or Depth): Decoded response data, or its model
+        """
+        bids, asks = parse_depth(data)
+        new_bids, bid_changes = self.bids.apply(bids)
+        new_asks, ask_changes = self.asks.apply(asks)
+        changes = bid_changes + ask_changes
+        if changes:
+            self.bids, self.asks = new_bids, new_asks
+            self.version += 1
+        return changes
+
+
+class OrderBookMirror:
+    r"""Shared local mirror of order books keyed by (underlying, strike, order_type).
+    Each `get_depth` poll is applied as a diff against the mirrored book and
+    registered callbacks receive only the levels that changed. With an async
+    client, await `get_depth` yourself and pass the data to `update`.
+    Arguments:
+    --
+    client (PublicClient): Client used to poll depth
+    """
+    def __init__(self, client):
+        self.client = client
+        self._books = {}
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    def book(self, underlying, strike, order_type):
+        r"""Mirrored book for a key. Empty until first refreshed."""
+        key = (underlying, strike, order_type)
+        with self._lock:
+            if key not in self._books:
+                self._books[key] = OrderBook()
+            return self._books[key]
+
+    def keys(self):
+        with self._lock:
+            return list(self._books)
+
+    def on_change(self, callback, key=None):
+        r"""Register `callback(key, book, changes)`, called after each update
+        that changes a book.
+        Arguments:
+        --
+        callback (Callable): Function to call
+        key (Optional[tuple], default=None): Only notify for this key
+        """
+        with self._lock:
+            self._callbacks.append((key, callback))
+
+    def remove_callback(self, callback):
+        with self._lock:
+            self._callbacks = [(k, c) for k, c in self._callbacks if c is not callback]
+
+    def update(self, key, data):
+        r"""Apply a depth payload to the book for `key` and notify callbacks.
+        Arguments:
+        --
+        key (tuple): (underlying, strike, order_type)
+        data (Dict[string, any]): Decoded `get_depth` response data
+        """
+        book = self.book(*key)
+        with self._lock:
+            changes = book.apply(data)
+            callbacks = [c for k, c in self._callbacks if k is None or k == key]
+        if changes:
+            for callback in callbacks:
+                callback(key, book, changes)
+        return changes
+
+    def refresh(self, underlying, strike, order_type):
+        r"""Poll `get_depth` for one book and apply it."""
+        response = self.client.get_depth(underlying, strike, order_type)
+        return self.update((underlying, strike, order_type), response.data)
+
+    def refresh_all(self, underlying):
+        r"""Poll every book of the chain concurrently and apply the results."""
+        snapshot = self.client.get_chain_snapshot(underlying, fields=('depth',))
+        changes = {}
+        for (strike, order_type), data in snapshot.depth.items():
+            key = (underlying, strike, order_type)
+            changes[key] = self.update(key, data)
+        return changes
+
+    def best_bid(self, underlying, strike, order_type):
+        return self.book(underlying, strike, order_type).best_bid()
+
+    def best_ask(self, underlying, strike, order_type):
+        return self.book(underlying, strike, order_type).best_ask()
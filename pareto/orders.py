@@ -0,0 +1,343 @@
+import asyncio
+import threading
+from urllib.parse import urlsplit
+from pareto import constants
+from pareto.errors import ParetoAPIError
+from pareto.models import Order
+
+# Fields compared when reconciling a local order with the server
+ORDER_FIELDS = ('strike', 'quantity', 'price', 'order_type', 'order_side')
+
+
+def _level(order):
+    price = None if order.price is None else round(float(order.price), 2)
+    return (order.strike, order.order_type, order.order_side, price)
+
+
+def _created_order(request, data):
+    r"""Order from a create request and its response, which may hold the whole
+    order or only its id."""
+    fields = dict(request.body or {})
+    if isinstance(data, dict):
+        fields.update(data)
+    elif isinstance(data, str):
+        fields['id'] = data
+    return Order.from_data(fields)
+
+
+def _filled(order):
+    r"""Whether the response shows no quantity left to rest."""
+    return order.quantity is not None and float(order.quantity) <= 0
+
+
+def _is_async(client):
+    return asyncio.iscoroutinefunction(client._get)
+
+
+class OrderTracker:
+    r"""Local index of the open orders of one underlying, keyed by id and by
+    `(strike, order_type, order_side, price)`. Kept up to date from the
+    responses of every order creation and cancel sent by the client, and
+    reconciled against `get_orders` only when asked or periodically.
+    Market orders are not indexed, as they do not rest on the book.
+    Creates and cancels answered while a reconciliation is in flight are
+    applied on top of its snapshot, which may predate them.
+    Arguments:
+    --
+    client (PrivateClient): Client whose orders are tracked. Use
+        `AsyncOrderTracker` for an `AsyncPrivateClient`
+    underlying: see `constants.VALID_UNDERLYING`
+    """
+    def __init__(self, client, underlying):
+        assert underlying in constants.VALID_UNDERLYING
+        assert _is_async(client) == self._async, \
+            f'{type(self).__name__} does not support {type(client).__name__}'
+        self.client = client
+        self.underlying = underlying
+        self._by_id = {}
+        self._by_level = {}
+        self._lock = threading.Lock()
+        # Bumped by every create and cancel seen. While reconciliations are
+        # in flight, `_changes` maps ids to (generation, order or None)
+        self._generation = 0
+        self._reconciling = 0
+        self._changes = {}
+        self._stopped = threading.Event()
+        self._thread = None
+        client.add_listener(self.on_response)
+
+    _async = False
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def __contains__(self, id):
+        return id in self._by_id
+
+    def get(self, id):
+        r"""Open order with this id, or None."""
+        return self._by_id.get(id)
+
+    def at(self, strike, order_type, order_side, price):
+        r"""Open orders resting at a price level."""
+        with self._lock:
+            orders = self._by_level.get((strike, order_type, order_side, round(price, 2)))
+            return list(orders.values()) if orders else []
+
+    def orders(self):
+        r"""Every open order."""
+        with self._lock:
+            return list(self._by_id.values())
+
+    def _add(self, order):
+        self._remove(order.id)
+        self._by_id[order.id] = order
+        self._by_level.setdefault(_level(order), {})[order.id] = order
+
+    def _remove(self, id):
+        order = self._by_id.pop(id, None)
+        if order is not None:
+            level = self._by_level[_level(order)]
+            del level[id]
+            if not level:
+                del self._by_level[_level(order)]
+        return order
+
+    def _changed(self, id, order):
+        r"""Note a create (`order`) or cancel (None) for reconciliations in
+        flight. Lock held."""
+        self._generation += 1
+        if self._reconciling:
+            self._changes[id] = (self._generation, order)
+
+    def on_response(self, request, response):
+        r"""Update the index from a POST sent by the client. Registered as a
+        listener of the client when the tracker is created.
+        Arguments:
+        --
+        request (PreparedRequest): Request sent
+        response (Response): Its successful response
+        """
+        parts = urlsplit(request.uri).path.strip('/').split('/')
+        # /user/create/limit/{underlying}, /user/cancel/{underlying}/{id},
+        # /user/cancel/batch/{underlying} and /user/cancel/all/{underlying}
+        if len(parts) < 4 or parts[0] != 'user':
+            return
+        if parts[1] == 'create' and parts[2] == 'limit' and parts[3] == str(self.underlying):
+            order = _created_order(request, response.data)
+            # An order filled on arrival is not open
+            if order.id is not None and not _filled(order):
+                with self._lock:
+                    self._add(order)
+                    self._changed(order.id, order)
+        elif parts[1] == 'cancel':
+            with self._lock:
+                if parts[2:] == ['all', str(self.underlying)]:
+                    ids = list(self._by_id)
+                elif parts[2:] == ['batch', str(self.underlying)]:
+                    ids = (request.body or {}).get('ids', [])
+                elif parts[2] == str(self.underlying):
+                    ids = [parts[3]]
+                else:
+                    return
+                for id in ids:
+                    self._remove(id)
+                    self._changed(id, None)
+
+    def _begin(self):
+        r"""Start a reconciliation. Returns the generation its snapshot follows."""
+        with self._lock:
+            self._reconciling += 1
+            return self._generation
+
+    def _end(self, generation):
+        r"""Finish a reconciliation. Returns the changes seen since it started,
+        by id. Lock held."""
+        changes = {id: order for id, (changed, order) in self._changes.items()
+                   if changed > generation}
+        self._reconciling -= 1
+        if not self._reconciling:
+            self._changes = {}
+        return changes
+
+    def _abandon(self, generation):
+        with self._lock:
+            self._end(generation)
+
+    def apply_snapshot(self, data, generation=None):
+        r"""Replace the index with a `get_orders` payload and report what the
+        local index got wrong. Returns a dict with 'missing' (orders only on
+        the server), 'stale' (orders only in the index) and 'changed'
+        (`(local, server)` pairs whose fields differ).
+        Arguments:
+        --
+        data (List[Dict[string, any]]): Decoded `get_orders` response data
+        generation (Optional[integer], default=None): Generation when the
+            snapshot was requested, from `_begin`. Creates and cancels seen
+            since then are applied on top of the snapshot
+        """
+        server = {order.id: order for order in Order.many(data)}
+        with self._lock:
+            if generation is not None:
+                for id, order in self._end(generation).items():
+                    if order is None:
+                        server.pop(id, None)
+                    else:
+                        server[id] = order
+            local = self._by_id
+            diff = {
+                'missing': [order for id, order in server.items() if id not in local],
+                'stale': [order for id, order in local.items() if id not in server],
+                'changed': [(local[id], order) for id, order in server.items()
+                            if id in local and _fields(local[id]) != _fields(order)],
+            }
+            self._by_id = {}
+            self._by_level = {}
+            for order in server.values():
+                self._add(order)
+        return diff
+
+    def reconcile(self):
+        r"""Fetch `get_orders` and apply it, see `apply_snapshot`."""
+        generation = self._begin()
+        try:
+            data = self.client.get_orders(self.underlying).data
+        except BaseException:
+            self._abandon(generation)
+            raise
+        return self.apply_snapshot(data, generation)
+
+    def verify(self, id):
+        r"""Check one order with `get_order_by_id` and update the index.
+        Returns the server order, or None if the server does not know it.
+        Arguments:
+        --
+        id (string): Order identifier
+        """
+        try:
+            data = self.client.get_order_by_id(self.underlying, id).data
+        except ParetoAPIError as e:
+            if e.status_code != 404:
+                raise
+            data = None
+        return self._verified(id, data)
+
+    def _verified(self, id, data):
+        r"""Update the index from a `get_order_by_id` payload, None if unknown."""
+        order = Order.from_data(data) if data else None
+        with self._lock:
+            if order is None or order.id is None or _filled(order):
+                self._remove(id)
+                return None
+            self._add(order)
+        return order
+
+    def start(self, interval, on_diff=None):
+        r"""Reconcile periodically on a background thread.
+        Arguments:
+        --
+        interval (integer): Number of ms between reconciliations
+        on_diff (Optional[Callable[[Dict], None]]): Called with every
+            non-empty difference
+        """
+        def run():
+            while not self._stopped.wait(interval / 1000.):
+                try:
+                    diff = self.reconcile()
+                except Exception:
+                    continue
+                if on_diff is not None and any(diff.values()):
+                    on_diff(diff)
+
+        self._stopped.clear()
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._thread = None
+
+    def close(self):
+        r"""Stop reconciling and stop listening to the client."""
+        self.stop()
+        self.client.remove_listener(self.on_response)
+
+
+class AsyncOrderTracker(OrderTracker):
+    r"""Asyncio version of `OrderTracker`, for `AsyncPrivateClient`.
+    `reconcile`, `verify`, `stop` and `close` are coroutines, and periodic
+    reconciliation runs as a task on the running loop.
+    Arguments:
+    --
+    client (AsyncPrivateClient): Client whose orders are tracked
+    underlying: see `constants.VALID_UNDERLYING`
+    """
+    _async = True
+    _task = None
+
+    async def reconcile(self):
+        r"""Fetch `get_orders` and apply it, see `apply_snapshot`."""
+        generation = self._begin()
+        try:
+            data = (await self.client.get_orders(self.underlying)).data
+        except BaseException:
+            self._abandon(generation)
+            raise
+        return self.apply_snapshot(data, generation)
+
+    async def verify(self, id):
+        r"""Check one order with `get_order_by_id` and update the index.
+        Returns the server order, or None if the server does not know it.
+        Arguments:
+        --
+        id (string): Order identifier
+        """
+        try:
+            data = (await self.client.get_order_by_id(self.underlying, id)).data
+        except ParetoAPIError as e:
+            if e.status_code != 404:
+                raise
+            data = None
+        return self._verified(id, data)
+
+    def start(self, interval, on_diff=None):
+        r"""Reconcile periodically in a task on the running loop.
+        Arguments:
+        --
+        interval (integer): Number of ms between reconciliations
+        on_diff (Optional[Callable[[Dict], None]]): Called with every
+            non-empty difference
+        """
+        async def run():
+            while True:
+                await asyncio.sleep(interval / 1000.)
+                try:
+                    diff = await self.reconcile()
+                except Exception:
+                    continue
+                if on_diff is not None and any(diff.values()):
+                    on_diff(diff)
+
+        self._task = asyncio.get_running_loop().create_task(run())
+        return self
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+
+    async def close(self):
+        r"""Stop reconciling and stop listening to the client."""
+        await self.stop()
+        self.client.remove_listener(self.on_response)
+
+
+def _fields(order):
+    return tuple(getattr(order, name) for name in ORDER_FIELDS)
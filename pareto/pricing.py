@@ -0,0 +1,208 @@
+import time
+import numpy as np
+from pareto import constants
+from pareto.cache import parse_expiry
+
+SECONDS_PER_YEAR = 365. * 24. * 60. * 60.
+GREEKS = ('mark', 'delta', 'gamma', 'vega', 'theta')
+
+# Row of each order type in chain arrays, following `constants.VALID_ORDER_TYPE`
+TYPE_INDEX = {order_type: i for i, order_type in enumerate(constants.VALID_ORDER_TYPE)}
+
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / np.sqrt(2. * np.pi)
+
+
+def norm_cdf(x):
+    r"""Standard normal CDF, accurate to ~1e-7 (Abramowitz & Stegun 7.1.26)."""
+    z = np.abs(x) / np.sqrt(2.)
+    t = 1. / (1. + 0.3275911 * z)
+    poly = t * (0.254829592 + t * (-0.284496736 + t * (1.421413741
+                + t * (-1.453152027 + t * 1.061405429))))
+    erf = 1. - poly * np.exp(-z * z)
+    return 0.5 * (1. + np.sign(x) * erf)
+
+
+def black_scholes(spot, strike, sigma, tau, rate=0., is_call=True):
+    r"""Vectorized Black-Scholes mark and greeks. All arguments broadcast.
+    Returns a dict of arrays keyed by `GREEKS`. Vega is per unit of volatility
+    and theta per year.
+    Arguments:
+    --
+    spot (float or ndarray): Price of the underlying
+    strike (float or ndarray): Strike price
+    sigma (float or ndarray): Implied volatility, annualized
+    tau (float or ndarray): Time to expiry in years
+    rate (float or ndarray, default=0): Risk-free rate, annualized
+    is_call (bool or ndarray, default=True): Call if True, put otherwise
+    """
+    spot, strike, sigma, tau, rate, is_call = np.broadcast_arrays(
+        *map(np.asarray, (spot, strike, sigma, tau, rate, is_call)))
+    tau = np.maximum(tau.astype(float), 1e-12)
+    sqrt_tau = np.sqrt(tau)
+    vol = np.maximum(sigma * sqrt_tau, 1e-12)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * sigma * sigma) * tau) / vol
+    d2 = d1 - vol
+    discount = np.exp(-rate * tau)
+    pdf_d1 = norm_pdf(d1)
+
+    call = spot * norm_cdf(d1) - strike * discount * norm_cdf(d2)
+    put = strike * discount * norm_cdf(-d2) - spot * norm_cdf(-d1)
+    common_theta = -spot * pdf_d1 * sigma / (2. * sqrt_tau)
+    call_theta = common_theta - rate * strike * discount * norm_cdf(d2)
+    put_theta = common_theta + rate * strike * discount * norm_cdf(-d2)
+
+    return {
+        'mark': np.where(is_call, call, put),
+        'delta': np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.),
+        'gamma': pdf_d1 / (spot * vol),
+        'vega': spot * pdf_d1 * sqrt_tau,
+        'theta': np.where(is_call, call_theta, put_theta),
+    }
+
+
+class ChainPrices:
+    r"""Mark and greeks for a whole chain. Each array has shape
+    `(len(VALID_ORDER_TYPE), len(VALID_STRIKE))`; index rows with `TYPE_INDEX`.
+    Arguments:
+    --
+    strikes (ndarray): Strike prices
+    values (Dict[string, ndarray]): Arrays keyed by `GREEKS`
+    """
+    def __init__(self, strikes, values):
+        self.strikes = strikes
+        for name in GREEKS:
+            setattr(self, name, values[name])
+
+    def get(self, strike, order_type):
+        r"""Mark and greeks of one option as a dict.
+        Arguments:
+        --
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        """
+        row = TYPE_INDEX[order_type]
+        return {name: float(getattr(self, name)[row, strike]) for name in GREEKS}
+
+
+def price_chain(spot, strikes, sigma, tau, rate=0.):
+    r"""Price every strike and type in one batched call.
+    Arguments:
+    --
+    spot (float): Price of the underlying
+    strikes (Sequence[float]): Strike price for each of `VALID_STRIKE`
+    sigma (float or ndarray): Implied volatility, either a scalar, one value
+        per strike, or an array of shape (2, len(strikes)) with call and put rows
+    tau (float): Time to expiry in years
+    rate (float, default=0): Risk-free rate
+    """
+    strikes = np.asarray(strikes, dtype=float)
+    is_call = np.array(constants.VALID_ORDER_TYPE, dtype=bool)[:, None]
+    values = black_scholes(spot, strikes[None, :], sigma, tau, rate, is_call)
+    return ChainPrices(strikes, values)
+
+
+def _field(data, *names):
+    r"""Read a value from a payload that is either bare or wrapped in a dict."""
+    if isinstance(data, dict):
+        for name in names:
+            if name in data:
+                return data[name]
+    return data
+
+
+def parse_strikes(data):
+    r"""Strike prices from a `get_strikes` payload."""
+    return np.asarray(_field(data, 'strikes'), dtype=float)
+
+
+def parse_sigma(data):
+    r"""Implied volatility from a `get_sigma` payload."""
+    return float(_field(data, 'sigma'))
+
+
+def parse_margin(data):
+    r"""Initial margin from a `get_initial_margin_new_order` payload."""
+    return float(_field(data, 'margin'))
+
+
+def parse_mark(data):
+    r"""Call and put marks from a `get_mark` payload as a (2, n) array."""
+    calls = _field(data, 'calls', 'call')
+    puts = _field(data, 'puts', 'put')
+    if calls is data:
+        calls, puts = data
+    rows = {constants.ORDER_TYPE_CALL: calls, constants.ORDER_TYPE_PUT: puts}
+    return np.array([rows[t] for t in constants.VALID_ORDER_TYPE], dtype=float)
+
+
+def time_to_expiry(expiry, now=None):
+    r"""Years between `now` (default: current time) and an expiry timestamp."""
+    now = time.time() if now is None else now
+    return max(expiry - now, 0.) / SECONDS_PER_YEAR
+
+
+def sigma_from_snapshot(snapshot):
+    r"""Mid implied volatility array of shape (2, n) from a chain snapshot
+    fetched with the 'sigma' field.
+    Arguments:
+    --
+    snapshot (ChainSnapshot): Snapshot including sigma
+    """
+    sigma = np.zeros((len(constants.VALID_ORDER_TYPE), len(constants.VALID_STRIKE)))
+    for order_type, row in TYPE_INDEX.items():
+        for strike in constants.VALID_STRIKE:
+            sides = [parse_sigma(snapshot.sigma[(strike, order_type, side)])
+                     for side in constants.VALID_ORDER_SIDE]
+            sigma[row, strike] = sum(sides) / len(sides)
+    return sigma
+
+
+def price_chain_from_client(client, underlying, spot, rate=0.):
+    r"""Fetch strikes, expiry and sigma from the server and price the chain locally.
+    Arguments:
+    --
+    client (PublicClient): Client used to fetch inputs
+    underlying: see `constants.VALID_UNDERLYING`
+    spot (float): Price of the underlying
+    rate (float, default=0): Risk-free rate
+    """
+    strikes = parse_strikes(client.get_strikes(underlying).data)
+    tau = time_to_expiry(parse_expiry(client.get_expiry(underlying).data))
+    snapshot = client.get_chain_snapshot(underlying, fields=('sigma',))
+    return price_chain(spot, strikes, sigma_from_snapshot(snapshot), tau, rate)
+
+
+def check_consistency(client, underlying, spot, rate=0., rtol=1e-2, atol=1e-6):
+    r"""Compare local prices against the `get_mark` and `get_greeks` endpoints.
+    Returns `(local, mismatches)` where mismatches is a list of
+    `(name, strike, order_type, local_value, server_value)` tuples.
+    Arguments:
+    --
+    client (PublicClient): Client used to fetch inputs
+    underlying: see `constants.VALID_UNDERLYING`
+    spot (float): Price of the underlying
+    rate (float, default=0): Risk-free rate
+    rtol (float, default=1e-2): Relative tolerance
+    atol (float, default=1e-6): Absolute tolerance
+    """
+    local = price_chain_from_client(client, underlying, spot, rate)
+    server_mark = parse_mark(client.get_mark(underlying).data)
+    snapshot = client.get_chain_snapshot(underlying, fields=('greeks',))
+
+    mismatches = []
+    for name in GREEKS:
+        for order_type, row in TYPE_INDEX.items():
+            for strike in constants.VALID_STRIKE:
+                if name == 'mark':
+                    expected = float(server_mark[row, strike])
+                else:
+                    greeks = snapshot.greeks[(strike, order_type)]
+                    if not isinstance(greeks, dict) or name not in greeks:
+                        continue
+                    expected = float(greeks[name])
+                actual = float(getattr(local, name)[row, strike])
+                if not np.isclose(actual, expected, rtol=rtol, atol=atol):
+                    mismatches.append((name, strike, order_type, actual, expected))
+    return local, mismatches
@@ -0,0 +1,465 @@
+r"""Record API traffic to an append-only file and replay it offline.
+A capture file starts with `MAGIC` and holds one length-prefixed record per
+request: a fixed binary header followed by the URI, the request body, the
+response headers (JSON) and the response body. Request headers are not
+recorded, so captures hold no signatures. Requests that failed without a
+response record the error instead, and replay raises it again.
+"""
+import asyncio
+import atexit
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+import requests
+from pareto.errors import ParetoError, ParetoAPIError, ParetoTimeoutError
+from pareto.transport import deadline, remaining_budget
+from pareto.utils import Response, DEFAULT_JSON_CODEC
+
+MAGIC = b'PARETO\x00\x01'
+# Record length, start (epoch seconds), elapsed (seconds), status, method,
+# then the lengths of the URI, request body, response headers and response body
+_HEADER = struct.Struct('<IddHBIIII')
+_METHODS = ('GET', 'POST')
+# Status recorded for requests that got no response
+STATUS_NO_RESPONSE = 0
+# Status recorded for requests that failed with another error, such as a
+# refused connection. The body holds the error type and message as JSON
+STATUS_TRANSPORT_ERROR = 1
+# Maximum number of records waiting for the writer thread
+DEFAULT_MAX_QUEUED = 10000
+# Sentinel stopping the writer thread
+_STOP = object()
+
+
+class Record:
+    r"""One recorded request and its response.
+    Arguments:
+    --
+    started (float): Wall clock time the request was sent, in seconds
+    elapsed (float): Seconds until the response was received
+    status (integer): Status code, `STATUS_NO_RESPONSE` if none was received
+    method (string): GET or POST
+    uri (string): Full URI endpoint
+    request (bytes): Encoded request body
+    headers (Dict[string, string]): Response headers
+    body (bytes): Response body
+    """
+    __slots__ = ('started', 'elapsed', 'status', 'method', 'uri', 'request', 'headers', 'body')
+
+    def __init__(self, started, elapsed, status, method, uri, request, headers, body):
+        self.started = started
+        self.elapsed = elapsed
+        self.status = status
+        self.method = method
+        self.uri = uri
+        self.request = request
+        self.headers = headers
+        self.body = body
+
+    def pack(self):
+        uri = self.uri.encode('utf-8')
+        headers = json.dumps(self.headers, separators=(',', ':')).encode('utf-8')
+        size = _HEADER.size - 4 + len(uri) + len(self.request) + len(headers) + len(self.body)
+        return b''.join((_HEADER.pack(size,
+                                      self.started,
+                                      self.elapsed,
+                                      self.status,
+                                      _METHODS.index(self.method.upper()),
+                                      len(uri),
+                                      len(self.request),
+                                      len(headers),
+                                      len(self.body),
+                                      ),
+                         uri, self.request, headers, self.body))
+
+    @classmethod
+    def unpack(cls, buffer, offset):
+        r"""Record at `offset` of a capture buffer, and the offset of the next."""
+        (size, started, elapsed, status, method,
+         uri_size, request_size, headers_size, body_size) = _HEADER.unpack_from(buffer, offset)
+        start = offset + _HEADER.size
+        ends = []
+        for length in (uri_size, request_size, headers_size, body_size):
+            ends.append(start + length)
+            start += length
+        uri = bytes(buffer[offset + _HEADER.size:ends[0]]).decode('utf-8')
+        record = cls(started,
+                     elapsed,
+                     status,
+                     _METHODS[method],
+                     uri,
+                     bytes(buffer[ends[0]:ends[1]]),
+                     json.loads(bytes(buffer[ends[1]:ends[2]])),
+                     bytes(buffer[ends[2]:ends[3]]),
+                     )
+        return record, offset + 4 + size
+
+    def __repr__(self):
+        return (f'Record(method={self.method}, uri={self.uri!r}, status={self.status}, '
+                f'elapsed={self.elapsed:.6f})')
+
+
+class Recorder:
+    r"""Appends every request and response to a capture file. Callers only
+    enqueue; a background thread packs and writes the records, so recording
+    only blocks on disk when the writer falls `max_queued` records behind.
+    Pass to `Transport(recorder=...)` or `Client(recorder=...)`.
+    Arguments:
+    --
+    path (string): Capture file, created or appended to. A record left
+        incomplete by a crash is truncated before appending
+    flush_interval (integer): Number of ms between flushes to disk
+    max_queued (integer): Maximum number of records waiting to be written.
+        Callers wait for room beyond it, bounding memory use
+    """
+    def __init__(self, path, flush_interval=1000, max_queued=DEFAULT_MAX_QUEUED):
+        assert max_queued > 0
+        self.path = path
+        self.flush_interval = flush_interval
+        self.records = 0
+        self.bytes = 0
+        self._queue = queue.Queue(max_queued)
+        _repair(path)
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        # The writer is a daemon thread, write what is queued at exit
+        atexit.register(self.close)
+
+    def record(self, record):
+        r"""Queue a `Record` for writing, waiting while the queue is full."""
+        self._queue.put(record)
+
+    def capture(self, method, uri, data, send):
+        r"""Call `send` and record its outcome, including API errors, timeouts
+        and requests that failed without a response.
+        Arguments:
+        --
+        method (string): GET or POST
+        uri (string): Full URI endpoint
+        data (bytes): Encoded request body
+        send (Callable[[], Response]): Sends the request
+        """
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            response = send()
+        except BaseException as error:
+            self._failed(started, time.perf_counter() - start, method, uri, data, error)
+            raise
+        self._succeeded(started, time.perf_counter() - start, method, uri, data, response)
+        return response
+
+    async def capture_async(self, method, uri, data, send):
+        r"""Await `send()` and record its outcome, see `capture`."""
+        started = time.time()
+        start = time.perf_counter()
+        try:
+            response = await send()
+        except BaseException as error:
+            self._failed(started, time.perf_counter() - start, method, uri, data, error)
+            raise
+        self._succeeded(started, time.perf_counter() - start, method, uri, data, response)
+        return response
+
+    def _succeeded(self, started, elapsed, method, uri, data, response):
+        self.record(Record(started, elapsed, response.status_code or 200, method, uri, data,
+                           dict(response.headers or {}), response.raw or b''))
+
+    def _failed(self, started, elapsed, method, uri, data, error):
+        if isinstance(error, ParetoAPIError):
+            error_response = error.response
+            self.record(Record(started, elapsed, error.status_code, method, uri, data,
+                               dict(error_response.headers or {}), error_response.content))
+        elif isinstance(error, (ParetoTimeoutError, requests.Timeout, asyncio.TimeoutError)):
+            self.record(Record(started, elapsed, STATUS_NO_RESPONSE, method, uri, data, {}, b''))
+        elif isinstance(error, Exception):
+            kind = type(error)
+            body = json.dumps({
+                'type': f'{kind.__module__}:{kind.__qualname__}',
+                'message': str(error),
+            }).encode('utf-8')
+            self.record(Record(started, elapsed, STATUS_TRANSPORT_ERROR, method, uri, data,
+                               {}, body))
+
+    def _run(self):
+        interval = self.flush_interval / 1000.
+        flushed = time.monotonic()
+        while True:
+            try:
+                record = self._queue.get(timeout=interval)
+            except queue.Empty:
+                record = None
+            if record is _STOP:
+                self._file.flush()
+                return
+            if record is not None:
+                packed = record.pack()
+                self._file.write(packed)
+                self.records += 1
+                self.bytes += len(packed)
+            if time.monotonic() - flushed >= interval:
+                self._file.flush()
+                flushed = time.monotonic()
+
+    def close(self):
+        r"""Write every queued record, sync and close the file."""
+        atexit.unregister(self.close)
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        if not self._file.closed:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _open(path):
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ParetoError(f'{path} is empty')
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    if buffer[:len(MAGIC)] != MAGIC:
+        buffer.close()
+        raise ParetoError(f'{path} is not a capture file')
+    return buffer
+
+
+def _repair(path):
+    r"""Truncate a capture file after its last complete record, so appended
+    records stay aligned. Refuses files that are not captures."""
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'r+b') as f:
+        head = f.read(len(MAGIC))
+        if not MAGIC.startswith(head):
+            raise ParetoError(f'{path} is not a capture file')
+        if len(head) < len(MAGIC):
+            f.truncate(0)
+            return
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            end = len(MAGIC)
+            for offset in _offsets(buffer):
+                end = offset + 4 + struct.unpack_from('<I', buffer, offset)[0]
+            size = len(buffer)
+        finally:
+            buffer.close()
+        if end < size:
+            f.truncate(end)
+
+
+def _offsets(buffer):
+    r"""Offset of every complete record, skipping a truncated last one."""
+    offset = len(MAGIC)
+    end = len(buffer)
+    while offset + 4 <= end:
+        size, = struct.unpack_from('<I', buffer, offset)
+        if offset + 4 + size > end:
+            break
+        yield offset
+        offset += 4 + size
+
+
+def read_records(path):
+    r"""Iterate over the records of a capture file, in order.
+    Arguments:
+    --
+    path (string): Capture file
+    """
+    buffer = _open(path)
+    try:
+        for offset in _offsets(buffer):
+            yield Record.unpack(buffer, offset)[0]
+    finally:
+        buffer.close()
+
+
+def replay(path, speed=1.):
+    r"""Iterate over the records of a capture file, sleeping to reproduce the
+    original time between requests divided by `speed`. With `speed=None`,
+    records are yielded as fast as they are read.
+    Arguments:
+    --
+    path (string): Capture file
+    speed (Optional[float], default=1.): Acceleration factor
+    """
+    origin = None
+    for record in read_records(path):
+        if speed is not None:
+            if origin is None:
+                origin = (record.started, time.monotonic())
+            due = origin[1] + (record.started - origin[0]) / speed
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        yield record
+
+
+class ReplayedErrorResponse:
+    r"""Recorded error response with the attributes read by `ParetoAPIError`.
+    Arguments:
+    --
+    record (Record): Recorded request
+    """
+    def __init__(self, record):
+        self.status_code = record.status
+        self.content = record.body
+        self.text = record.body.decode('utf-8', errors='replace')
+        self.headers = record.headers
+        self.request = None
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _transport_error(record):
+    r"""Rebuild the error of a `STATUS_TRANSPORT_ERROR` record. Only types of
+    modules already imported are looked up; others become a `ParetoError`."""
+    error = json.loads(record.body)
+    module, _, name = error['type'].partition(':')
+    kind = sys.modules.get(module)
+    for attribute in name.split('.'):
+        kind = getattr(kind, attribute, None)
+    if isinstance(kind, type) and issubclass(kind, Exception):
+        try:
+            return kind(error['message'])
+        except TypeError:
+            pass
+    return ParetoError(f'{error["type"]}: {error["message"]}')
+
+
+def _key(method, uri):
+    r"""Requests match on method, path and query, so any host replays."""
+    parts = urlsplit(uri)
+    return method.upper(), f'{parts.path}?{parts.query}' if parts.query else parts.path
+
+
+class ReplayTransport:
+    r"""Transport serving the responses of a capture file instead of sending
+    requests, for `Client(transport=...)`. The file is memory mapped and only
+    its record offsets are indexed up front. Each request gets the next
+    recorded response with the same method, path and query, in recorded
+    order; API errors, timeouts and transport errors are raised as they were.
+    Arguments:
+    --
+    path (string): Capture file
+    speed (Optional[float], default=None): Reproduce the recorded latency
+        divided by `speed`. None answers immediately
+    repeat_last (boolean, default=False): Serve the last response of an
+        endpoint again once its records are used up, instead of raising
+    json_codec (JSONCodec, default=DEFAULT_JSON_CODEC): Decoder for responses
+    """
+    session = None
+    scheduler = None
+    deadline = staticmethod(deadline)
+
+    def __init__(self, path, speed=None, repeat_last=False, json_codec=DEFAULT_JSON_CODEC):
+        self.path = path
+        self.speed = speed
+        self.repeat_last = repeat_last
+        self.json_codec = json_codec
+        self._buffer = _open(path)
+        self._index = defaultdict(deque)
+        self._last = {}
+        self._lock = threading.Lock()
+        for offset in _offsets(self._buffer):
+            _, _, _, _, method, uri_size, _, _, _ = _HEADER.unpack_from(self._buffer, offset)
+            start = offset + _HEADER.size
+            uri = bytes(self._buffer[start:start + uri_size]).decode('utf-8')
+            self._index[_key(_METHODS[method], uri)].append(offset)
+
+    def __len__(self):
+        r"""Number of responses left to serve."""
+        return sum(len(offsets) for offsets in self._index.values())
+
+    def _next(self, uri, method):
+        key = _key(method, uri)
+        with self._lock:
+            offsets = self._index.get(key)
+            if offsets:
+                offset = self._last[key] = offsets.popleft()
+            elif self.repeat_last and key in self._last:
+                offset = self._last[key]
+            else:
+                raise ParetoError(f'no recorded response for {method.upper()} {key[1]}')
+        return Record.unpack(self._buffer, offset)[0]
+
+    def _delay(self, uri, record, budget):
+        r"""Seconds to wait before answering, and whether the deadline passes first."""
+        delay = record.elapsed / self.speed if self.speed else 0.
+        if record.status == STATUS_NO_RESPONSE and not delay:
+            return 0., True
+        remaining = remaining_budget(uri, budget)
+        if remaining is not None and remaining < delay:
+            return remaining, True
+        return delay, record.status == STATUS_NO_RESPONSE
+
+    def _respond(self, uri, record, json_codec, timed_out):
+        if timed_out:
+            raise ParetoTimeoutError(uri, 'request timed out')
+        if record.status == STATUS_TRANSPORT_ERROR:
+            raise _transport_error(record)
+        if not str(record.status).startswith('2'):
+            raise ParetoAPIError(ReplayedErrorResponse(record))
+        return Response(headers=record.headers,
+                        raw=record.body,
+                        json_codec=json_codec or self.json_codec,
+                        status_code=record.status,
+                        )
+
+    def request(self,
+                uri,
+                method,
+                headers=None,
+                body={},
+                data=None,
+                deadline=None,
+                json_codec=None,
+                ):
+        r"""Serve the next recorded response for this request, see `Transport.request`."""
+        record = self._next(uri, method)
+        delay, timed_out = self._delay(uri, record, deadline)
+        if delay:
+            time.sleep(delay)
+        return self._respond(uri, record, json_codec, timed_out)
+
+    def close(self):
+        self._buffer.close()
+
+
+class AsyncReplayTransport(ReplayTransport):
+    r"""Asyncio version of `ReplayTransport`, for `AsyncClient(transport=...)`."""
+    async def request(self,
+                      uri,
+                      method,
+                      headers=None,
+                      body={},
+                      data=None,
+                      deadline=None,
+                      json_codec=None,
+                      ):
+        r"""Serve the next recorded response for this request, see `Transport.request`."""
+        record = self._next(uri, method)
+        delay, timed_out = self._delay(uri, record, deadline)
+        if delay:
+            await asyncio.sleep(delay)
+        return self._respond(uri, record, json_codec, timed_out)
+
+    async def close(self):
+        super().close()
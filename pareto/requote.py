@@ -0,0 +1,236 @@
+import asyncio
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from pareto import constants
+from pareto.errors import ParetoError
+from pareto.models import Order
+from pareto.utils import BatchResult
+
+# Quote fields, as keyword arguments of `create_limit_order`
+QUOTE_FIELDS = ('strike', 'order_type', 'order_side', 'price', 'quantity')
+
+
+def _key(strike, order_type, order_side, price, quantity):
+    # Prices and quantities are rounded to 0.01 when orders are created
+    return (strike, order_type, order_side, round(float(price), 2), round(float(quantity), 2))
+
+
+def _crosses(quote, order):
+    # A buy at or above a resting sell, or a sell at or below a resting buy
+    if (quote['strike'] != order.strike or quote['order_type'] != order.order_type
+            or quote['order_side'] == order.order_side):
+        return False
+    price, resting = round(float(quote['price']), 2), round(float(order.price), 2)
+    if quote['order_side'] == constants.ORDER_SIDE_BUY:
+        return price >= resting
+    return price <= resting
+
+
+class RequotePlan:
+    r"""Smallest set of operations taking the open orders to the desired quotes.
+    Arguments:
+    --
+    cancels (List[string]): Ids of open orders to cancel
+    creates (List[Dict[string, any]]): Quotes to create, as keyword arguments
+        of `create_limit_order`
+    kept (List[Order]): Open orders already matching a desired quote
+    deferred (List[Dict[string, any]], default=[]): Quotes that would cross
+        an order being cancelled, created once the cancel has succeeded
+    """
+    __slots__ = ('cancels', 'creates', 'kept', 'deferred')
+
+    def __init__(self, cancels, creates, kept, deferred=[]):
+        self.cancels = cancels
+        self.creates = creates
+        self.kept = kept
+        self.deferred = list(deferred)
+
+    def __len__(self):
+        r"""Number of requests needed to execute the plan."""
+        return bool(self.cancels) + len(self.creates) + len(self.deferred)
+
+    def __repr__(self):
+        return (f'RequotePlan(cancels={len(self.cancels)}, creates={len(self.creates)}, '
+                f'kept={len(self.kept)}, deferred={len(self.deferred)})')
+
+
+class RequoteResult:
+    r"""Outcome of an executed plan.
+    Arguments:
+    --
+    plan (RequotePlan): Executed plan
+    cancelled (Optional[BatchResult]): Result of the `cancel_batch`, None if
+        nothing was cancelled
+    created (List[BatchResult]): Result of each create, in `plan.creates` then
+        `plan.deferred` order. Deferred creates are not sent when the cancel
+        fails, and hold a `ParetoError` instead
+    """
+    __slots__ = ('plan', 'cancelled', 'created')
+
+    def __init__(self, plan, cancelled, created):
+        self.plan = plan
+        self.cancelled = cancelled
+        self.created = created
+
+    @property
+    def ok(self):
+        return ((self.cancelled is None or self.cancelled.ok)
+                and all(result.ok for result in self.created))
+
+    def __repr__(self):
+        return f'RequoteResult(plan={self.plan!r}, ok={self.ok})'
+
+
+def diff_quotes(quotes, orders):
+    r"""Match desired quotes against open orders. An open order is kept when a
+    desired quote has the same strike, type, side, price and quantity; every
+    other open order is cancelled and every unmatched quote created. There is
+    no amend endpoint, so a size change is a cancel and a create. A quote
+    that would cross an order being cancelled is deferred rather than sent
+    alongside the cancel, where it could trade against it.
+    Arguments:
+    --
+    quotes (Iterable[Dict[string, any]]): Desired quotes with `QUOTE_FIELDS`
+    orders (Iterable[Order]): Open orders
+    """
+    open_orders = defaultdict(list)
+    for order in orders:
+        open_orders[_key(order.strike, order.order_type, order.order_side,
+                         order.price, order.quantity)].append(order)
+    missing, kept = [], []
+    for quote in quotes:
+        matches = open_orders.get(_key(**{name: quote[name] for name in QUOTE_FIELDS}))
+        if matches:
+            kept.append(matches.pop())
+        else:
+            missing.append(dict(quote))
+    cancelled = [order for matches in open_orders.values() for order in matches]
+    creates, deferred = [], []
+    for quote in missing:
+        crossing = any(_crosses(quote, order) for order in cancelled)
+        (deferred if crossing else creates).append(quote)
+    return RequotePlan([order.id for order in cancelled], creates, kept, deferred)
+
+
+class Requoter:
+    r"""Moves the open orders of one underlying to a desired set of quotes
+    with as few requests as possible: one `cancel_batch` for every order that
+    is no longer wanted, and one `create_limit_order` per missing quote, all
+    in flight at once. Quotes crossing an order being cancelled wait for the
+    cancel, so a refresh never trades against itself. Open orders come from
+    an `OrderTracker` when given, otherwise from `get_orders` on every
+    refresh.
+    Arguments:
+    --
+    client (PrivateClient): Client sending the orders
+    underlying: see `constants.VALID_UNDERLYING`
+    tracker (Optional[OrderTracker], default=None): Local index of open orders
+    max_workers (integer): Maximum number of requests in flight
+    """
+    def __init__(self,
+                 client,
+                 underlying,
+                 tracker=None,
+                 max_workers=constants.DEFAULT_MAX_WORKERS,
+                 ):
+        assert underlying in constants.VALID_UNDERLYING
+        assert tracker is None or tracker.underlying == underlying
+        self.client = client
+        self.underlying = underlying
+        self.tracker = tracker
+        self.max_workers = max_workers
+
+    def plan(self, quotes, orders=None):
+        r"""Compute the operations for a refresh without sending anything.
+        Arguments:
+        --
+        quotes (Iterable[Dict[string, any]]): Desired quotes with `QUOTE_FIELDS`
+        orders (Optional[Iterable[Order]], default=None): Open orders, read
+            from the tracker or `get_orders` if not given
+        """
+        if orders is None:
+            if self.tracker is not None:
+                orders = self.tracker.orders()
+            else:
+                orders = Order.many(self.client.get_orders(self.underlying).data)
+        return diff_quotes(quotes, orders)
+
+    def execute(self, plan):
+        r"""Send a plan, the cancel concurrently with the creates, then the
+        deferred creates once the cancel has succeeded."""
+        if not plan.cancels:
+            return RequoteResult(plan, None, self._create(plan.creates + plan.deferred))
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(copy_context().run, self.client.cancel_batch,
+                                     self.underlying, plan.cancels)
+            created = self._create(plan.creates)
+            cancelled = BatchResult.from_future(future)
+        if cancelled.ok:
+            created += self._create(plan.deferred)
+        else:
+            created += _skipped(plan.deferred)
+        return RequoteResult(plan, cancelled, created)
+
+    def _create(self, creates):
+        if not creates:
+            return []
+        return self.client.create_limit_orders(self.underlying, creates,
+                                               max_workers=self.max_workers)
+
+    def requote(self, quotes, orders=None):
+        r"""Plan and execute a refresh, see `plan`."""
+        return self.execute(self.plan(quotes, orders))
+
+
+class AsyncRequoter(Requoter):
+    r"""Asyncio version of `Requoter`, for `AsyncPrivateClient`. A tracker
+    must be an `AsyncOrderTracker`."""
+    async def plan(self, quotes, orders=None):
+        r"""Compute the operations for a refresh without sending anything.
+        Arguments:
+        --
+        quotes (Iterable[Dict[string, any]]): Desired quotes with `QUOTE_FIELDS`
+        orders (Optional[Iterable[Order]], default=None): Open orders, read
+            from the tracker or `get_orders` if not given
+        """
+        if orders is None:
+            if self.tracker is not None:
+                orders = self.tracker.orders()
+            else:
+                orders = Order.many((await self.client.get_orders(self.underlying)).data)
+        return diff_quotes(quotes, orders)
+
+    async def execute(self, plan):
+        r"""Send a plan, the cancel concurrently with the creates, then the
+        deferred creates once the cancel has succeeded."""
+        if not plan.cancels:
+            return RequoteResult(plan, None, await self._create(plan.creates + plan.deferred))
+        cancelled, created = await asyncio.gather(self._cancel(plan.cancels),
+                                                  self._create(plan.creates))
+        if cancelled.ok:
+            created += await self._create(plan.deferred)
+        else:
+            created += _skipped(plan.deferred)
+        return RequoteResult(plan, cancelled, created)
+
+    async def _create(self, creates):
+        if not creates:
+            return []
+        return await self.client.create_limit_orders(self.underlying, creates,
+                                                     max_workers=self.max_workers)
+
+    async def _cancel(self, ids):
+        try:
+            return BatchResult(response=await self.client.cancel_batch(self.underlying, ids))
+        except Exception as error:
+            return BatchResult(error=error)
+
+    async def requote(self, quotes, orders=None):
+        r"""Plan and execute a refresh, see `plan`."""
+        return await self.execute(await self.plan(quotes, orders))
+
+
+def _skipped(creates):
+    return [BatchResult(error=ParetoError('not sent: the cancel it waited for failed'))
+            for _ in creates]
@@ -0,0 +1,216 @@
+r"""Portfolio risk over the option chain of one underlying, backed by numpy.
+Every option, one per strike and option type, has a fixed row in the
+arrays, so aggregate greeks are a single dot product. Requires numpy, see
+the `numpy` extra.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pareto import constants
+from pareto.models import Greeks, Position
+from pareto.pricing import parse_margin
+
+GREEKS = Greeks.__slots__
+
+
+def option_index(strike, order_type):
+    r"""Row of an option in the portfolio arrays."""
+    return (constants.VALID_STRIKE.index(strike) * len(constants.VALID_ORDER_TYPE)
+            + constants.VALID_ORDER_TYPE.index(order_type))
+
+
+OPTIONS = [(strike, order_type)
+           for strike in constants.VALID_STRIKE
+           for order_type in constants.VALID_ORDER_TYPE]
+
+
+def _signed(quantity, order_side):
+    return quantity if order_side == constants.ORDER_SIDE_BUY else -quantity
+
+
+class Portfolio:
+    r"""Positions and greeks of one underlying in arrays, with aggregate
+    exposures kept up to date incrementally: changing one position or the
+    greeks of one option costs a vector update, not a full recomputation.
+    Greeks not loaded yet count as zero.
+    Arguments:
+    --
+    underlying: see `constants.VALID_UNDERLYING`
+    """
+    def __init__(self, underlying):
+        assert underlying in constants.VALID_UNDERLYING
+        self.underlying = underlying
+        size = len(OPTIONS)
+        # Signed quantity, positive when long
+        self.quantity = np.zeros(size)
+        # Columns follow `GREEKS`
+        self.greeks = np.zeros((size, len(GREEKS)))
+        # Initial margin per unit, columns follow `constants.VALID_ORDER_SIDE`
+        self.margin_rates = np.full((size, len(constants.VALID_ORDER_SIDE)), np.nan)
+        self._totals = np.zeros(len(GREEKS))
+
+    def set_position(self, strike, order_type, quantity):
+        r"""Set the signed quantity held of one option.
+        Arguments:
+        --
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        quantity (float): Positive when long, negative when short
+        """
+        index = option_index(strike, order_type)
+        self._totals += (quantity - self.quantity[index]) * self.greeks[index]
+        self.quantity[index] = quantity
+
+    def set_greeks(self, strike, order_type, greeks):
+        r"""Set the greeks of one option.
+        Arguments:
+        --
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        greeks (Greeks or Dict[string, float]): `get_greeks` data
+        """
+        if not isinstance(greeks, Greeks):
+            greeks = Greeks.from_data(greeks)
+        index = option_index(strike, order_type)
+        row = np.array([getattr(greeks, name) or 0. for name in GREEKS], dtype=float)
+        self._totals += self.quantity[index] * (row - self.greeks[index])
+        self.greeks[index] = row
+
+    def load_positions(self, data):
+        r"""Replace every position with a `get_positions` payload."""
+        self.quantity[:] = 0.
+        for position in Position.many(data):
+            index = option_index(position.strike, position.order_type)
+            self.quantity[index] += _signed(float(position.quantity), position.order_side)
+        self.recompute()
+
+    def load_chain(self, snapshot):
+        r"""Replace every greek with those of a `ChainSnapshot`."""
+        for (strike, order_type), data in snapshot.greeks.items():
+            greeks = Greeks.from_data(data)
+            self.greeks[option_index(strike, order_type)] = [getattr(greeks, name) or 0.
+                                                             for name in GREEKS]
+        self.recompute()
+
+    def set_margin_rate(self, strike, order_type, order_side, margin):
+        r"""Set the initial margin of one unit of a new order.
+        Arguments:
+        --
+        strike: see `constants.VALID_STRIKE`
+        order_type: see `constants.VALID_ORDER_TYPE`
+        order_side: see `constants.VALID_ORDER_SIDE`
+        margin (float): Initial margin of a one unit order
+        """
+        side = constants.VALID_ORDER_SIDE.index(order_side)
+        self.margin_rates[option_index(strike, order_type), side] = margin
+
+    def recompute(self):
+        r"""Recompute the aggregate exposures from scratch."""
+        self._totals = self.quantity @ self.greeks
+
+    def exposure(self):
+        r"""Net delta, gamma, vega and theta of the portfolio."""
+        return dict(zip(GREEKS, self._totals.tolist()))
+
+    def exposure_by_option(self):
+        r"""Greeks of each position, an array of shape (options, greeks) in
+        `OPTIONS` order."""
+        return self.quantity[:, None] * self.greeks
+
+    def _order_arrays(self, orders):
+        orders = list(orders)
+        indices = np.array([option_index(order['strike'], order['order_type'])
+                            for order in orders], dtype=int)
+        sides = np.array([constants.VALID_ORDER_SIDE.index(order['order_side'])
+                          for order in orders], dtype=int)
+        quantities = np.array([float(order['quantity']) for order in orders])
+        signed = np.where([order['order_side'] == constants.ORDER_SIDE_BUY for order in orders],
+                          quantities, -quantities)
+        return indices, sides, quantities, signed
+
+    def what_if(self, orders, client=None, max_workers=constants.DEFAULT_MAX_WORKERS):
+        r"""Exposures after hypothetical fills of `orders`, and their initial
+        margin. Nothing is changed. Returns `(exposure, margin)`.
+        Without a client, the margin is approximated as quantity times the
+        per-unit margin from `set_margin_rate` or `fetch_margin_rates`. This
+        is linear in quantity, which the exchange's margin need not be, and
+        nan if a rate is missing. With a client, the margin of every order is
+        fetched at its real quantity with `get_initial_margin_new_order`.
+        Arguments:
+        --
+        orders (Iterable[Dict[string, any]]): Keyword arguments of
+            `create_market_order`, i.e. strike, quantity, order_type and
+            order_side
+        client (Optional[PublicClient], default=None): Client used to fetch
+            the exact margin of each order
+        max_workers (integer): Maximum number of requests in flight
+        """
+        orders = list(orders)
+        indices, sides, quantities, signed = self._order_arrays(orders)
+        if not len(indices):
+            return self.exposure(), 0.
+        totals = self._totals + signed @ self.greeks[indices]
+        if client is None:
+            margin = float(quantities @ self.margin_rates[indices, sides])
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(client.get_initial_margin_new_order,
+                                           self.underlying,
+                                           order['strike'],
+                                           order['quantity'],
+                                           order['order_type'],
+                                           order['order_side'],
+                                           )
+                           for order in orders]
+                margin = sum(parse_margin(future.result().data) for future in futures)
+        return dict(zip(GREEKS, totals.tolist())), margin
+
+    def fetch_greeks(self, client, max_workers=constants.DEFAULT_MAX_WORKERS):
+        r"""Load the greeks of the whole chain, fetched concurrently.
+        Arguments:
+        --
+        client (PublicClient): Client used to fetch
+        max_workers (integer): Maximum number of requests in flight
+        """
+        self.load_chain(client.get_chain_snapshot(self.underlying,
+                                                  fields=('greeks',),
+                                                  max_workers=max_workers,
+                                                  ))
+
+    def fetch_positions(self, client):
+        r"""Load positions with `get_positions`.
+        Arguments:
+        --
+        client (PrivateClient): Client of the account
+        """
+        self.load_positions(client.get_positions(self.underlying).data)
+
+    def fetch_margin_rates(self, client, max_workers=constants.DEFAULT_MAX_WORKERS):
+        r"""Load the per-unit initial margin of every option and side with
+        `get_initial_margin_new_order`, fetched concurrently for a quantity of
+        one. A failed request or unreadable payload leaves that rate nan
+        without stopping the others. Returns the errors keyed by
+        `(strike, order_type, order_side)`.
+        Arguments:
+        --
+        client (PublicClient): Client used to fetch
+        max_workers (integer): Maximum number of requests in flight
+        """
+        keys = [(strike, order_type, order_side)
+                for strike, order_type in OPTIONS
+                for order_side in constants.VALID_ORDER_SIDE]
+        errors = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(client.get_initial_margin_new_order,
+                                       self.underlying, strike, 1, order_type, order_side)
+                       for strike, order_type, order_side in keys]
+            for key, future in zip(keys, futures):
+                try:
+                    margin = parse_margin(future.result().data)
+                except Exception as e:
+                    errors[key] = e
+                    margin = np.nan
+                self.set_margin_rate(*key, margin)
+        return errors
+
+    def __repr__(self):
+        return f'Portfolio(underlying={self.underlying}, exposure={self.exposure()})'
@@ -0,0 +1,241 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit
+from pareto import constants
+from pareto.errors import ParetoTimeoutError
+
+# Priority lanes, most urgent first
+LANE_CANCEL = 'cancel'
+LANE_CREATE = 'create'
+LANE_PRIVATE_READ = 'private_read'
+LANE_PUBLIC_READ = 'public_read'
+LANES = (LANE_CANCEL, LANE_CREATE, LANE_PRIVATE_READ, LANE_PUBLIC_READ)
+
+
+def classify(method, uri):
+    r"""Priority lane of a request.
+    Arguments:
+    --
+    method (string): GET or POST
+    uri (string): Full URI or endpoint path
+    """
+    path = urlsplit(uri).path
+    if path.startswith('/user/cancel'):
+        return LANE_CANCEL
+    if method.upper() == 'POST':
+        return LANE_CREATE
+    if path.startswith('/user/'):
+        return LANE_PRIVATE_READ
+    return LANE_PUBLIC_READ
+
+
+class TokenBucket:
+    r"""Token bucket rate limit.
+    Arguments:
+    --
+    rate (float): Tokens added per second
+    burst (integer): Maximum number of tokens
+    """
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate, burst):
+        assert rate > 0 and burst >= 1
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def try_acquire(self, now):
+        r"""Take a token if one is available."""
+        self._refill(now)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def delay(self, now):
+        r"""Seconds until a token is available."""
+        self._refill(now)
+        return max(0., (1 - self.tokens) / self.rate)
+
+
+class _Waiter:
+    __slots__ = ('lane', 'queued', 'admitted', 'event', 'loop', 'future')
+
+    def __init__(self, lane):
+        self.lane = lane
+        self.queued = time.monotonic()
+        self.admitted = False
+        self.event = None
+        self.loop = None
+        self.future = None
+
+    def admit(self):
+        self.admitted = True
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class RequestScheduler:
+    r"""Admission control in front of the transport: a token bucket per lane
+    and strict priority between lanes. A request waits while a more urgent
+    lane has requests that could be sent, so cancels go out first under
+    load. Lanes held back only by their own rate limit do not block lower
+    lanes. Shared by threads and asyncio tasks.
+    Arguments:
+    --
+    limits (Optional[Dict[string, Tuple[float, integer]]], default=None):
+        `(rate per second, burst)` per lane in `LANES`. Lanes without a limit
+        are only bounded by `max_in_flight`
+    max_in_flight (integer): Maximum number of requests sent at once
+    """
+    def __init__(self, limits=None, max_in_flight=constants.DEFAULT_POOL_SIZE):
+        limits = limits or {}
+        assert all(lane in LANES for lane in limits), f'lanes are {LANES}'
+        self.max_in_flight = max_in_flight
+        self._buckets = {lane: TokenBucket(*limit) for lane, limit in limits.items()}
+        self._queues = {lane: deque() for lane in LANES}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._admitted = dict.fromkeys(LANES, 0)
+        self._waited = dict.fromkeys(LANES, 0.)
+        self._max_depth = dict.fromkeys(LANES, 0)
+
+    def _dispatch(self):
+        r"""Admit every waiter that can go now, in priority order. Returns the
+        seconds until a rate-limited waiter could go, or None. Lock held."""
+        now = time.monotonic()
+        retry = None
+        for lane in LANES:
+            queue = self._queues[lane]
+            bucket = self._buckets.get(lane)
+            while queue and self._in_flight < self.max_in_flight:
+                if bucket is not None and not bucket.try_acquire(now):
+                    delay = bucket.delay(now)
+                    retry = delay if retry is None else min(retry, delay)
+                    break
+                waiter = queue.popleft()
+                self._in_flight += 1
+                self._admitted[lane] += 1
+                self._waited[lane] += now - waiter.queued
+                waiter.admit()
+            if queue and self._in_flight >= self.max_in_flight:
+                # Lower lanes wait for the next free slot
+                break
+        return retry
+
+    def _enqueue(self, waiter):
+        queue = self._queues[waiter.lane]
+        queue.append(waiter)
+        self._max_depth[waiter.lane] = max(self._max_depth[waiter.lane], len(queue))
+        return self._dispatch()
+
+    def _abandon(self, waiter):
+        r"""Remove a waiter that gave up. Lock held."""
+        if waiter.admitted:
+            self._in_flight -= 1
+            self._dispatch()
+        else:
+            self._queues[waiter.lane].remove(waiter)
+
+    def acquire(self, lane, timeout=None, uri=None):
+        r"""Block until a request in `lane` may be sent. Pair with `release`.
+        Arguments:
+        --
+        lane (string): One of `LANES`
+        timeout (Optional[float], default=None): Seconds to wait at most
+        uri (Optional[string], default=None): Request URI, for error reporting
+        """
+        waiter = _Waiter(lane)
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            retry = self._enqueue(waiter)
+            if waiter.admitted:
+                return
+            waiter.event = threading.Event()
+        while True:
+            wait = _wait_time(retry, end)
+            waiter.event.wait(wait)
+            with self._lock:
+                if not waiter.admitted:
+                    retry = self._dispatch()
+                if waiter.admitted:
+                    return
+                if end is not None and time.monotonic() >= end:
+                    self._abandon(waiter)
+                    raise ParetoTimeoutError(uri, f'deadline exceeded in {lane} queue')
+
+    async def acquire_async(self, lane, timeout=None, uri=None):
+        r"""Wait until a request in `lane` may be sent. Pair with `release`.
+        Arguments:
+        --
+        lane (string): One of `LANES`
+        timeout (Optional[float], default=None): Seconds to wait at most
+        uri (Optional[string], default=None): Request URI, for error reporting
+        """
+        waiter = _Waiter(lane)
+        end = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            retry = self._enqueue(waiter)
+            if waiter.admitted:
+                return
+            waiter.loop = asyncio.get_running_loop()
+            waiter.future = waiter.loop.create_future()
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(asyncio.shield(waiter.future), _wait_time(retry, end))
+                except asyncio.TimeoutError:
+                    pass
+                with self._lock:
+                    if not waiter.admitted:
+                        retry = self._dispatch()
+                    if waiter.admitted:
+                        return
+                    if end is not None and time.monotonic() >= end:
+                        self._abandon(waiter)
+                        raise ParetoTimeoutError(uri, f'deadline exceeded in {lane} queue')
+        except asyncio.CancelledError:
+            with self._lock:
+                self._abandon(waiter)
+            raise
+
+    def release(self):
+        r"""Mark a request admitted by `acquire` as finished."""
+        with self._lock:
+            self._in_flight -= 1
+            self._dispatch()
+
+    def stats(self):
+        r"""Queue depth and admission metrics per lane."""
+        with self._lock:
+            lanes = {}
+            for lane in LANES:
+                admitted = self._admitted[lane]
+                lanes[lane] = {
+                    'queued': len(self._queues[lane]),
+                    'max_queued': self._max_depth[lane],
+                    'admitted': admitted,
+                    'mean_wait_ms': 1000. * self._waited[lane] / admitted if admitted else 0.,
+                }
+            return {'in_flight': self._in_flight, 'lanes': lanes}
+
+
+def _wait_time(retry, end):
+    if end is None:
+        return retry
+    remaining = max(end - time.monotonic(), 0.)
+    return remaining if retry is None else min(retry, remaining)
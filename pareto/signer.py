@@ -1,18 +1,139 @@
-import time, json
-from simplejson.encoder import JSONEncoderForHTML
+import os, time, json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from eth_account import Account
-from eth_account.messages import encode_defunct
+from eth_keys import KeyAPI
+from eth_keys.backends import NativeECCBackend
+from eth_utils import keccak, to_checksum_address
+
+try:
+    import coincurve
+except ImportError:  # coincurve is an optional dependency
+    coincurve = None
+
+# Prefix of an EIP-191 personal message, as produced by `encode_defunct`
+PERSONAL_MESSAGE_PREFIX = b'\x19Ethereum Signed Message:\n'
+
+
+class NativeBackend:
+    r"""Pure Python ECDSA backend from `eth_keys`.
+    Arguments:
+    --
+    key (bytes): 32 byte private key
+    """
+    def __init__(self, key):
+        self._key = KeyAPI(NativeECCBackend()).PrivateKey(key)
+
+    def sign_hash(self, message_hash):
+        r"""Sign a 32 byte hash. Returns 65 bytes `r || s || v` with v in {0, 1}."""
+        return self._key.sign_msg_hash(message_hash).to_bytes()
+
+
+class CoincurveBackend:
+    r"""libsecp256k1 ECDSA backend. The key context is created once, instead of
+    on every signature as `eth_keys` does.
+    Arguments:
+    --
+    key (bytes): 32 byte private key
+    """
+    def __init__(self, key):
+        assert coincurve is not None, 'coincurve is not installed'
+        self._key = coincurve.PrivateKey(key)
+
+    def sign_hash(self, message_hash):
+        r"""Sign a 32 byte hash. Returns 65 bytes `r || s || v` with v in {0, 1}."""
+        return self._key.sign_recoverable(message_hash, hasher=None)
+
+
+SIGNING_BACKENDS = {
+    'native': NativeBackend,
+    'coincurve': CoincurveBackend,
+}
+
+
+def get_backend(backend=None):
+    r"""Resolve the class of the ECDSA backend used for signing.
+    Arguments:
+    --
+    backend (Optional[string or class], default=None): One of the names in
+        `SIGNING_BACKENDS`, or a class taking the private key bytes and
+        implementing `sign_hash`. If None, coincurve is used when installed.
+    """
+    if backend is None:
+        backend = 'native' if coincurve is None else 'coincurve'
+    if isinstance(backend, str):
+        assert backend in SIGNING_BACKENDS, f'unknown signing backend {backend}'
+        return SIGNING_BACKENDS[backend]
+    return backend
+
+
+def encode_message(method, uri, body_text, timestamp):
+    r"""Build the text that is signed for a request.
+    Byte-identical to encoding the message with simplejson's
+    `JSONEncoderForHTML(separators=(',', ':'))`.
+    Arguments:
+    --
+    method (string): GET or POST
+    uri (string): Endpoint path e.g. /ping
+    body_text (string): Body of the request, already JSON encoded
+    timestamp (integer): Timestamp of the request
+    """
+    message = {
+        'method': method,
+        'requestPath': uri,
+        'body': body_text,
+        'timestamp': timestamp,
+    }
+    text = json.dumps(message, separators=(',', ':'))
+    return text.replace('&', '\\u0026').replace('<', '\\u003c').replace('>', '\\u003e')
+
+
+def hash_message(method, uri, body_text, timestamp):
+    r"""EIP-191 hash of the message signed for a request, see `encode_message`."""
+    text = encode_message(method, uri, body_text, timestamp).encode('utf-8')
+    # https://eips.ethereum.org/EIPS/eip-191 (version 0x45)
+    return keccak(PERSONAL_MESSAGE_PREFIX + str(len(text)).encode() + text)
+
+
+def recover_address(message_hash, signature):
+    r"""Checksum address of the key that produced a signature.
+    Arguments:
+    --
+    message_hash (bytes): 32 byte hash that was signed
+    signature (string): Hex signature with v in {27, 28}, as made by `Signer`
+    """
+    signature = bytes.fromhex(signature[2:] if signature.startswith('0x') else signature)
+    assert len(signature) == 65, 'signature must be 65 bytes'
+    signature = signature[:64] + bytes([signature[64] - 27])
+    if coincurve is not None:
+        public_key = coincurve.PublicKey.from_signature_and_message(signature,
+                                                                    message_hash,
+                                                                    hasher=None,
+                                                                    )
+        public_key = public_key.format(compressed=False)[1:]
+    else:
+        public_key = (KeyAPI(NativeECCBackend()).Signature(signature)
+                      .recover_public_key_from_msg_hash(message_hash).to_bytes())
+    return to_checksum_address(keccak(public_key)[-20:])
 
 
 class Signer:
     r"""Sign with private key.
+    The key is parsed once at construction. Signatures are computed directly
+    over the EIP-191 message hash, matching `Account.sign_message`.
     Arguments:
     --
     private_key (string): Private key
+    backend (Optional[string or class], default=None): ECDSA backend, see
+        `get_backend`
     """
-    def __init__(self, private_key):
-        self.address = Account.from_key(private_key).address
+    def __init__(self, private_key, backend=None):
+        account = Account.from_key(private_key)
+        self.address = account.address
+        self.backend = get_backend(backend)
         self._private_key = private_key
+        self._key = self.backend(account.key)
+        self.pool = None
 
     def sign(self,
              method,
@@ -28,23 +149,174 @@ class Signer:
         body (Object): Body of the request
         timestamp (integer): Timestamp of the request
         """
-        body = json.dumps(body)
-        # https://eth-account.readthedocs.io/en/stable/eth_account.html#eth_account.account.Account.sign_message
-        message = {
-            'method': method,
-            'requestPath': uri,
-            'body': body,
-            'timestamp': timestamp,
-        }
-        text = JSONEncoderForHTML(separators=(',', ':')).encode(message)
-        message_hash = encode_defunct(text=text)
-        signed_message = Account.sign_message(message_hash, self._private_key)
-        return signed_message.signature.hex()
-
-    def add_headers(self, method, uri, body, header={},):
+        return self.sign_encoded(method, uri, json.dumps(body), timestamp)
+
+    def sign_encoded(self,
+                     method,
+                     uri,
+                     body_text,
+                     timestamp,
+                     ):
+        r"""Sign a message whose body is already JSON encoded. Sending exactly
+        `body_text` on the wire guarantees the signed and sent bodies match.
+        Arguments:
+        --
+        method (string): GET or POST
+        uri (string): Endpoint path e.g. /ping
+        body_text (string): Body of the request, already JSON encoded
+        timestamp (integer): Timestamp of the request
+        """
+        signature = self._key.sign_hash(hash_message(method, uri, body_text, timestamp))
+        # Ethereum convention is v in {27, 28} rather than {0, 1}
+        return '0x' + signature[:64].hex() + '{:02x}'.format(signature[64] + 27)
+
+    def sign_batch(self, items):
+        r"""Sign many messages, in order.
+        Arguments:
+        --
+        items (Iterable[tuple]): `(method, uri, body_text, timestamp)` tuples
+            with JSON encoded bodies
+        """
+        return [self.sign_encoded(*item) for item in items]
+
+    def start_pool(self, max_workers=None, processes=True):
+        r"""Attach a `SignerPool` used by `iter_headers` and `add_headers_batch`.
+        Single requests through `add_headers` keep signing inline.
+        Arguments:
+        --
+        max_workers (Optional[integer], default=None): Number of workers,
+            defaults to the number of cores
+        processes (boolean, default=True): Sign in spawned worker processes,
+            which each receive a copy of the private key, see `SignerPool`.
+            Use threads instead only with a backend that releases the GIL
+        """
+        self.stop_pool()
+        self.pool = SignerPool(self, max_workers=max_workers, processes=processes)
+        return self.pool
+
+    def stop_pool(self):
+        r"""Shut down the attached pool, if any."""
+        if self.pool is not None:
+            self.pool.shutdown()
+        self.pool = None
+
+    def add_headers(self, method, uri, body, header=None,):
+        return self.add_encoded_headers(method, uri, json.dumps(body), header)
+
+    def add_encoded_headers(self, method, uri, body_text, header=None):
+        r"""Add authentication headers for a request whose body is already
+        JSON encoded.
+        Arguments:
+        --
+        method (string): GET or POST
+        uri (string): Endpoint path e.g. /ping
+        body_text (string): Body of the request, already JSON encoded
+        header (Optional[Dict[string, any]], default=None): Headers to extend
+        """
+        if header is None:
+            header = {}
+        timestamp = int(time.time())
+        signature = self.sign_encoded(method, uri, body_text, timestamp)
+        return self._make_headers(signature, timestamp, header)
+
+    def iter_headers(self, requests):
+        r"""Yield signed headers for many requests, in order.
+        With a pool attached every request is handed to the workers up front;
+        otherwise each request is signed lazily as the iterator advances, so
+        callers can overlap signing with sending.
+        Arguments:
+        --
+        requests (Iterable[tuple]): `(method, uri, body_text)` or
+            `(method, uri, body_text, header)` tuples with JSON encoded bodies
+        """
+        if self.pool is None:
+            for request in requests:
+                yield self.add_encoded_headers(*request)
+            return
+
+        requests = [tuple(request) + ({},) * (4 - len(request)) for request in requests]
+        if len(requests) <= 1:
+            # Not worth a round trip to the workers
+            for request in requests:
+                yield self.add_encoded_headers(*request)
+            return
+
         timestamp = int(time.time())
-        signature = self.sign(method, uri, body, timestamp)
+        items = [(method, uri, body_text, timestamp) for method, uri, body_text, _ in requests]
+        signatures = self.pool.map(items)
+        for (_, _, _, header), signature in zip(requests, signatures):
+            yield self._make_headers(signature, timestamp, header)
+
+    def add_headers_batch(self, requests):
+        r"""Signed headers for many requests, in order. See `iter_headers`."""
+        return list(self.iter_headers(requests))
+
+    def _make_headers(self, signature, timestamp, header):
         header['pareto-ethereum-address'] = self.address
         header['pareto-signature'] = signature
         header['pareto-timestamp'] = str(timestamp)
         return header
+
+
+# Signer owned by each worker process of a `SignerPool`
+_worker_signer = None
+
+
+def _init_worker(private_key, backend):
+    global _worker_signer
+    _worker_signer = Signer(private_key, backend=backend)
+
+
+def _sign_batch_in_worker(items):
+    return _worker_signer.sign_batch(items)
+
+
+class SignerPool:
+    r"""Workers signing requests in parallel for one key.
+    Work is split into one chunk per worker so that inter-process overhead is
+    paid per chunk rather than per signature. Process workers are spawned,
+    never forked, so they do not inherit the locks of the transport,
+    scheduler or poller threads of the parent. Each receives the raw private
+    key once, pickled over a pipe when it starts, and holds it in memory for
+    its lifetime: use `processes=False` where the key must stay in one process.
+    Arguments:
+    --
+    signer (Signer): Signer whose key and backend the workers use
+    max_workers (Optional[integer], default=None): Number of workers, defaults
+        to the number of cores
+    processes (boolean, default=True): Use processes rather than threads
+    """
+    def __init__(self, signer, max_workers=None, processes=True):
+        self.signer = signer
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.processes = processes
+        if processes:
+            self._executor = ProcessPoolExecutor(self.max_workers,
+                                                 mp_context=multiprocessing.get_context('spawn'),
+                                                 initializer=_init_worker,
+                                                 initargs=(signer._private_key,
+                                                           signer.backend),
+                                                 )
+        else:
+            self._executor = ThreadPoolExecutor(self.max_workers)
+
+    def map(self, items):
+        r"""Yield signatures for `(method, uri, body_text, timestamp)` tuples,
+        in order.
+        Arguments:
+        --
+        items (List[tuple]): Messages to sign
+        """
+        size = -(-len(items) // self.max_workers)
+        chunks = [items[i:i + size] for i in range(0, len(items), size)]
+        if self.processes:
+            futures = [self._executor.submit(_sign_batch_in_worker, chunk)
+                       for chunk in chunks]
+        else:
+            futures = [self._executor.submit(self.signer.sign_batch, chunk)
+                       for chunk in chunks]
+        for future in futures:
+            yield from future.result()
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
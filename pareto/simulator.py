@@ -0,0 +1,406 @@
+r"""Local simulated Pareto exchange, for offline order flow, load and latency
+testing. Serves the routes of `PublicClient` and `PrivateClient` over HTTP,
+verifies the `pareto-signature` headers, and matches orders with
+`MatchingEngine`. Accounts are created on first use with `balance`; margin
+is simplified to the premium of open buy orders.
+Usage:
+--
+with SimulatedExchange(latency=2) as exchange:
+    client = Client(host=exchange.url, eth_private_key='0x...')
+    client.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5, ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+For load tests, run it in its own process so it does not share the GIL with
+the client: `python -m pareto.simulator --port 8080 --latency 2`.
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs, urlsplit
+from pareto import constants
+from pareto.matching import MatchingEngine, to_units, from_units
+from pareto.signer import hash_message, recover_address
+
+SIGNATURE_HEADERS = ('pareto-ethereum-address', 'pareto-signature', 'pareto-timestamp')
+
+
+class SimulationError(Exception):
+    r"""Request rejected by the simulated exchange.
+    Arguments:
+    --
+    status (integer): HTTP status of the response
+    message (string): Error message
+    """
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _flag(value):
+    if isinstance(value, bool):
+        return value
+    if str(value).lower() in ('true', '1'):
+        return True
+    if str(value).lower() in ('false', '0'):
+        return False
+    raise SimulationError(400, f'invalid boolean {value!r}')
+
+
+class Account:
+    r"""Balance and positions of one address.
+    Arguments:
+    --
+    balance (float): Starting cash balance
+    """
+    def __init__(self, balance):
+        self.balance = balance
+        # (strike, order_type) -> [signed quantity in hundredths, average price]
+        self.positions = {}
+
+    def trade(self, strike, order_type, order_side, price, quantity):
+        r"""Apply a fill, prices and quantities in hundredths."""
+        signed = quantity if order_side == constants.ORDER_SIDE_BUY else -quantity
+        self.balance -= from_units(price) * from_units(signed)
+        held, average = self.positions.get((strike, order_type), (0, 0.))
+        total = held + signed
+        if not total:
+            self.positions.pop((strike, order_type), None)
+            return
+        if held == 0 or (held > 0) != (total > 0):
+            average = from_units(price)
+        elif abs(total) > abs(held):
+            average = (average * abs(held) + from_units(price) * quantity) / abs(total)
+        self.positions[(strike, order_type)] = (total, average)
+
+
+class Exchange:
+    r"""Simulated exchange state: one matching engine per underlying and the
+    accounts trading on it. Requests are handled under one lock.
+    Arguments:
+    --
+    balance (float): Starting balance of every account
+    mark (Dict[string, List[float]], optional): Mark prices of calls and puts
+        by strike, used where a book has no mid price
+    """
+    def __init__(self, balance=10000., mark=None):
+        self.balance = balance
+        self.engines = {underlying: MatchingEngine() for underlying in constants.VALID_UNDERLYING}
+        self.accounts = {}
+        self.mark = mark or {
+            'calls': [50. - 4. * i for i in range(len(constants.VALID_STRIKE))],
+            'puts': [10. + 4. * i for i in range(len(constants.VALID_STRIKE))],
+        }
+        self.lock = threading.Lock()
+
+    def account(self, address):
+        account = self.accounts.get(address)
+        if account is None:
+            account = self.accounts[address] = Account(self.balance)
+        return account
+
+    def engine(self, underlying):
+        engine = self.engines.get(int(underlying))
+        if engine is None:
+            raise SimulationError(404, f'unknown underlying {underlying}')
+        return engine
+
+    def margin(self, underlying, address):
+        return sum(from_units(order.price) * from_units(order.remaining)
+                   for order in self.engine(underlying).open_orders(address)
+                   if order.order_side == constants.ORDER_SIDE_BUY)
+
+    def available(self, underlying, address):
+        return self.account(address).balance - self.margin(underlying, address)
+
+    def create(self, underlying, address, body, limit):
+        try:
+            strike = int(body['strike'])
+            order_type = _flag(body['isCall'])
+            order_side = _flag(body['isBuy'])
+            quantity = to_units(body['quantity'])
+            price = to_units(body['price']) if limit else None
+        except (KeyError, TypeError, ValueError) as e:
+            raise SimulationError(400, f'invalid order: {e}')
+        if strike not in constants.VALID_STRIKE or quantity <= 0 or (limit and price <= 0):
+            raise SimulationError(400, 'invalid order')
+        if limit and order_side == constants.ORDER_SIDE_BUY:
+            cost = from_units(price) * from_units(quantity)
+            if cost > self.available(underlying, address):
+                raise SimulationError(400, 'insufficient balance')
+        order, fills = self.engine(underlying).submit(address, strike, order_type, order_side,
+                                                      quantity, price)
+        for fill in fills:
+            for resting in (fill.maker, fill.taker):
+                self.account(resting.owner).trade(strike, order_type, resting.order_side,
+                                                  fill.price, fill.quantity)
+        return order.to_data()
+
+    def cancel(self, underlying, address, ids):
+        engine = self.engine(underlying)
+        return [id for id in ids if engine.cancel(id, address) is not None]
+
+    def get_order(self, underlying, address, id):
+        order = self.engine(underlying).orders.get(id)
+        if order is None or order.owner != address:
+            raise SimulationError(404, f'no open order {id}')
+        return order.to_data()
+
+    def get_mark(self, underlying):
+        engine = self.engine(underlying)
+        mark = {'calls': list(self.mark['calls']), 'puts': list(self.mark['puts'])}
+        for (strike, order_type), book in engine.books.items():
+            mid = book.mid()
+            if mid is not None:
+                mark['calls' if order_type else 'puts'][strike] = from_units(mid)
+        return mark
+
+    def get_depth(self, underlying, strike, order_type, levels=None):
+        book = self.engine(underlying).book(strike, order_type)
+        return {
+            'bids': [{'price': from_units(price), 'quantity': from_units(quantity)}
+                     for price, quantity in book.bids.depth(levels)],
+            'asks': [{'price': from_units(price), 'quantity': from_units(quantity)}
+                     for price, quantity in book.asks.depth(levels)],
+        }
+
+    def get_positions(self, underlying, address):
+        self.engine(underlying)
+        return [{
+            'strike': strike,
+            'quantity': from_units(abs(quantity)),
+            'price': average,
+            'isCall': order_type,
+            'isBuy': quantity > 0,
+        } for (strike, order_type), (quantity, average) in self.account(address).positions.items()]
+
+    def get_open_interest(self, underlying, address, strike, order_type, order_side):
+        self.engine(underlying)
+        quantity, _ = self.account(address).positions.get((strike, order_type), (0, 0.))
+        held = quantity if order_side == constants.ORDER_SIDE_BUY else -quantity
+        return {'openInterest': from_units(max(held, 0))}
+
+
+def _expiry():
+    # Three days from now, in ms
+    return int((time.time() + 3 * 24 * 3600) * 1000)
+
+
+def _query(query, name, parse=int):
+    try:
+        return parse(query[name][0])
+    except (KeyError, ValueError, SimulationError):
+        raise SimulationError(400, f'invalid or missing query parameter {name}')
+
+
+def _option(query):
+    return _query(query, 'strike'), _query(query, 'isCall', _flag)
+
+
+# (method, pattern, private, handler(exchange, match, query, body, address))
+ROUTES = [
+    ('GET', r'/ping', False, lambda x, m, q, b, a: {'pong': True}),
+    ('GET', r'/public/depth/(\d+)', False,
+     lambda x, m, q, b, a: x.get_depth(m[1], *_option(q))),
+    ('GET', r'/public/expiry/(\d+)', False, lambda x, m, q, b, a: {'expiry': _expiry()}),
+    ('GET', r'/public/sigma/(\d+)', False, lambda x, m, q, b, a: {'sigma': 0.8}),
+    ('GET', r'/public/price/market/(\d+)', False, lambda x, m, q, b, a: {'price': 1500.}),
+    ('GET', r'/public/price/strikes/(\d+)', False,
+     lambda x, m, q, b, a: {'strikes': [1000. + 100. * i for i in constants.VALID_STRIKE]}),
+    ('GET', r'/public/price/mark/(\d+)', False, lambda x, m, q, b, a: x.get_mark(m[1])),
+    ('GET', r'/public/price/greeks/(\d+)', False,
+     lambda x, m, q, b, a: {'delta': 0.5, 'gamma': 0.001, 'vega': 1.5, 'theta': -0.2}),
+    ('GET', r'/public/price/breakeven/(\d+)', False, lambda x, m, q, b, a: {'breakeven': 1510.}),
+    ('GET', r'/public/price/margin/(\d+)', False, lambda x, m, q, b, a: {'margin': 150.}),
+    ('GET', r'/user/order/(\d+)/([\w-]+)', True, lambda x, m, q, b, a: x.get_order(m[1], a, m[2])),
+    ('GET', r'/user/orders/(\d+)', True,
+     lambda x, m, q, b, a: [order.to_data() for order in x.engine(m[1]).open_orders(a)]),
+    ('GET', r'/user/positions/(\d+)', True, lambda x, m, q, b, a: x.get_positions(m[1], a)),
+    ('GET', r'/user/openinterest/(\d+)', True,
+     lambda x, m, q, b, a: x.get_open_interest(m[1], a, *_option(q), _query(q, 'isBuy', _flag))),
+    ('GET', r'/user/availbalance/(\d+)', True,
+     lambda x, m, q, b, a: {'balance': x.available(m[1], a)}),
+    ('GET', r'/user/accountinfo/(\d+)', True,
+     lambda x, m, q, b, a: {'balance': x.account(a).balance, 'margin': x.margin(m[1], a)}),
+    ('POST', r'/user/create/market/(\d+)', True,
+     lambda x, m, q, b, a: x.create(m[1], a, b, False)),
+    ('POST', r'/user/create/limit/(\d+)', True,
+     lambda x, m, q, b, a: x.create(m[1], a, b, True)),
+    ('POST', r'/user/cancel/batch/(\d+)', True,
+     lambda x, m, q, b, a: {'cancelled': x.cancel(m[1], a, list(b.get('ids') or []))}),
+    ('POST', r'/user/cancel/all/(\d+)', True,
+     lambda x, m, q, b, a: {'cancelled': x.cancel(m[1], a, [
+         o.id for o in x.engine(m[1]).open_orders(a)])}),
+    ('POST', r'/user/cancel/(\d+)/([\w-]+)', True,
+     lambda x, m, q, b, a: {'cancelled': x.cancel(m[1], a, [m[2]])}),
+]
+COMPILED_ROUTES = [(method, re.compile(pattern + r'$'), private, handler)
+                   for method, pattern, private, handler in ROUTES]
+
+
+class SimulatorHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, avoid delayed ACK stalls
+    disable_nagle_algorithm = True
+
+    def _respond(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _authenticate(self, method, body_text):
+        r"""Address of the verified signer of this request."""
+        if not all(self.headers.get(header) for header in SIGNATURE_HEADERS):
+            raise SimulationError(401, 'missing signature')
+        address = self.headers['pareto-ethereum-address']
+        if not self.server.verify:
+            return address
+        try:
+            timestamp = int(self.headers['pareto-timestamp'])
+            message_hash = hash_message(method, self.path, body_text, timestamp)
+            signer = recover_address(message_hash, self.headers['pareto-signature'])
+        except (AssertionError, ValueError):
+            raise SimulationError(401, 'malformed signature')
+        if signer != address:
+            raise SimulationError(401, 'invalid signature')
+        if abs(time.time() - timestamp) * 1000. > self.server.max_age:
+            raise SimulationError(401, 'signature expired')
+        return address
+
+    def _handle(self, method):
+        length = int(self.headers.get('Content-Length', 0))
+        raw = self.rfile.read(length) if length else b''
+        parts = urlsplit(self.path)
+        delay = self.server.delay(method, parts.path)
+        if delay:
+            time.sleep(delay / 1000.)
+        try:
+            for route_method, pattern, private, handler in COMPILED_ROUTES:
+                match = pattern.match(parts.path)
+                if route_method != method or match is None:
+                    continue
+                body_text = raw.decode('utf-8')
+                address = self._authenticate(method, body_text) if private else None
+                try:
+                    body = json.loads(body_text) if body_text else {}
+                except ValueError:
+                    raise SimulationError(400, 'invalid JSON body')
+                with self.server.exchange.lock:
+                    payload = handler(self.server.exchange, match, parse_qs(parts.query),
+                                      body, address)
+                return self._respond(200, payload)
+            raise SimulationError(404, f'no route for {method} {parts.path}')
+        except SimulationError as e:
+            self._respond(e.status, {'error': e.message})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def log_message(self, *args):
+        pass
+
+
+class _ThreadingServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+
+class SimulatedExchange:
+    r"""Simulated exchange served on a background thread.
+    Arguments:
+    --
+    host (string, default='127.0.0.1'): Interface to bind
+    port (integer, default=0): Port to bind, 0 for any free port
+    latency (float or Callable[[string, string], float], default=0): Number
+        of ms added before every response, or a function of the method and
+        path returning it
+    jitter (float, default=0): Maximum number of ms added at random
+    verify (boolean, default=True): Verify request signatures. Otherwise only
+        their presence is checked
+    max_age (integer): Number of ms after which a signature is rejected
+    balance (float): Starting balance of every account
+    """
+    def __init__(self,
+                 host='127.0.0.1',
+                 port=0,
+                 latency=0,
+                 jitter=0,
+                 verify=True,
+                 max_age=constants.DEFAULT_SIGNATURE_MAX_AGE,
+                 balance=10000.,
+                 ):
+        self.exchange = Exchange(balance=balance)
+        self.latency = latency
+        self.jitter = jitter
+        self._server = _ThreadingServer((host, port), SimulatorHandler)
+        self._server.exchange = self.exchange
+        self._server.verify = verify
+        self._server.max_age = max_age
+        self._server.delay = self.delay
+        self._thread = None
+
+    def delay(self, method, path):
+        r"""Number of ms to wait before answering a request."""
+        latency = self.latency(method, path) if callable(self.latency) else self.latency
+        if self.jitter:
+            latency += random.uniform(0, self.jitter)
+        return latency
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a simulated Pareto exchange')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0., help='Added latency in ms')
+    parser.add_argument('--jitter', type=float, default=0., help='Random extra latency in ms')
+    parser.add_argument('--no-verify', action='store_true', help='Skip signature verification')
+    parser.add_argument('--balance', type=float, default=10000.)
+    args = parser.parse_args()
+    exchange = SimulatedExchange(args.host,
+                                 args.port,
+                                 latency=args.latency,
+                                 jitter=args.jitter,
+                                 verify=not args.no_verify,
+                                 balance=args.balance,
+                                 )
+    print(f'Serving on {exchange.url}')
+    try:
+        exchange._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        exchange._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    r"""Coalesce identical in-flight requests.
+    The first caller for a key performs the request; callers arriving with
+    the same key while it is in flight wait for it and receive the same
+    response, or the same exception. Once it completes the key is released,
+    so later callers send a fresh request. Shared responses are the same
+    object, so callers must not mutate `response.data`.
+    """
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._futures = {}
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        r"""Call a blocking request function, or join an identical call in flight.
+        Arguments:
+        --
+        key (Hashable): Identity of the request, e.g. its full URI
+        fn (Callable[[], Response]): Sends the request
+        """
+        with self._lock:
+            self.calls += 1
+            future = self._futures.get(key)
+            leader = future is None
+            if leader:
+                future = self._futures[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as error:
+            self._release(self._futures, key)
+            future.set_exception(error)
+            raise
+        self._release(self._futures, key)
+        future.set_result(result)
+        return result
+
+    async def do_async(self, key, fn):
+        r"""Await a request coroutine, or join an identical call in flight.
+        The request runs as its own task, so cancelling one waiter does not
+        cancel it for the others.
+        Arguments:
+        --
+        key (Hashable): Identity of the request, e.g. its full URI
+        fn (Callable[[], Awaitable[Response]]): Creates the request coroutine
+        """
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self.calls += 1
+            task = self._tasks.get((loop, key))
+            if task is None:
+                task = self._tasks[(loop, key)] = loop.create_task(fn())
+                task.add_done_callback(lambda _: self._release(self._tasks, (loop, key)))
+            else:
+                self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def _release(self, flights, key):
+        with self._lock:
+            flights.pop(key, None)
+
+    def stats(self):
+        r"""Counters for monitoring coalescing."""
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'coalesced': self.coalesced,
+                'in_flight': len(self._futures) + len(self._tasks),
+            }
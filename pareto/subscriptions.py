@@ -0,0 +1,383 @@
+import asyncio
+import hashlib
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from pareto import constants
+
+# Sentinel pushed to subscribers when their subscription is closed
+_CLOSED = object()
+
+
+def content_hash(response):
+    r"""Digest of the raw response body, so unchanged payloads are detected
+    without decoding them."""
+    raw = response.raw if response.raw is not None else repr(response.data).encode()
+    return hashlib.blake2b(raw, digest_size=16).digest()
+
+
+class Topic:
+    r"""One polled endpoint, shared by every subscription to it. The polling
+    interval drops to `min_interval` whenever the payload changes and backs
+    off geometrically towards `max_interval` while it does not. With several
+    subscribers, the tightest of their settings apply, see `tune`.
+    Arguments:
+    --
+    key (tuple): Identity of the polled endpoint and arguments
+    fetch (Callable[[], Response]): Polls the endpoint
+    min_interval (integer): Fastest polling interval in ms
+    max_interval (integer): Slowest polling interval in ms
+    backoff (float): Factor applied to the interval after an unchanged poll
+    """
+    def __init__(self, key, fetch, min_interval, max_interval, backoff):
+        assert 0 < min_interval <= max_interval
+        assert backoff >= 1
+        self.key = key
+        self.fetch = fetch
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.interval = min_interval
+        self.digest = None
+        self.last = None
+        self.subscribers = []
+        self.polls = 0
+        self.changes = 0
+        self.errors = 0
+
+    def observe(self, response):
+        r"""Update the interval from a poll result. Returns True if the payload changed."""
+        self.polls += 1
+        digest = content_hash(response)
+        if digest == self.digest:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+            return False
+        self.digest = digest
+        self.changes += 1
+        self.interval = self.min_interval
+        return True
+
+    def failed(self):
+        self.polls += 1
+        self.errors += 1
+        self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def tune(self, settings):
+        r"""Poll as often as the most demanding subscriber asks: the smallest
+        `min_interval`, `max_interval` and `backoff` of `settings`.
+        Arguments:
+        --
+        settings (Iterable[Tuple[integer, integer, float]]): `(min_interval,
+            max_interval, backoff)` of every subscriber
+        """
+        settings = list(settings)
+        self.min_interval = min(setting[0] for setting in settings)
+        self.max_interval = min(setting[1] for setting in settings)
+        self.backoff = min(setting[2] for setting in settings)
+        self.interval = min(max(self.interval, self.min_interval), self.max_interval)
+
+    def stats(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'interval': self.interval,
+            'polls': self.polls,
+            'changes': self.changes,
+            'errors': self.errors,
+        }
+
+
+def _unwrap(item, stop):
+    if item is _CLOSED:
+        raise stop
+    if isinstance(item, BaseException):
+        raise item
+    return item
+
+
+class Subscription:
+    r"""Iterator over changed responses of one topic. Only the latest
+    `max_pending` updates are kept if the consumer falls behind. Poll errors
+    are raised from `next` and iteration can continue afterwards.
+    Arguments:
+    --
+    scheduler (PollScheduler): Scheduler polling the topic
+    topic (Topic): Polled endpoint
+    max_pending (integer): Maximum number of undelivered updates
+    """
+    def __init__(self, scheduler, topic, max_pending=1):
+        self.scheduler = scheduler
+        self.topic = topic
+        # (min_interval, max_interval, backoff) asked for by this subscriber
+        self.polling = (topic.min_interval, topic.max_interval, topic.backoff)
+        self._pending = deque(maxlen=max_pending)
+        self._ready = threading.Condition()
+        self.closed = False
+
+    def _push(self, item):
+        with self._ready:
+            self._pending.append(item)
+            self._ready.notify()
+
+    def get(self, timeout=None):
+        r"""Next changed response. Raises `StopIteration` once closed.
+        Arguments:
+        --
+        timeout (Optional[float], default=None): Seconds to wait, raises
+            `TimeoutError` when exceeded
+        """
+        with self._ready:
+            if not self._ready.wait_for(lambda: self._pending, timeout):
+                raise TimeoutError('no update within timeout')
+            item = self._pending[0]
+            # Keep the sentinel so later calls stop too
+            if item is not _CLOSED:
+                self._pending.popleft()
+        return _unwrap(item, StopIteration)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        return self.get()
+
+    def close(self):
+        r"""Stop receiving updates. The topic stops being polled when its last
+        subscription is closed."""
+        if not self.closed:
+            self.closed = True
+            self.scheduler.unsubscribe(self)
+            self._push(_CLOSED)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PollScheduler:
+    r"""Polls every subscribed topic from one scheduling thread, running the
+    requests on a small pool. Identical subscriptions share one topic, so
+    each endpoint is polled once however many consumers it has.
+    Arguments:
+    --
+    max_workers (integer): Maximum number of polls in flight
+    """
+    def __init__(self, max_workers=constants.DEFAULT_MAX_WORKERS):
+        self.max_workers = max_workers
+        self._topics = {}
+        self._heap = []
+        self._sequence = itertools.count()
+        self._wakeup = threading.Condition()
+        self._executor = None
+        self._thread = None
+        self._closed = False
+
+    def subscribe(self,
+                  key,
+                  fetch,
+                  min_interval=constants.DEFAULT_MIN_POLL_INTERVAL,
+                  max_interval=constants.DEFAULT_MAX_POLL_INTERVAL,
+                  backoff=1.5,
+                  max_pending=1,
+                  ):
+        r"""Subscribe to changes of a polled endpoint. Subscriptions with the
+        same key share one topic, polled with the tightest of their intervals
+        and backoffs.
+        Arguments:
+        --
+        key (tuple): Identity of the endpoint and arguments
+        fetch (Callable[[], Response]): Polls the endpoint
+        min_interval (integer): Fastest polling interval in ms
+        max_interval (integer): Slowest polling interval in ms
+        backoff (float, default=1.5): Interval growth after an unchanged poll
+        max_pending (integer, default=1): Updates kept for a slow consumer
+        """
+        assert 0 < min_interval <= max_interval
+        assert backoff >= 1
+        with self._wakeup:
+            assert not self._closed, 'scheduler is closed'
+            topic = self._topics.get(key)
+            if topic is None:
+                topic = self._topics[key] = Topic(key, fetch, min_interval, max_interval, backoff)
+                self._schedule(topic, time.monotonic())
+            subscription = self._subscription(topic, max_pending)
+            subscription.polling = (min_interval, max_interval, backoff)
+            topic.subscribers.append(subscription)
+            topic.tune(s.polling for s in topic.subscribers)
+            if topic.last is not None:
+                # Late subscribers start from the latest known payload
+                subscription._push(topic.last)
+            self._start()
+            self._wakeup.notify()
+        return subscription
+
+    def _subscription(self, topic, max_pending):
+        return Subscription(self, topic, max_pending)
+
+    def unsubscribe(self, subscription):
+        with self._wakeup:
+            topic = subscription.topic
+            if subscription in topic.subscribers:
+                topic.subscribers.remove(subscription)
+            if topic.subscribers:
+                topic.tune(s.polling for s in topic.subscribers)
+            elif self._topics.get(topic.key) is topic:
+                del self._topics[topic.key]
+
+    def _schedule(self, topic, due):
+        heapq.heappush(self._heap, (due, next(self._sequence), topic))
+
+    def _start(self):
+        if self._thread is None:
+            self._executor = ThreadPoolExecutor(self.max_workers)
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._wakeup:
+                while not self._closed:
+                    if self._heap and self._heap[0][0] <= time.monotonic():
+                        break
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._wakeup.wait(timeout)
+                if self._closed:
+                    return
+                _, _, topic = heapq.heappop(self._heap)
+                if self._topics.get(topic.key) is not topic:
+                    continue
+            self._executor.submit(self._poll, topic)
+
+    def _poll(self, topic):
+        try:
+            response = topic.fetch()
+        except Exception as error:
+            topic.failed()
+            update = error
+        else:
+            update = response if topic.observe(response) else None
+        with self._wakeup:
+            if update is not None and not isinstance(update, Exception):
+                topic.last = update
+            subscribers = list(topic.subscribers)
+            if self._topics.get(topic.key) is topic and not self._closed:
+                self._schedule(topic, time.monotonic() + topic.interval / 1000.)
+                self._wakeup.notify()
+        if update is not None:
+            for subscription in subscribers:
+                subscription._push(update)
+
+    def stats(self):
+        r"""Polling statistics of each topic, keyed by topic key."""
+        with self._wakeup:
+            return {key: topic.stats() for key, topic in self._topics.items()}
+
+    def close(self):
+        r"""Stop polling and close every subscription."""
+        with self._wakeup:
+            self._closed = True
+            subscriptions = [s for topic in self._topics.values() for s in topic.subscribers]
+            self._wakeup.notify()
+        for subscription in subscriptions:
+            subscription.close()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+
+
+class AsyncSubscription(Subscription):
+    r"""Async iterator over changed responses of one topic, see `Subscription`.
+    Use as `async for response in subscription`.
+    """
+    def __init__(self, scheduler, topic, max_pending=1):
+        super().__init__(scheduler, topic, max_pending)
+        self._event = asyncio.Event()
+
+    def _push(self, item):
+        self._pending.append(item)
+        self._event.set()
+
+    async def get(self, timeout=None):
+        r"""Next changed response. Raises `StopAsyncIteration` once closed.
+        Arguments:
+        --
+        timeout (Optional[float], default=None): Seconds to wait, raises
+            `asyncio.TimeoutError` when exceeded
+        """
+        while not self._pending:
+            self._event.clear()
+            await asyncio.wait_for(self._event.wait(), timeout)
+        item = self._pending[0]
+        if item is not _CLOSED:
+            self._pending.popleft()
+        return _unwrap(item, StopAsyncIteration)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        return await self.get()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+
+
+class AsyncPollScheduler(PollScheduler):
+    r"""Asyncio version of `PollScheduler`: each topic is polled by one task
+    on the running event loop, with at most `max_workers` polls in flight.
+    Subscribe from within the event loop.
+    Arguments:
+    --
+    max_workers (integer): Maximum number of polls in flight
+    """
+    def __init__(self, max_workers=constants.DEFAULT_MAX_WORKERS):
+        super().__init__(max_workers)
+        self._tasks = {}
+        self._semaphore = None
+
+    def _subscription(self, topic, max_pending):
+        return AsyncSubscription(self, topic, max_pending)
+
+    def _schedule(self, topic, due):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        self._tasks[topic.key] = asyncio.get_running_loop().create_task(self._poll_loop(topic))
+
+    def _start(self):
+        pass
+
+    async def _poll_loop(self, topic):
+        while self._topics.get(topic.key) is topic:
+            async with self._semaphore:
+                try:
+                    response = await topic.fetch()
+                except Exception as error:
+                    topic.failed()
+                    update = error
+                else:
+                    update = response if topic.observe(response) else None
+            if update is not None:
+                if not isinstance(update, Exception):
+                    topic.last = update
+                for subscription in list(topic.subscribers):
+                    subscription._push(update)
+            await asyncio.sleep(topic.interval / 1000.)
+
+    def unsubscribe(self, subscription):
+        super().unsubscribe(subscription)
+        key = subscription.topic.key
+        if key not in self._topics and key in self._tasks:
+            self._tasks.pop(key).cancel()
+
+    def close(self):
+        r"""Stop polling and close every subscription."""
+        super().close()
+        for task in self._tasks.values():
+            task.cancel()
+        self._tasks = {}
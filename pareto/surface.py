@@ -0,0 +1,192 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from pareto import constants
+from pareto.cache import parse_expiry
+from pareto.pricing import (TYPE_INDEX,
+                            black_scholes,
+                            parse_mark,
+                            parse_sigma,
+                            parse_strikes,
+                            time_to_expiry,
+                            )
+
+# Index of each order side in surface arrays, following `constants.VALID_ORDER_SIDE`
+SIDE_INDEX = {order_side: i for i, order_side in enumerate(constants.VALID_ORDER_SIDE)}
+
+
+class VolSurface:
+    r"""Client-side implied volatility surface over strikes, types and sides.
+    Built from one concurrent sweep of `get_sigma`. Volatility is linearly
+    interpolated in strike price, and price quotes are evaluated locally with
+    Black-Scholes, so sizing candidate orders needs no HTTP calls. `refresh`
+    compares one `get_mark` call with the marks seen last time and re-fetches
+    sigma only for the strikes and types whose mark moved.
+    Arguments:
+    --
+    client (PublicClient): Client used to fetch sigma, strikes and expiry
+    underlying: see `constants.VALID_UNDERLYING`
+    spot (float): Price of the underlying
+    rate (float, default=0): Risk-free rate
+    quote_ttl (float, default=1): Seconds a cached quote is served for, so
+        quotes follow the time to expiry as it shrinks
+    """
+    def __init__(self, client, underlying, spot, rate=0., quote_ttl=1.):
+        assert underlying in constants.VALID_UNDERLYING
+        self.client = client
+        self.underlying = underlying
+        self.spot = spot
+        self.rate = rate
+        self.quote_ttl = quote_ttl
+        self.sigma = np.full((len(constants.VALID_ORDER_TYPE),
+                              len(constants.VALID_ORDER_SIDE),
+                              len(constants.VALID_STRIKE)), np.nan)
+        self.strikes = None
+        self.expiry = None
+        self.marks = None
+        self._quotes = {}
+        self._lock = threading.Lock()
+
+    @property
+    def tau(self):
+        r"""Time to expiry in years."""
+        return time_to_expiry(self.expiry)
+
+    def build(self):
+        r"""Fetch strikes, expiry, marks and every sigma point concurrently.
+        Returns the list of changed `(strike, order_type, order_side)` points."""
+        strikes = parse_strikes(self.client.get_strikes(self.underlying).data)
+        expiry = parse_expiry(self.client.get_expiry(self.underlying).data)
+        # Read before the sweep, so a move during it shows on the next refresh
+        marks = parse_mark(self.client.get_mark(self.underlying).data)
+        with self._lock:
+            if expiry != self.expiry or not np.array_equal(strikes, self.strikes):
+                # Every quote depends on the time to expiry and strike prices
+                self._quotes = {}
+            self.strikes = strikes
+            self.expiry = expiry
+        snapshot = self.client.get_chain_snapshot(self.underlying, fields=('sigma',))
+        values = {key: parse_sigma(data) for key, data in snapshot.sigma.items()}
+        changed = self._update(values)
+        self.marks = marks
+        return changed
+
+    def stale_points(self, marks):
+        r"""`(strike, order_type, order_side)` points whose mark differs from
+        the one seen by the last `build` or `refresh`. Every point is stale
+        before the first build.
+        Arguments:
+        --
+        marks (ndarray): Output of `pricing.parse_mark`
+        """
+        if self.marks is None or self.marks.shape != marks.shape:
+            moved = np.ones(marks.shape, dtype=bool)
+        else:
+            # A missing mark that stays missing has not moved
+            moved = (self.marks != marks) & ~(np.isnan(self.marks) & np.isnan(marks))
+        return [(strike, order_type, order_side)
+                for order_type in constants.VALID_ORDER_TYPE
+                for strike in constants.VALID_STRIKE
+                if strike < marks.shape[1] and moved[TYPE_INDEX[order_type], strike]
+                for order_side in constants.VALID_ORDER_SIDE]
+
+    def refresh(self, points=None, max_workers=constants.DEFAULT_MAX_WORKERS):
+        r"""Re-fetch sigma concurrently and update only the points that changed.
+        Returns the list of changed `(strike, order_type, order_side)` points.
+        Without `points`, one `get_mark` call finds the stale points, so a quiet
+        market costs a single request. Moves of sigma that leave the mark
+        unchanged, and expiry or strike changes, need a `build`.
+        Arguments:
+        --
+        points (Optional[Iterable[tuple]], default=None): `(strike, order_type,
+            order_side)` points to refresh. Defaults to `stale_points`
+        max_workers (integer): Maximum number of requests in flight
+        """
+        marks = None
+        if points is None:
+            marks = parse_mark(self.client.get_mark(self.underlying).data)
+            points = self.stale_points(marks)
+        points = list(points)
+
+        def fetch(point):
+            strike, order_type, order_side = point
+            response = self.client.get_sigma(self.underlying, strike, order_type, order_side)
+            return parse_sigma(response.data)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            values = dict(zip(points, executor.map(fetch, points)))
+        changed = self._update(values)
+        if marks is not None:
+            # Only once the points are fetched, so a failed refresh is retried
+            self.marks = marks
+        return changed
+
+    def _update(self, values):
+        changed = []
+        with self._lock:
+            for (strike, order_type, order_side), value in values.items():
+                index = (TYPE_INDEX[order_type], SIDE_INDEX[order_side], strike)
+                if self.sigma[index] != value:
+                    self.sigma[index] = value
+                    changed.append((strike, order_type, order_side))
+            # Quotes only depend on the row of their type and side
+            rows = {(order_type, order_side) for _, order_type, order_side in changed}
+            self._quotes = {key: quote for key, quote in self._quotes.items()
+                            if key[2:] not in rows}
+        return changed
+
+    def set_spot(self, spot):
+        r"""Update the spot price, invalidating cached quotes."""
+        with self._lock:
+            self.spot = spot
+            self._quotes = {}
+
+    def evaluate(self, strikes, order_type, order_side):
+        r"""Interpolated implied volatility at arbitrary strike prices.
+        Arguments:
+        --
+        strikes (float or ndarray): Strike prices
+        order_type: see `constants.VALID_ORDER_TYPE`
+        order_side: see `constants.VALID_ORDER_SIDE`
+        """
+        assert self.strikes is not None, 'surface has not been built'
+        row = self.sigma[TYPE_INDEX[order_type], SIDE_INDEX[order_side]]
+        return np.interp(strikes, self.strikes, row)
+
+    def prices(self, strikes, quantities, order_type, order_side):
+        r"""Vectorized price of orders at arbitrary strike prices and quantities.
+        Arguments:
+        --
+        strikes (float or ndarray): Strike prices
+        quantities (float or ndarray): Number of units per order
+        order_type: see `constants.VALID_ORDER_TYPE`
+        order_side: see `constants.VALID_ORDER_SIDE`
+        """
+        sigma = self.evaluate(strikes, order_type, order_side)
+        unit = black_scholes(self.spot, strikes, sigma, self.tau, self.rate, order_type)['mark']
+        return unit * np.asarray(quantities)
+
+    def quote(self, strike, quantity, order_type, order_side):
+        r"""Price of a potential order, mirroring `get_price`. Cached for
+        `quote_ttl` seconds, or until the sigma row of its type and side, the
+        spot, the expiry or the strikes change.
+        Arguments:
+        --
+        strike: see `constants.VALID_STRIKE`
+        quantity (float): Number of units in order. Rounded to nearest 0.01.
+        order_type: see `constants.VALID_ORDER_TYPE`
+        order_side: see `constants.VALID_ORDER_SIDE`
+        """
+        assert strike in constants.VALID_STRIKE
+        quantity = round(quantity, 2)
+        assert quantity > 0
+        key = (strike, quantity, order_type, order_side)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._quotes.get(key)
+            if cached is not None and now - cached[1] < self.quote_ttl:
+                return cached[0]
+            quote = float(self.prices(self.strikes[strike], quantity, order_type, order_side))
+            self._quotes[key] = (quote, now)
+        return quote
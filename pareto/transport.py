@@ -0,0 +1,180 @@
+import time
+from functools import partial
+from contextlib import contextmanager
+from contextvars import ContextVar
+import requests
+from requests.adapters import HTTPAdapter
+from pareto import constants
+from pareto.errors import ParetoTimeoutError
+from pareto.scheduler import classify
+from pareto.utils import create_session, make_request, DEFAULT_JSON_CODEC
+
+# Absolute `time.monotonic()` deadline of the current thread or asyncio task
+_deadline = ContextVar('pareto_deadline', default=None)
+
+
+@contextmanager
+def deadline(budget):
+    r"""Bound every request made inside the block by a shared time budget.
+    Nested blocks can only shorten the budget. Works per thread and per
+    asyncio task.
+    Arguments:
+    --
+    budget (integer): Number of ms available for all requests in the block
+    """
+    end = time.monotonic() + budget / 1000.
+    current = _deadline.get()
+    token = _deadline.set(end if current is None else min(current, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining_budget(uri, budget=None):
+    r"""Seconds left before the tightest of the scoped deadline and `budget`,
+    or None if neither is set.
+    Arguments:
+    --
+    uri (string): Full URI endpoint, for error reporting
+    budget (Optional[integer], default=None): Number of ms for this call
+    """
+    end = _deadline.get()
+    if budget is not None:
+        call_end = time.monotonic() + budget / 1000.
+        end = call_end if end is None else min(end, call_end)
+    if end is None:
+        return None
+    remaining = end - time.monotonic()
+    if remaining <= 0:
+        raise ParetoTimeoutError(uri, 'deadline exceeded before sending')
+    return remaining
+
+
+class Transport:
+    r"""HTTP transport shared by public and private clients: one session with
+    a tuned connection pool and separate connect and read timeouts.
+    Arguments:
+    --
+    pool_size (integer): Maximum number of connections kept per host
+    connect_timeout (integer): Number of ms to wait to establish a connection
+    read_timeout (integer): Number of ms to wait between bytes of the response
+    keep_alive (boolean, default=True): Reuse connections between requests
+    json_codec (JSONCodec, default=DEFAULT_JSON_CODEC): Encoder and decoder
+        for bodies
+    scheduler (Optional[RequestScheduler], default=None): Rate limits and
+        prioritizes requests before they are sent
+    recorder (Optional[Recorder], default=None): Records every request and
+        response to a capture file
+    """
+    def __init__(self,
+                 pool_size=constants.DEFAULT_POOL_SIZE,
+                 connect_timeout=constants.DEFAULT_CONNECT_TIMEOUT,
+                 read_timeout=constants.DEFAULT_API_TIMEOUT,
+                 keep_alive=True,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 scheduler=None,
+                 recorder=None,
+                 ):
+        self.pool_size = pool_size
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.json_codec = json_codec
+        self.scheduler = scheduler
+        self.recorder = recorder
+        self.session = create_session()
+        adapter = HTTPAdapter(pool_connections=constants.DEFAULT_HOST_POOLS,
+                              pool_maxsize=pool_size,
+                              max_retries=0,
+                              )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    deadline = staticmethod(deadline)
+
+    def timeouts(self, uri, budget=None):
+        r"""`(connect, read)` timeouts in seconds, capped by the remaining budget.
+        requests applies the read timeout to every socket read, so these only
+        bound each phase; `request` checks the budget again once the response
+        is in."""
+        connect = self.connect_timeout / 1000.
+        read = self.read_timeout / 1000.
+        remaining = remaining_budget(uri, budget)
+        if remaining is not None:
+            connect = min(connect, remaining)
+            read = min(read, remaining)
+        return connect, read
+
+    def request(self,
+                uri,
+                method,
+                headers=None,
+                body={},
+                data=None,
+                deadline=None,
+                json_codec=None,
+                ):
+        r"""Send a request through the shared session.
+        Arguments:
+        --
+        uri (string): Full URI endpoint
+        method (string): GET or POST
+        headers (Optional[Dict[string, any]], default=None): Header information
+        body (Dict[string, any], default={}): Body data
+        data (Optional[bytes], default=None): Already encoded body
+        deadline (Optional[integer], default=None): Number of ms for this call
+        json_codec (Optional[JSONCodec], default=None): Overrides the codec
+        """
+        if self.scheduler is not None:
+            # Time spent queued counts against the deadline
+            budget = remaining_budget(uri, deadline)
+            queued = time.monotonic()
+            self.scheduler.acquire(classify(method, uri), budget, uri)
+            if budget is not None:
+                deadline = (budget - (time.monotonic() - queued)) * 1000.
+        json_codec = json_codec or self.json_codec
+        try:
+            remaining = remaining_budget(uri, deadline)
+            end = None if remaining is None else time.monotonic() + remaining
+            timeout = self.timeouts(uri, deadline)
+            if self.recorder is None:
+                response = make_request(self.session,
+                                        uri,
+                                        method,
+                                        headers,
+                                        body,
+                                        timeout=timeout,
+                                        data=data,
+                                        json_codec=json_codec,
+                                        )
+            else:
+                response = self._record(uri, method, headers, body, data, timeout, json_codec)
+            if end is not None and time.monotonic() > end:
+                # A slow response can outlast the per-read timeout
+                raise ParetoTimeoutError(uri, 'deadline exceeded while receiving')
+            return response
+        except requests.Timeout as e:
+            raise ParetoTimeoutError(uri, str(e)) from e
+        finally:
+            if self.scheduler is not None:
+                self.scheduler.release()
+
+    def _record(self, uri, method, headers, body, data, timeout, json_codec):
+        r"""Send a request through the recorder."""
+        if data is None:
+            data = json_codec.encode(body).encode('utf-8')
+        send = partial(make_request,
+                       self.session,
+                       uri,
+                       method,
+                       headers,
+                       timeout=timeout,
+                       data=data,
+                       json_codec=json_codec,
+                       )
+        return self.recorder.capture(method, uri, data, send)
+
+    def close(self):
+        self.session.close()
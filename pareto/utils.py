@@ -1,15 +1,47 @@
+import json
+import time
 import requests
+from pareto import constants
 from pareto.errors import ParetoAPIError
+from pareto.instrumentation import current_trace
+
+
+DEFAULT_HEADERS = {
+    'Accept': 'application/json',
+    'Content-Type': 'application/json',
+    'User-Agent': 'pareto/python',
+}
+
+
+class JSONCodec:
+    r"""Pluggable JSON encoder and decoder used for request and response bodies.
+    Arguments:
+    --
+    dumps (Callable, default=json.dumps): Encodes an object to str or bytes
+    loads (Callable, default=json.loads): Decodes str or bytes
+    """
+    def __init__(self, dumps=json.dumps, loads=json.loads):
+        self.dumps = dumps
+        self.loads = loads
+
+    def encode(self, obj):
+        r"""Encode to the canonical text that is both signed and sent."""
+        text = self.dumps(obj)
+        if isinstance(text, bytes):
+            text = text.decode('utf-8')
+        return text
+
+    def decode(self, data):
+        return self.loads(data)
+
+
+DEFAULT_JSON_CODEC = JSONCodec()
 
 
 def create_session():
     r"""Creates a new session instance."""
     session = requests.session()
-    session.headers.update({
-        'Accept': 'application/json',
-        'Content-Type': 'application/json',
-        'User-Agent': 'pareto/python',
-    })
+    session.headers.update(DEFAULT_HEADERS)
     return session
 
 
@@ -32,16 +64,117 @@ def get_query_path(url, params={}):
     return url
 
 
+# Marks data that has not been decoded yet
+_UNDECODED = object()
+
+
 class Response:
     r"""Generic response object.
+    When built from the raw body, `data` is decoded on first access, so
+    callers that only need `raw`, or a compact model, skip building dicts
+    they do not use. An empty body decodes to `{}`.
     Arguments:
     --
     data (Dict[string, any], default={}): JSON response data
     headers (Optional[Dict[string, any]]): Headers in the response
+    raw (Optional[bytes], default=None): Undecoded body. Used when `data`
+        is not given
+    json_codec (JSONCodec, default=DEFAULT_JSON_CODEC): Decoder for `raw`
+    trace (Optional[Trace], default=None): Trace timing the decode
+    status_code (Optional[integer], default=None): HTTP status, if received
     """
-    def __init__(self, data={}, headers=None):
-        self.data = data
+    __slots__ = ('_data', 'headers', 'raw', '_json_codec', '_trace', 'status_code')
+
+    def __init__(self,
+                 data=_UNDECODED,
+                 headers=None,
+                 raw=None,
+                 json_codec=DEFAULT_JSON_CODEC,
+                 trace=None,
+                 status_code=None,
+                 ):
+        if data is _UNDECODED and raw is None:
+            data = {}
+        self._data = data
         self.headers = headers
+        self.raw = raw
+        self._json_codec = json_codec
+        self._trace = trace
+        self.status_code = status_code
+
+    @property
+    def data(self):
+        if self._data is _UNDECODED:
+            self._data = decode(self._json_codec, self.raw, self._trace) if self.raw else {}
+            self._trace = None
+        return self._data
+
+    @data.setter
+    def data(self, data):
+        self._data = data
+
+    @property
+    def buffer(self):
+        r"""Zero-copy view of the raw body."""
+        return memoryview(self.raw if self.raw is not None else b'')
+
+    def to(self, model, many=False):
+        r"""Convert the data to a model from `pareto.models`.
+        Arguments:
+        --
+        model (type): Model class, e.g. `models.Depth` or `models.Order`
+        many (boolean, default=False): Parse a list payload with `model.many`
+        """
+        return model.many(self.data) if many else model.from_data(self.data)
+
+
+class BatchResult:
+    r"""Outcome of one request within a batch. Exactly one of `response` and
+    `error` is set.
+    Arguments:
+    --
+    response (Optional[Response], default=None): Response if the request succeeded
+    error (Optional[Exception], default=None): Error raised by the request
+    """
+    def __init__(self, response=None, error=None):
+        self.response = response
+        self.error = error
+
+    @classmethod
+    def from_future(cls, future):
+        r"""Build from a completed `concurrent.futures.Future`."""
+        error = future.exception()
+        if error is not None:
+            return cls(error=error)
+        return cls(response=future.result())
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def __repr__(self):
+        if self.ok:
+            return 'BatchResult(response={})'.format(self.response.data)
+        return 'BatchResult(error={!r})'.format(self.error)
+
+
+class PreparedRequest:
+    r"""Request ready to be sent. For signed requests `data` holds the exact
+    body bytes that were signed.
+    Arguments:
+    --
+    method (string): GET or POST
+    uri (string): Full URI endpoint
+    headers (Dict[string, any]): Header information
+    data (bytes): Encoded body
+    body (Optional[Dict[string, any]], default=None): Body before encoding
+    """
+    def __init__(self, method, uri, headers, data, body=None):
+        self.method = method
+        self.uri = uri
+        self.headers = headers
+        self.data = data
+        self.body = body
 
 
 def make_request(session,
@@ -49,7 +182,10 @@ def make_request(session,
                  method,
                  headers=None,
                  body={},
-                 timeout=3000,
+                 timeout=(constants.DEFAULT_CONNECT_TIMEOUT / 1000.,
+                          constants.DEFAULT_API_TIMEOUT / 1000.),
+                 data=None,
+                 json_codec=DEFAULT_JSON_CODEC,
                  ):
     r"""Make a generic HTTP request.
     Arguments:
@@ -57,19 +193,48 @@ def make_request(session,
     session (request.Session): Session instance
     uri (string): full URI endpoint
     headers (Optional[Dict[string, any]], default=None): Header information
-    body (Dict[string, any], default={}): Body data. Send as `json` attribute
-    timeout (integer, default=3000): Maximum seconds to wait before timeout
+    body (Dict[string, any], default={}): Body data. Encoded with `json_codec`
+    timeout (Tuple[float, float]): Connect and read timeouts in seconds
+    data (Optional[bytes], default=None): Already encoded body, sent as is
+        instead of `body`
+    json_codec (JSONCodec): Codec to encode `body` and decode the response
     """
     assert method.upper() in ['GET', 'POST'], f'method {method} not supported'
+    if data is None:
+        data = json_codec.encode(body).encode('utf-8')
+    trace = current_trace()
+    if trace is not None:
+        start = time.perf_counter()
     response = getattr(session, method.lower())(uri, 
                                                 headers=headers,
-                                                json=body,
+                                                data=data,
                                                 timeout=timeout,
                                                 )
+    if trace is not None:
+        trace.status = response.status_code
+        trace.observe('network', time.perf_counter() - start)
     if not str(response.status_code).startswith('2'):
         raise ParetoAPIError(response)
 
-    if response.content:
-        return Response(response.json(), response.headers)
-    else:
-        return Response('{}', response.headers)
+    return Response(headers=response.headers,
+                    raw=response.content,
+                    json_codec=json_codec,
+                    trace=trace,
+                    status_code=response.status_code,
+                    )
+
+
+def decode(json_codec, content, trace=None):
+    r"""Decode a response body, timing it when the call is traced.
+    Arguments:
+    --
+    json_codec (JSONCodec): Codec to decode with
+    content (bytes): Response body
+    trace (Optional[Trace], default=None): Trace of the call
+    """
+    if trace is None:
+        return json_codec.decode(content)
+    start = time.perf_counter()
+    data = json_codec.decode(content)
+    trace.observe('decode', time.perf_counter() - start)
+    return data
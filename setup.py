@@ -15,5 +15,10 @@ setup(
     install_requires=[
         "eth_account==0.5.9",
         "requests==2.28.1",
-    ]
+    ],
+    extras_require={
+        "async": ["aiohttp>=3.8"],
+        "fast": ["coincurve>=15"],
+        "numpy": ["numpy>=1.20"],
+    },
 )
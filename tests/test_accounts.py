@@ -0,0 +1,66 @@
+import threading
+import pytest
+from pareto import ORDER_TYPE_CALL, ORDER_SIDE_BUY, UNDERLYING_ETH
+from pareto.accounts import AccountPool
+from pareto.errors import ParetoTimeoutError
+from pareto.simulator import SimulatedExchange
+
+KEYS = ['0x' + digit * 64 for digit in '123']
+
+
+def test_map_passes_the_client_then_arguments():
+    pool = AccountPool('http://127.0.0.1:1', KEYS)
+    calls = []
+    lock = threading.Lock()
+
+    def call(client, *args, **kwargs):
+        with lock:
+            calls.append((client.signer.address, args, kwargs))
+        if client is pool[pool.addresses[1]]:
+            raise ValueError('failed')
+        return args[0] * 2
+
+    results = pool.map(call, 21, 'x', flag=True)
+    assert list(results) == pool.addresses
+    assert sorted(calls) == sorted((address, (21, 'x'), {'flag': True})
+                                   for address in pool.addresses)
+    first, failed, last = results.values()
+    assert first.response == last.response == 42
+    assert isinstance(failed.error, ValueError)
+    # Every account shares one transport
+    assert all(pool[address].transport is pool.transport for address in pool)
+    pool.close()
+
+
+def test_map_selects_accounts():
+    pool = AccountPool('http://127.0.0.1:1', KEYS)
+    called = []
+    assert pool.map(called.append, addresses=[]) == {}
+    assert called == []
+    selected = [pool.addresses[2], pool.addresses[0]]
+    assert list(pool.map(lambda client: client.signer.address, addresses=selected)) == selected
+    with pytest.raises(KeyError):
+        pool.map(called.append, addresses=['0xunknown'])
+    assert called == []
+    pool.close()
+
+
+def test_map_calls_methods_by_name():
+    with SimulatedExchange() as exchange, AccountPool(exchange.url, KEYS) as pool:
+        results = pool.map('create_limit_order', UNDERLYING_ETH, 5, 1., 10.,
+                           ORDER_TYPE_CALL, order_side=ORDER_SIDE_BUY,
+                           addresses=pool.addresses[:2])
+        assert all(result.ok for result in results.values())
+        orders = pool.get_orders(UNDERLYING_ETH)
+        assert [len(result.response.data) for result in orders.values()] == [1, 1, 0]
+        assert pool.cancel_all(UNDERLYING_ETH, addresses=[]) == {}
+        pool.cancel_all(UNDERLYING_ETH)
+        orders = pool.get_orders(UNDERLYING_ETH)
+        assert [result.response.data for result in orders.values()] == [[], [], []]
+
+
+def test_map_inherits_the_deadline():
+    with SimulatedExchange(latency=300) as exchange, AccountPool(exchange.url, KEYS) as pool:
+        with pool.deadline(100):
+            results = pool.get_orders(UNDERLYING_ETH)
+        assert all(isinstance(result.error, ParetoTimeoutError) for result in results.values())
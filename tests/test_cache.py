@@ -0,0 +1,90 @@
+from pareto.cache import ResponseCache
+from pareto.utils import Response
+
+MARK = '/public/price/mark/0'
+STRIKES = '/public/price/strikes/0'
+EXPIRY = '/public/expiry/0'
+
+
+class Clock:
+    def __init__(self, now=1660000000.):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _uri(path):
+    return f'http://h{path}'
+
+
+def _put(cache, path, data=None):
+    response = Response(data=data if data is not None else {'path': path})
+    cache.put(path, _uri(path), response)
+    return response
+
+
+def test_only_configured_endpoints_are_cached():
+    cache = ResponseCache(ttls={'/public/price/': 5., MARK: 1.}, clock=Clock())
+    assert cache.ttl(MARK) == 1.
+    assert cache.ttl(STRIKES) == 5.
+    assert cache.ttl('/user/orders/0') is None
+    _put(cache, '/user/orders/0')
+    assert cache.get('/user/orders/0', _uri('/user/orders/0')) is None
+    assert cache.stats() == {'hits': 0, 'misses': 0, 'invalidations': 0, 'size': 0}
+
+
+def test_entries_expire_after_their_ttl():
+    clock = Clock()
+    cache = ResponseCache(ttls={MARK: 1., STRIKES: 60.}, clock=clock)
+    mark = _put(cache, MARK)
+    strikes = _put(cache, STRIKES)
+    clock.now += 0.999
+    assert cache.get(MARK, _uri(MARK)) is mark
+    clock.now += 0.001
+    assert cache.get(MARK, _uri(MARK)) is None
+    assert cache.get(STRIKES, _uri(STRIKES)) is strikes
+    assert cache.stats() == {'hits': 2, 'misses': 1, 'invalidations': 0, 'size': 1}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(ttls={'/public/': 60.}, max_size=2, clock=Clock())
+    paths = ['/public/a', '/public/b', '/public/c']
+    first = _put(cache, paths[0])
+    _put(cache, paths[1])
+    # Reading the first entry makes the second the least recently used
+    assert cache.get(paths[0], _uri(paths[0])) is first
+    _put(cache, paths[2])
+    assert cache.get(paths[1], _uri(paths[1])) is None
+    assert cache.get(paths[0], _uri(paths[0])) is first
+    assert cache.get(paths[2], _uri(paths[2])) is not None
+    assert cache.stats()['size'] == 2
+
+
+def test_entries_never_outlive_the_active_expiry():
+    clock = Clock()
+    cache = ResponseCache(ttls={STRIKES: 60., EXPIRY: 60.}, clock=clock)
+    # The active expiry is 10 seconds away, in ms like the API
+    _put(cache, EXPIRY, {'expiry': int((clock.now + 10.) * 1000)})
+    strikes = _put(cache, STRIKES)
+    clock.now += 9.
+    assert cache.get(STRIKES, _uri(STRIKES)) is strikes
+    clock.now += 1.
+    assert cache.get(STRIKES, _uri(STRIKES)) is None
+
+
+def test_expiry_rollover_clears_the_cache():
+    clock = Clock()
+    cache = ResponseCache(ttls={STRIKES: 60., EXPIRY: 60.}, clock=clock)
+    _put(cache, EXPIRY, {'expiry': clock.now + 100.})
+    _put(cache, STRIKES)
+    # The same expiry again changes nothing
+    _put(cache, EXPIRY, {'expiry': clock.now + 100.})
+    assert cache.get(STRIKES, _uri(STRIKES)) is not None
+    _put(cache, EXPIRY, {'expiry': clock.now + 200.})
+    assert cache.get(STRIKES, _uri(STRIKES)) is None
+    assert cache.stats()['invalidations'] == 1
+    # Unreadable payloads are ignored
+    _put(cache, STRIKES)
+    _put(cache, EXPIRY, {'error': 'unavailable'})
+    assert cache.get(STRIKES, _uri(STRIKES)) is not None
@@ -0,0 +1,119 @@
+import json
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pareto import Client, ORDER_TYPE_CALL, ORDER_SIDE_BUY, UNDERLYING_ETH
+from pareto.signer import hash_message, recover_address
+from pareto.utils import JSONCodec
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+class _WireHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _handle(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        self.server.received.append((self.command, self.path, dict(self.headers), body))
+        payload = b'{"id": "1"}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = _handle
+
+    def log_message(self, *args):
+        pass
+
+
+class WireServer:
+    r"""HTTP server keeping the method, path, headers and body bytes of every
+    request it receives."""
+    def __init__(self):
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _WireHandler)
+        self._server.daemon_threads = True
+        self._server.received = []
+        self.received = self._server.received
+        self.url = 'http://127.0.0.1:{}'.format(self._server.server_address[1])
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _signer_of(method, path, headers, body):
+    message_hash = hash_message(method, path, body.decode('utf-8'),
+                                int(headers['pareto-timestamp']))
+    return recover_address(message_hash, headers['pareto-signature'])
+
+
+def test_signature_covers_the_bytes_sent():
+    with WireServer() as server:
+        client = Client(server.url, eth_private_key=PRIVATE_KEY)
+        client.private.create_limit_order(UNDERLYING_ETH, 5, 1.25, 12.5,
+                                          ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+        client.private.create_limit_orders(UNDERLYING_ETH, [
+            {'strike': strike, 'quantity': 1., 'price': 10., 'order_type': ORDER_TYPE_CALL,
+             'order_side': ORDER_SIDE_BUY}
+            for strike in (1, 2, 3)
+        ])
+        client.private.cancel_batch(UNDERLYING_ETH, ['a&b', '<c>'])
+        client.private.get_orders(UNDERLYING_ETH)
+    address = client.private.signer.address
+    assert len(server.received) == 6
+    for method, path, headers, body in server.received:
+        assert headers['pareto-ethereum-address'] == address
+        assert _signer_of(method, path, headers, body) == address
+        if method == 'POST':
+            assert json.loads(body)
+    # A single changed byte breaks the signature
+    method, path, headers, body = server.received[0]
+    assert _signer_of(method, path, headers, body.replace(b'1.25', b'1.26')) != address
+
+
+class RecordingCodec(JSONCodec):
+    r"""Compact, sorted codec returning bytes, keeping every object it encodes
+    and every payload it decodes."""
+    def __init__(self):
+        self.encoded = []
+        self.decoded = []
+        super().__init__(dumps=self._dumps, loads=self._loads)
+
+    def _dumps(self, obj):
+        self.encoded.append(obj)
+        return json.dumps(obj, separators=(',', ':'), sort_keys=True,
+                          ensure_ascii=False).encode('utf-8')
+
+    def _loads(self, data):
+        self.decoded.append(data)
+        return json.loads(data)
+
+
+def test_bodies_sent_are_the_codec_output():
+    codec = RecordingCodec()
+    with WireServer() as server:
+        client = Client(server.url, eth_private_key=PRIVATE_KEY, json_codec=codec)
+        assert client.public.get_mark(UNDERLYING_ETH).data == {'id': '1'}
+        client.private.get_orders(UNDERLYING_ETH)
+        client.private.create_limit_order(UNDERLYING_ETH, 5, 1.25, 12.5,
+                                          ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+        client.private.cancel_batch(UNDERLYING_ETH, ['é&<>'])
+    bodies = [body for _, _, _, body in server.received]
+    # Empty bodies are sent as the codec's encoding of {}
+    assert bodies[:2] == [b'{}', b'{}']
+    assert b'"isBuy":true' in bodies[2] and b' ' not in bodies[2]
+    assert 'é'.encode('utf-8') in bodies[3]
+    encoded = list(codec.encoded)
+    assert [json.loads(body) for body in bodies] == encoded
+    assert bodies == [codec.encode(obj).encode('utf-8') for obj in encoded]
+    # Responses decode lazily, through the same codec
+    assert codec.decoded == [b'{"id": "1"}']
+    address = client.private.signer.address
+    for method, path, headers, body in server.received[1:]:
+        assert _signer_of(method, path, headers, body) == address
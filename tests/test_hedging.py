@@ -0,0 +1,101 @@
+import asyncio
+import itertools
+import time
+import pytest
+from pareto.hedging import Hedger
+
+
+class Attempts:
+    r"""Request function whose n-th call waits `delays[n]` seconds, then
+    fails if `errors[n]` is set, otherwise returns n."""
+    def __init__(self, delays, errors=()):
+        self.delays = delays
+        self.errors = dict(errors)
+        self._count = itertools.count()
+        self.calls = 0
+
+    def __call__(self):
+        n = next(self._count)
+        self.calls += 1
+        time.sleep(self.delays[n])
+        if n in self.errors:
+            raise self.errors[n]
+        return n
+
+    async def run_async(self):
+        n = next(self._count)
+        self.calls += 1
+        await asyncio.sleep(self.delays[n])
+        if n in self.errors:
+            raise self.errors[n]
+        return n
+
+
+def test_fast_response_is_not_hedged():
+    hedger = Hedger(initial_delay=200)
+    attempts = Attempts([0.])
+    assert hedger.run(attempts) == 0
+    assert attempts.calls == 1
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 0, 'hedges_won': 0, 'failed': 0}
+
+
+def test_slow_primary_is_hedged_and_the_backup_wins():
+    hedger = Hedger(initial_delay=20)
+    attempts = Attempts([0.5, 0.])
+    start = time.monotonic()
+    assert hedger.run(attempts) == 1
+    assert time.monotonic() - start < 0.4
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 1, 'hedges_won': 1, 'failed': 0}
+
+
+def test_backup_failure_waits_for_the_primary():
+    hedger = Hedger(initial_delay=20)
+    attempts = Attempts([0.1, 0.], errors={1: ValueError('backup')})
+    assert hedger.run(attempts) == 0
+    assert hedger.stats()['hedges_won'] == 0
+
+
+def test_primary_failure_before_the_hedge_is_recorded():
+    hedger = Hedger(initial_delay=200)
+    attempts = Attempts([0.], errors={0: ConnectionError('refused')})
+    with pytest.raises(ConnectionError):
+        hedger.run(attempts)
+    assert attempts.calls == 1
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 0, 'hedges_won': 0, 'failed': 1}
+    assert len(hedger._latencies) == 1
+
+
+def test_both_attempts_failing_raises_the_primary_error():
+    hedger = Hedger(initial_delay=10)
+    attempts = Attempts([0.05, 0.], errors={0: KeyError('primary'), 1: ValueError('backup')})
+    with pytest.raises(KeyError):
+        hedger.run(attempts)
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 1, 'hedges_won': 0, 'failed': 1}
+
+
+def test_delay_follows_the_latencies_of_every_outcome():
+    hedger = Hedger(percentile=50, initial_delay=500, min_samples=4)
+    assert hedger.delay() == 0.5
+    for n in range(4):
+        errors = {0: ConnectionError()} if n % 2 else {}
+        try:
+            hedger.run(Attempts([0.02], errors=errors))
+        except ConnectionError:
+            pass
+    assert hedger.stats()['failed'] == 2
+    assert 0.02 <= hedger.delay() < 0.1
+
+
+def test_async_primary_failure_before_the_hedge_is_recorded():
+    hedger = Hedger(initial_delay=200)
+    attempts = Attempts([0.], errors={0: ConnectionError('refused')})
+    with pytest.raises(ConnectionError):
+        asyncio.run(hedger.run_async(attempts.run_async))
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 0, 'hedges_won': 0, 'failed': 1}
+
+
+def test_async_slow_primary_is_hedged():
+    hedger = Hedger(initial_delay=20)
+    attempts = Attempts([0.5, 0.])
+    assert asyncio.run(hedger.run_async(attempts.run_async)) == 1
+    assert hedger.stats() == {'requests': 1, 'hedges_fired': 1, 'hedges_won': 1, 'failed': 0}
@@ -0,0 +1,76 @@
+import threading
+import time
+from pareto import Client, ORDER_TYPE_CALL, ORDER_SIDE_BUY, UNDERLYING_ETH
+from pareto.killswitch import KillSwitch
+from pareto.simulator import SimulatedExchange
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+def _capture(client):
+    sent = []
+    client._send = lambda request, deadline=None: sent.append(request)
+    return sent
+
+
+def test_batch_signed_before_track_is_never_sent():
+    client = Client('http://127.0.0.1:1', eth_private_key=PRIVATE_KEY).private
+    switch = KillSwitch(client, UNDERLYING_ETH, keep_warm=False)
+    switch.track(['old'])
+    signing = threading.Event()
+    resume = threading.Event()
+    sign = switch._sign
+
+    def slow_sign(uri, body):
+        if 'ids' in body:
+            signing.set()
+            assert resume.wait(2.)
+        return sign(uri, body)
+
+    switch._sign = slow_sign
+    thread = threading.Thread(target=switch.arm)
+    thread.start()
+    assert signing.wait(2.)
+    # The ids change while the old batch is being signed
+    switch.track(['new'])
+    resume.set()
+    thread.join()
+    assert 'batch' not in switch._armed
+    assert 'all' in switch._armed
+    sent = _capture(client)
+    switch.fire_batch()
+    assert [request.body for request in sent] == [{'ids': ['new']}]
+    # Armed again for the current ids only
+    switch.arm()
+    assert switch._armed['batch'].body == {'ids': ['new']}
+
+
+def test_stale_requests_are_signed_again():
+    client = Client('http://127.0.0.1:1', eth_private_key=PRIVATE_KEY).private
+    switch = KillSwitch(client, UNDERLYING_ETH, max_age=1000, keep_warm=False)
+    armed = switch._armed['all']
+    sent = _capture(client)
+    switch.fire()
+    assert sent == [armed]
+    # Taken requests are never reused
+    switch.fire()
+    assert sent[1] is not armed
+    armed = switch._armed['all'] = client._prepare('POST', *client._cancel_all(UNDERLYING_ETH))
+    armed.headers['pareto-timestamp'] = str(int(time.time()) - 2)
+    switch.fire()
+    assert sent[2] is not armed
+    assert int(sent[2].headers['pareto-timestamp']) >= int(time.time()) - 1
+
+
+def test_fire_cancels_on_the_exchange():
+    with SimulatedExchange() as exchange:
+        client = Client(exchange.url, eth_private_key=PRIVATE_KEY).private
+        ids = [client.create_limit_order(UNDERLYING_ETH, strike, 1., 10., ORDER_TYPE_CALL,
+                                         ORDER_SIDE_BUY).data['id'] for strike in (1, 2, 3)]
+        with KillSwitch(client, UNDERLYING_ETH, max_age=200) as switch:
+            switch.track(ids[:1])
+            time.sleep(0.05)
+            switch.fire_batch()
+            assert len(client.get_orders(UNDERLYING_ETH).data) == 2
+            switch.fire()
+            assert client.get_orders(UNDERLYING_ETH).data == []
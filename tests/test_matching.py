@@ -0,0 +1,70 @@
+from pareto import ORDER_TYPE_CALL, ORDER_SIDE_BUY, ORDER_SIDE_SELL
+from pareto.matching import MatchingEngine, from_units, to_units
+
+
+def _sell(engine, owner, price, quantity):
+    return engine.submit(owner, 5, ORDER_TYPE_CALL, ORDER_SIDE_SELL,
+                         to_units(quantity), to_units(price))[0]
+
+
+def test_units_round_to_hundredths():
+    assert to_units(0.1 + 0.2) == 30
+    assert to_units('12.50') == 1250
+    # Ten fills of 0.1 add up to exactly 1.0
+    assert sum(to_units(0.1) for _ in range(10)) == to_units(1.)
+    assert from_units(to_units(1.01)) == 1.01
+
+
+def test_same_price_orders_fill_in_time_priority():
+    engine = MatchingEngine()
+    first = _sell(engine, 'a', 12.5, 1.)
+    second = _sell(engine, 'b', 12.5, 1.)
+    third = _sell(engine, 'c', 12.5, 1.)
+    taker, fills = engine.submit('t', 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY, to_units(1.5))
+    assert [fill.maker.id for fill in fills] == [first.id, second.id]
+    assert [fill.quantity for fill in fills] == [100, 50]
+    assert first.id not in engine.orders
+    assert second.remaining == 50
+    assert [order.id for order in engine.open_orders()] == [second.id, third.id]
+    assert engine.book(5, ORDER_TYPE_CALL).asks.depth() == [(1250, 150)]
+    # Market orders never rest
+    assert not taker.active and taker.remaining == 0
+
+
+def test_limit_order_sweeps_levels_up_to_its_price():
+    engine = MatchingEngine()
+    _sell(engine, 'a', 12., 1.)
+    _sell(engine, 'b', 12.5, 1.)
+    _sell(engine, 'c', 13., 1.)
+    expensive = _sell(engine, 'd', 14., 1.)
+    taker, fills = engine.submit('t', 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY,
+                                 to_units(3.5), to_units(13.))
+    assert [(fill.price, fill.quantity) for fill in fills] == [(1200, 100), (1250, 100),
+                                                                (1300, 100)]
+    # Trades happen at the maker's price, the remainder rests at the limit
+    assert taker.active and taker.remaining == 50
+    book = engine.book(5, ORDER_TYPE_CALL)
+    assert book.bids.depth() == [(1300, 50)]
+    assert book.asks.depth() == [(1400, 100)]
+    assert book.mid() == 1350.
+    assert [order.id for order in engine.open_orders()] == [expensive.id, taker.id]
+
+
+def test_cancel_partially_filled_order():
+    engine = MatchingEngine()
+    maker = _sell(engine, 'a', 12.5, 3.)
+    _sell(engine, 'b', 12.5, 1.)
+    engine.submit('t', 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY, to_units(1.25), to_units(12.5))
+    assert maker.remaining == 175
+    assert maker.to_data()['quantity'] == 1.75
+    assert maker.to_data()['filled'] == 1.25
+    # Only the owner can cancel
+    assert engine.cancel(maker.id, owner='b') is None
+    assert engine.cancel(maker.id, owner='a') is maker
+    assert engine.cancel(maker.id) is None
+    asks = engine.book(5, ORDER_TYPE_CALL).asks
+    assert asks.depth() == [(1250, 100)]
+    # The cancelled order is skipped when the queue reaches it
+    _, fills = engine.submit('t', 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY, to_units(2.))
+    assert [fill.maker.owner for fill in fills] == ['b']
+    assert not asks
@@ -0,0 +1,88 @@
+import random
+from pareto import ORDER_TYPE_CALL, UNDERLYING_ETH
+from pareto.orderbook import ASK, BID, OrderBook, OrderBookMirror, parse_depth
+
+KEY = (UNDERLYING_ETH, 5, ORDER_TYPE_CALL)
+
+
+def _depth(bids, asks):
+    return {'bids': [[price, size] for price, size in bids.items()],
+            'asks': [{'price': price, 'quantity': size} for price, size in asks.items()]}
+
+
+def _check_sorted(book):
+    for side in (book.bids, book.asks):
+        assert list(side.prices) == sorted(side.prices)
+        assert len(side.sizes) == len(side.prices) == len(side.cumulative)
+        assert all(size > 0 for size in side.sizes)
+
+
+def test_parse_depth_aggregates_levels():
+    bids, asks = parse_depth({'bids': [[10., 1.], [10., 2.], [9., 1.]],
+                              'asks': [{'price': 11., 'size': 4.}]})
+    assert bids == {10.: 3., 9.: 1.}
+    assert asks == {11.: 4.}
+
+
+def test_apply_inserts_updates_and_deletes_levels():
+    book = OrderBook()
+    changes = book.apply(_depth({10.: 1., 9.: 2.}, {12.: 3.}))
+    assert sorted(changes) == [(ASK, 12., 0., 3.), (BID, 9., 0., 2.), (BID, 10., 0., 1.)]
+    assert book.best_bid() == (10., 1.) and book.best_ask() == (12., 3.)
+    assert book.version == 1
+    # Insert between existing levels
+    bids = book.bids
+    changes = book.apply(_depth({10.: 1., 9.5: 4., 9.: 2.}, {12.: 3.}))
+    assert changes == [(BID, 9.5, 0., 4.)]
+    assert list(book.bids.prices) == [9., 9.5, 10.]
+    # Sides are replaced, never mutated
+    assert list(bids.prices) == [9., 10.]
+    # A zero size deletes the level, a missing one too
+    changes = book.apply(_depth({10.: 0., 9.5: 5.}, {12.: 3., 11.: 0.}))
+    assert sorted(changes) == [(BID, 9., 2., 0.), (BID, 9.5, 4., 5.), (BID, 10., 1., 0.)]
+    assert book.bids.levels() == {9.5: 5.}
+    assert book.asks.levels() == {12.: 3.}
+    assert book.best_bid() == (9.5, 5.)
+    _check_sorted(book)
+    version = book.version
+    assert book.apply(_depth({9.5: 5.}, {12.: 3.})) == []
+    assert book.version == version
+
+
+def test_apply_keeps_sides_sorted_and_cumulative():
+    rng = random.Random(0)
+    book = OrderBook()
+    for _ in range(200):
+        bids = {rng.randrange(1, 20) / 2.: rng.choice([0., 1., 2.5]) for _ in range(8)}
+        asks = {rng.randrange(21, 40) / 2.: rng.choice([0., 1., 2.5]) for _ in range(8)}
+        book.apply(_depth(bids, asks))
+        _check_sorted(book)
+        assert book.bids.levels() == {price: size for price, size in bids.items() if size}
+        assert book.asks.levels() == {price: size for price, size in asks.items() if size}
+        best_bids = [size for _, size in sorted(book.bids.levels().items(), reverse=True)]
+        best_asks = [size for _, size in sorted(book.asks.levels().items())]
+        assert book.bids.size_to_depth(2) == sum(best_bids[:2])
+        assert book.asks.size_to_depth(3) == sum(best_asks[:3])
+
+
+def test_size_to_depth_and_price():
+    book = OrderBook()
+    book.apply(_depth({10.: 1., 9.: 2., 8.: 3.}, {11.: 4., 12.: 5.}))
+    assert book.bids.size_to_depth(1) == 1.
+    assert book.bids.size_to_depth(10) == 6.
+    assert book.bids.size_to_price(9.) == 3.
+    assert book.bids.size_to_price(10.5) == 0.
+    assert book.asks.size_to_depth(1) == 4.
+    assert book.asks.size_to_price(12.) == 9.
+    assert book.asks.size_to_price(10.) == 0.
+
+
+def test_mirror_notifies_only_on_change():
+    mirror = OrderBookMirror(client=None)
+    seen = []
+    mirror.on_change(lambda key, book, changes: seen.append((key, changes)), key=KEY)
+    assert mirror.update(KEY, _depth({10.: 1.}, {})) == [(BID, 10., 0., 1.)]
+    assert mirror.update(KEY, _depth({10.: 1.}, {})) == []
+    mirror.update((UNDERLYING_ETH, 6, ORDER_TYPE_CALL), _depth({10.: 1.}, {}))
+    assert seen == [(KEY, [(BID, 10., 0., 1.)])]
+    assert mirror.best_bid(*KEY) == (10., 1.)
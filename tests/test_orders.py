@@ -0,0 +1,110 @@
+import asyncio
+import pytest
+from pareto import Client, ORDER_TYPE_CALL, ORDER_SIDE_BUY, ORDER_SIDE_SELL, UNDERLYING_ETH
+from pareto.orders import AsyncOrderTracker, OrderTracker
+from pareto.simulator import SimulatedExchange
+
+MAKER_KEY = '0x' + '11' * 32
+TAKER_KEY = '0x' + '22' * 32
+
+
+def test_crossing_limit_order_is_not_tracked():
+    with SimulatedExchange() as exchange:
+        maker = Client(exchange.url, eth_private_key=MAKER_KEY)
+        taker = Client(exchange.url, eth_private_key=TAKER_KEY)
+        tracker = OrderTracker(taker.private, UNDERLYING_ETH)
+        maker.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                         ORDER_TYPE_CALL, ORDER_SIDE_SELL)
+        taker.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                         ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+        assert taker.private.get_orders(UNDERLYING_ETH).data == []
+        assert tracker.orders() == []
+        assert tracker.at(5, ORDER_TYPE_CALL, ORDER_SIDE_BUY, 12.5) == []
+
+
+def test_partially_filled_limit_order_rests_with_remaining_quantity():
+    with SimulatedExchange() as exchange:
+        maker = Client(exchange.url, eth_private_key=MAKER_KEY)
+        taker = Client(exchange.url, eth_private_key=TAKER_KEY)
+        tracker = OrderTracker(taker.private, UNDERLYING_ETH)
+        maker.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                         ORDER_TYPE_CALL, ORDER_SIDE_SELL)
+        taker.private.create_limit_order(UNDERLYING_ETH, 5, 3., 12.5,
+                                         ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+        orders = tracker.orders()
+        assert len(orders) == 1
+        assert orders[0].quantity == 2.
+        assert not any(tracker.reconcile().values())
+
+
+class SnapshotHook:
+    r"""Client whose `get_orders` calls `during()` after the server took its
+    snapshot and before the tracker sees it."""
+    def __init__(self, client, during):
+        self._client = client
+        self._during = during
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def get_orders(self, underlying):
+        response = self._client.get_orders(underlying)
+        self._during()
+        return response
+
+
+def test_reconcile_keeps_changes_made_during_the_snapshot():
+    with SimulatedExchange() as exchange:
+        client = Client(exchange.url, eth_private_key=MAKER_KEY).private
+        cancelled = client.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                              ORDER_TYPE_CALL, ORDER_SIDE_BUY).data['id']
+        created = []
+
+        def during():
+            client.cancel_order_by_id(UNDERLYING_ETH, cancelled)
+            created.append(client.create_limit_order(UNDERLYING_ETH, 6, 1., 10.,
+                                                     ORDER_TYPE_CALL, ORDER_SIDE_BUY).data['id'])
+
+        # The listener is registered on the real client
+        tracker = OrderTracker(SnapshotHook(client, during), UNDERLYING_ETH)
+        tracker.reconcile()
+        # The snapshot shows the cancelled order and not the new one
+        assert [order.id for order in tracker.orders()] == created
+        assert tracker._changes == {}
+        assert not any(tracker.reconcile().values())
+        tracker.close()
+
+
+def test_order_tracker_rejects_async_clients():
+    from pareto.async_client import AsyncClient
+    client = AsyncClient('http://localhost', eth_private_key=MAKER_KEY)
+    with pytest.raises(AssertionError):
+        OrderTracker(client.private, UNDERLYING_ETH)
+
+
+def test_async_order_tracker_reconciles_and_verifies():
+    from pareto.async_client import AsyncClient
+
+    async def run(url):
+        async with AsyncClient(url, eth_private_key=MAKER_KEY) as client:
+            tracker = AsyncOrderTracker(client.private, UNDERLYING_ETH)
+            id = (await client.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                                          ORDER_TYPE_CALL,
+                                                          ORDER_SIDE_BUY)).data['id']
+            assert id in tracker
+            tracker._by_id.clear()
+            tracker._by_level.clear()
+            diff = await tracker.reconcile()
+            assert [order.id for order in diff['missing']] == [id]
+            assert (await tracker.verify(id)).id == id
+            await client.private.cancel_order_by_id(UNDERLYING_ETH, id)
+            assert id not in tracker
+            assert await tracker.verify(id) is None
+            diffs = []
+            tracker.start(10, on_diff=diffs.append)
+            await asyncio.sleep(0.1)
+            await tracker.close()
+            assert diffs == []
+
+    with SimulatedExchange() as exchange:
+        asyncio.run(run(exchange.url))
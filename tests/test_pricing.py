@@ -0,0 +1,68 @@
+import math
+import numpy as np
+import pytest
+from pareto import ORDER_TYPE_CALL, ORDER_TYPE_PUT
+from pareto.constants import VALID_STRIKE
+from pareto.pricing import TYPE_INDEX, black_scholes, norm_cdf, parse_mark, price_chain
+
+
+def test_norm_cdf_matches_erf():
+    x = np.linspace(-6., 6., 241)
+    exact = np.array([0.5 * (1. + math.erf(v / math.sqrt(2.))) for v in x])
+    assert np.max(np.abs(norm_cdf(x) - exact)) < 1e-7
+    assert norm_cdf(0.) == pytest.approx(0.5, abs=1e-9)
+
+
+def test_black_scholes_textbook_values():
+    # Hull: S=100, K=100, sigma=20%, r=5%, T=1
+    call = black_scholes(100., 100., 0.2, 1., 0.05, True)
+    put = black_scholes(100., 100., 0.2, 1., 0.05, False)
+    assert call['mark'] == pytest.approx(10.4506, abs=1e-4)
+    assert put['mark'] == pytest.approx(5.5735, abs=1e-4)
+    assert call['delta'] == pytest.approx(0.6368, abs=1e-4)
+    assert put['delta'] == pytest.approx(-0.3632, abs=1e-4)
+    assert call['gamma'] == put['gamma'] == pytest.approx(0.018762, abs=1e-6)
+    assert call['vega'] == pytest.approx(37.524, abs=1e-3)
+    assert call['theta'] == pytest.approx(-6.414, abs=1e-3)
+    assert put['theta'] == pytest.approx(-1.658, abs=1e-3)
+
+
+def test_put_call_parity():
+    rng = np.random.default_rng(0)
+    spot = rng.uniform(50., 150., 1000)
+    strike = rng.uniform(50., 150., 1000)
+    sigma = rng.uniform(0.05, 1.5, 1000)
+    tau = rng.uniform(0.01, 3., 1000)
+    rate = rng.uniform(0., 0.1, 1000)
+    call = black_scholes(spot, strike, sigma, tau, rate, True)
+    put = black_scholes(spot, strike, sigma, tau, rate, False)
+    forward = spot - strike * np.exp(-rate * tau)
+    # norm_cdf is accurate to ~1e-7, scaled by prices up to a few hundred
+    assert np.max(np.abs(call['mark'] - put['mark'] - forward)) < 1e-4
+    assert np.allclose(call['delta'] - put['delta'], 1.)
+
+
+def test_expired_options_are_worth_their_intrinsic_value():
+    # tau is floored at 1e-12 years, leaving a trace of time value at the money
+    strike = np.array([90., 100., 110.])
+    assert black_scholes(100., strike, 0.5, 0., 0., True)['mark'].tolist() == pytest.approx(
+        [10., 0., 0.], abs=1e-4)
+    assert black_scholes(100., strike, 0.5, 0., 0., False)['mark'].tolist() == pytest.approx(
+        [0., 0., 10.], abs=1e-4)
+
+
+def test_price_chain_rows_follow_type_index():
+    strikes = [1000. + 100. * i for i in VALID_STRIKE]
+    sigma = np.zeros((2, len(strikes)))
+    sigma[TYPE_INDEX[ORDER_TYPE_CALL]] = 0.6
+    sigma[TYPE_INDEX[ORDER_TYPE_PUT]] = 0.7
+    chain = price_chain(1500., strikes, sigma, 0.1, 0.02)
+    assert chain.mark.shape == (2, len(strikes))
+    expected = black_scholes(1500., strikes[3], 0.7, 0.1, 0.02, False)
+    put = chain.get(3, ORDER_TYPE_PUT)
+    for name, value in put.items():
+        assert value == pytest.approx(float(expected[name]))
+    assert chain.get(3, ORDER_TYPE_CALL)['mark'] == pytest.approx(
+        float(black_scholes(1500., strikes[3], 0.6, 0.1, 0.02, True)['mark']))
+    mark = parse_mark({'calls': [1., 2.], 'puts': [3., 4.]})
+    assert mark[TYPE_INDEX[ORDER_TYPE_PUT]].tolist() == [3., 4.]
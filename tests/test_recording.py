@@ -0,0 +1,111 @@
+import socket
+import threading
+import pytest
+import requests
+from pareto import Client, ORDER_TYPE_CALL, ORDER_SIDE_BUY, UNDERLYING_ETH
+from pareto.errors import ParetoAPIError, ParetoError, ParetoTimeoutError
+from pareto.recording import (MAGIC, STATUS_NO_RESPONSE, STATUS_TRANSPORT_ERROR, Record,
+                              Recorder, ReplayTransport, read_records)
+from pareto.simulator import SimulatedExchange
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _slow_sigma(method, path):
+    return 300 if path.startswith('/public/sigma') else 0
+
+
+def test_record_then_replay_round_trip(tmp_path):
+    path = str(tmp_path / 'capture.bin')
+    live = []
+    with Recorder(path) as recorder, SimulatedExchange(latency=_slow_sigma) as exchange:
+        client = Client(exchange.url, eth_private_key=PRIVATE_KEY, recorder=recorder)
+        live.append(client.public.get_mark(UNDERLYING_ETH).data)
+        order = client.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                                  ORDER_TYPE_CALL, ORDER_SIDE_BUY).data
+        live.append(order)
+        live.append(client.private.get_orders(UNDERLYING_ETH).data)
+        with pytest.raises(ParetoAPIError):
+            client.private.get_order_by_id(UNDERLYING_ETH, 'missing')
+        with pytest.raises(ParetoTimeoutError), client.deadline(50):
+            client.public.get_sigma(UNDERLYING_ETH, 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+        refused = Client(f'http://127.0.0.1:{_free_port()}', recorder=recorder)
+        with pytest.raises(requests.ConnectionError):
+            refused.public.get_mark(UNDERLYING_ETH)
+
+    with open(path, 'rb') as f:
+        assert f.read(len(MAGIC)) == MAGIC
+    records = list(read_records(path))
+    assert [record.method for record in records] == ['GET', 'POST', 'GET', 'GET', 'GET', 'GET']
+    assert [record.status for record in records] == [
+        200, 200, 200, 404, STATUS_NO_RESPONSE, STATUS_TRANSPORT_ERROR]
+    assert b'"strike": 5' in records[1].request
+
+    replay = ReplayTransport(path)
+    client = Client('http://anywhere', eth_private_key=PRIVATE_KEY, transport=replay)
+    assert client.public.get_mark(UNDERLYING_ETH).data == live[0]
+    assert client.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.5,
+                                             ORDER_TYPE_CALL, ORDER_SIDE_BUY).data == live[1]
+    assert client.private.get_orders(UNDERLYING_ETH).data == live[2]
+    with pytest.raises(ParetoAPIError) as error:
+        client.private.get_order_by_id(UNDERLYING_ETH, 'missing')
+    assert error.value.status_code == 404
+    with pytest.raises(ParetoTimeoutError):
+        client.public.get_sigma(UNDERLYING_ETH, 5, ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    with pytest.raises(requests.ConnectionError):
+        client.public.get_mark(UNDERLYING_ETH)
+    assert len(replay) == 0
+    with pytest.raises(ParetoError):
+        client.public.get_mark(UNDERLYING_ETH)
+    replay.close()
+
+
+def test_pack_unpack_round_trip():
+    record = Record(1660000000.5, 0.25, 201, 'POST', 'http://h/user/create/limit/0',
+                    b'{"a": 1}', {'Content-Type': 'application/json'}, b'{"id": "x"}')
+    packed = b'\x00' * 3 + record.pack()
+    unpacked, end = Record.unpack(packed, 3)
+    assert end == len(packed)
+    for name in Record.__slots__:
+        assert getattr(unpacked, name) == getattr(record, name)
+
+
+def test_recorder_applies_backpressure(tmp_path, monkeypatch):
+    recorder = Recorder(str(tmp_path / 'capture.bin'), max_queued=2)
+    record = Record(0., 0., 200, 'GET', 'http://h/a', b'', {}, b'')
+    writing = threading.Event()
+    produced = threading.Event()
+    gate = threading.Lock()
+    gate.acquire()
+    pack = Record.pack
+
+    def slow_pack(self):
+        writing.set()
+        with gate:
+            return pack(self)
+
+    # Hold the writer on its first record so the queue fills up
+    monkeypatch.setattr(Record, 'pack', slow_pack)
+
+    def produce():
+        for _ in range(4):
+            recorder.record(record)
+        produced.set()
+
+    thread = threading.Thread(target=produce)
+    thread.start()
+    assert writing.wait(2.)
+    # One record is being written and two are queued: the last one waits
+    assert not produced.wait(0.1)
+    assert recorder._queue.qsize() == 2
+    gate.release()
+    assert produced.wait(2.)
+    thread.join()
+    recorder.close()
+    assert recorder.records == 4
@@ -0,0 +1,118 @@
+import asyncio
+from pareto import Client, ORDER_TYPE_CALL, ORDER_TYPE_PUT, ORDER_SIDE_BUY, ORDER_SIDE_SELL
+from pareto import UNDERLYING_ETH
+from pareto.errors import ParetoError
+from pareto.models import Order
+from pareto.requote import AsyncRequoter, Requoter, diff_quotes
+from pareto.simulator import SimulatedExchange
+
+PRIVATE_KEY = '0x' + '11' * 32
+
+
+def _quote(strike, price, quantity=1., order_side=ORDER_SIDE_BUY, order_type=ORDER_TYPE_CALL):
+    return {'strike': strike, 'order_type': order_type, 'order_side': order_side,
+            'price': price, 'quantity': quantity}
+
+
+def _order(id, strike, price, quantity=1., order_side=ORDER_SIDE_BUY,
+           order_type=ORDER_TYPE_CALL):
+    return Order(id, strike, quantity, price, order_type, order_side)
+
+
+def test_diff_keeps_cancels_and_creates():
+    orders = [_order('same', 5, 12.5), _order('resized', 6, 10.), _order('gone', 7, 8.)]
+    # Prices and quantities compare at 0.01
+    plan = diff_quotes([_quote(5, 12.501), _quote(6, 10., 2.), _quote(8, 5.)], orders)
+    assert [order.id for order in plan.kept] == ['same']
+    assert sorted(plan.cancels) == ['gone', 'resized']
+    assert plan.creates == [_quote(6, 10., 2.), _quote(8, 5.)]
+    assert plan.deferred == []
+    assert len(plan) == 3
+    assert len(diff_quotes([_quote(5, 12.5)], orders[:1])) == 0
+
+
+def test_diff_matches_duplicate_quotes_one_to_one():
+    orders = [_order('a', 5, 12.5), _order('b', 5, 12.5), _order('c', 5, 12.5)]
+    plan = diff_quotes([_quote(5, 12.5)] * 2, orders)
+    assert len(plan.kept) == 2 and len(plan.cancels) == 1
+    assert {order.id for order in plan.kept} | set(plan.cancels) == {'a', 'b', 'c'}
+    plan = diff_quotes([_quote(5, 12.5)] * 3, orders[:1])
+    assert [order.id for order in plan.kept] == ['a']
+    assert plan.creates == [_quote(5, 12.5)] * 2
+
+
+def test_diff_defers_quotes_crossing_cancelled_orders():
+    orders = [_order('ask', 5, 12., order_side=ORDER_SIDE_SELL),
+              _order('bid', 6, 10.),
+              _order('put', 7, 9., order_side=ORDER_SIDE_SELL, order_type=ORDER_TYPE_PUT)]
+    plan = diff_quotes([
+        _quote(5, 12.),
+        _quote(5, 11.99),
+        _quote(6, 10., order_side=ORDER_SIDE_SELL),
+        _quote(6, 10.01, order_side=ORDER_SIDE_SELL),
+        _quote(7, 9.5),
+        _quote(7, 9.5, order_type=ORDER_TYPE_PUT),
+    ], orders)
+    assert plan.deferred == [_quote(5, 12.), _quote(6, 10., order_side=ORDER_SIDE_SELL),
+                             _quote(7, 9.5, order_type=ORDER_TYPE_PUT)]
+    assert plan.creates == [_quote(5, 11.99), _quote(6, 10.01, order_side=ORDER_SIDE_SELL),
+                            _quote(7, 9.5)]
+    assert len(plan) == 7
+
+
+def test_requote_never_trades_against_itself():
+    with SimulatedExchange() as exchange:
+        client = Client(exchange.url, eth_private_key=PRIVATE_KEY).private
+        client.create_limit_order(UNDERLYING_ETH, 5, 1., 12., ORDER_TYPE_CALL, ORDER_SIDE_SELL)
+        requoter = Requoter(client, UNDERLYING_ETH)
+        plan = requoter.plan([_quote(5, 12.5), _quote(6, 10.)])
+        assert plan.creates == [_quote(6, 10.)] and plan.deferred == [_quote(5, 12.5)]
+        result = requoter.execute(plan)
+        assert result.ok and len(result.created) == 2
+        orders = Order.many(client.get_orders(UNDERLYING_ETH).data)
+        assert sorted((order.strike, order.price, order.quantity) for order in orders) == [
+            (5, 12.5, 1.), (6, 10., 1.)]
+        assert len(requoter.plan([_quote(5, 12.5), _quote(6, 10.)])) == 0
+
+
+class FailingCancel:
+    r"""Client whose `cancel_batch` always fails."""
+    def __init__(self, client):
+        self._client = client
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+    def cancel_batch(self, underlying, ids):
+        raise ParetoError('cancel failed')
+
+
+def test_deferred_quotes_are_not_sent_when_the_cancel_fails():
+    with SimulatedExchange() as exchange:
+        client = Client(exchange.url, eth_private_key=PRIVATE_KEY).private
+        ask = client.create_limit_order(UNDERLYING_ETH, 5, 1., 12., ORDER_TYPE_CALL,
+                                        ORDER_SIDE_SELL).data['id']
+        result = Requoter(FailingCancel(client), UNDERLYING_ETH).requote(
+            [_quote(5, 12.5), _quote(6, 10.)])
+        assert not result.ok and not result.cancelled.ok
+        assert result.created[0].ok
+        assert isinstance(result.created[1].error, ParetoError)
+        orders = Order.many(client.get_orders(UNDERLYING_ETH).data)
+        assert sorted(order.id for order in orders) == sorted([ask, result.created[0].response
+                                                               .data['id']])
+
+
+def test_async_requote_defers_crossing_quotes():
+    from pareto.async_client import AsyncClient
+
+    async def run(url):
+        async with AsyncClient(url, eth_private_key=PRIVATE_KEY) as client:
+            await client.private.create_limit_order(UNDERLYING_ETH, 5, 1., 12.,
+                                                    ORDER_TYPE_CALL, ORDER_SIDE_SELL)
+            requoter = AsyncRequoter(client.private, UNDERLYING_ETH)
+            result = await requoter.requote([_quote(5, 12.5), _quote(6, 10.)])
+            assert result.ok and len(result.plan.deferred) == 1
+            assert len(await requoter.plan([_quote(5, 12.5), _quote(6, 10.)])) == 0
+
+    with SimulatedExchange() as exchange:
+        asyncio.run(run(exchange.url))
@@ -0,0 +1,126 @@
+import math
+import numpy as np
+import pytest
+from pareto import (ORDER_TYPE_CALL, ORDER_TYPE_PUT, ORDER_SIDE_BUY, ORDER_SIDE_SELL,
+                    UNDERLYING_ETH, VALID_ORDER_SIDE)
+from pareto.errors import ParetoError
+from pareto.risk import OPTIONS, Portfolio, option_index
+from pareto.utils import Response
+
+CALL_GREEKS = {'delta': 0.5, 'gamma': 0.01, 'vega': 2., 'theta': -1.}
+PUT_GREEKS = {'delta': -0.4, 'gamma': 0.02, 'vega': 1.5, 'theta': -0.5}
+
+
+class MarginClient:
+    r"""Stub of `get_initial_margin_new_order`: 10 per unit of a call and 20
+    per unit squared of a put. Fails for strike 3 and returns an unexpected
+    payload for strike 4."""
+    def __init__(self):
+        self.calls = []
+
+    def get_initial_margin_new_order(self, underlying, strike, quantity, order_type, order_side):
+        self.calls.append((strike, quantity, order_type, order_side))
+        if strike == 3:
+            raise ParetoError('unavailable')
+        if strike == 4:
+            return Response(data={'error': 'reshaped'})
+        if order_type == ORDER_TYPE_CALL:
+            return Response(data={'margin': 10. * quantity})
+        return Response(data={'margin': 20. * quantity * quantity})
+
+
+def _portfolio():
+    portfolio = Portfolio(UNDERLYING_ETH)
+    portfolio.set_greeks(5, ORDER_TYPE_CALL, CALL_GREEKS)
+    portfolio.set_greeks(5, ORDER_TYPE_PUT, PUT_GREEKS)
+    portfolio.set_position(5, ORDER_TYPE_CALL, 2.)
+    portfolio.set_position(5, ORDER_TYPE_PUT, -1.)
+    return portfolio
+
+
+def _assert_exposure(exposure, expected):
+    assert exposure.keys() == expected.keys()
+    for name, value in expected.items():
+        assert exposure[name] == pytest.approx(value)
+
+
+def test_exposure_is_the_quantity_weighted_sum_of_greeks():
+    portfolio = _portfolio()
+    _assert_exposure(portfolio.exposure(), {
+        name: 2. * CALL_GREEKS[name] - PUT_GREEKS[name] for name in CALL_GREEKS})
+    by_option = portfolio.exposure_by_option()
+    assert by_option.shape == (len(OPTIONS), 4)
+    call = by_option[option_index(5, ORDER_TYPE_CALL)]
+    assert call.tolist() == pytest.approx([1., 0.02, 4., -2.])
+    assert by_option.sum(axis=0).tolist() == pytest.approx(list(portfolio.exposure().values()))
+
+
+def test_incremental_updates_match_a_full_recompute():
+    portfolio = _portfolio()
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        strike, order_type = OPTIONS[rng.integers(len(OPTIONS))]
+        if rng.random() < 0.5:
+            portfolio.set_position(strike, order_type, float(rng.normal()))
+        else:
+            portfolio.set_greeks(strike, order_type, dict(zip(CALL_GREEKS, rng.normal(size=4))))
+    incremental = portfolio.exposure()
+    portfolio.recompute()
+    _assert_exposure(incremental, portfolio.exposure())
+
+
+def test_load_positions_nets_sides():
+    portfolio = Portfolio(UNDERLYING_ETH)
+    portfolio.set_greeks(5, ORDER_TYPE_CALL, CALL_GREEKS)
+    portfolio.load_positions([
+        {'strike': 5, 'quantity': 3., 'price': 10., 'isCall': True, 'isBuy': True},
+        {'strike': 5, 'quantity': 1., 'price': 11., 'isCall': True, 'isBuy': False},
+    ])
+    assert portfolio.quantity[option_index(5, ORDER_TYPE_CALL)] == 2.
+    assert portfolio.exposure()['delta'] == pytest.approx(1.)
+
+
+def test_what_if_leaves_the_portfolio_unchanged():
+    portfolio = _portfolio()
+    before = portfolio.exposure()
+    portfolio.set_margin_rate(5, ORDER_TYPE_CALL, ORDER_SIDE_SELL, 10.)
+    exposure, margin = portfolio.what_if([
+        {'strike': 5, 'quantity': 2., 'order_type': ORDER_TYPE_CALL,
+         'order_side': ORDER_SIDE_SELL},
+    ])
+    _assert_exposure(exposure, {name: before[name] - 2. * CALL_GREEKS[name]
+                                for name in CALL_GREEKS})
+    assert margin == 20.
+    assert portfolio.exposure() == before
+    # No rate for puts yet
+    _, margin = portfolio.what_if([
+        {'strike': 5, 'quantity': 1., 'order_type': ORDER_TYPE_PUT,
+         'order_side': ORDER_SIDE_BUY},
+    ])
+    assert math.isnan(margin)
+    assert portfolio.what_if([]) == (before, 0.)
+
+
+def test_fetch_margin_rates_survives_failures():
+    portfolio = Portfolio(UNDERLYING_ETH)
+    errors = portfolio.fetch_margin_rates(MarginClient())
+    assert sorted(errors) == sorted((strike, order_type, order_side)
+                                    for strike in (3, 4)
+                                    for order_type in (ORDER_TYPE_CALL, ORDER_TYPE_PUT)
+                                    for order_side in (ORDER_SIDE_BUY, ORDER_SIDE_SELL))
+    buy = VALID_ORDER_SIDE.index(ORDER_SIDE_BUY)
+    assert portfolio.margin_rates[option_index(5, ORDER_TYPE_CALL), buy] == 10.
+    assert math.isnan(portfolio.margin_rates[option_index(3, ORDER_TYPE_CALL), buy])
+    assert np.isfinite(portfolio.margin_rates).sum() == len(OPTIONS) * 2 - 8
+
+
+def test_what_if_with_client_uses_the_real_quantity():
+    portfolio = Portfolio(UNDERLYING_ETH)
+    portfolio.fetch_margin_rates(MarginClient())
+    orders = [{'strike': 5, 'quantity': 3., 'order_type': ORDER_TYPE_PUT,
+               'order_side': ORDER_SIDE_BUY}]
+    # The per-unit rate scales linearly, the exchange does not
+    assert portfolio.what_if(orders)[1] == 60.
+    client = MarginClient()
+    assert portfolio.what_if(orders, client=client)[1] == 180.
+    assert client.calls == [(5, 3., ORDER_TYPE_PUT, ORDER_SIDE_BUY)]
@@ -0,0 +1,104 @@
+import socket
+import threading
+import time
+import pytest
+import requests
+from pareto.errors import ParetoAPIError, ParetoTimeoutError
+from pareto.scheduler import (LANE_CANCEL, LANE_CREATE, LANE_PUBLIC_READ, RequestScheduler,
+                              TokenBucket)
+from pareto.simulator import SimulatedExchange
+from pareto.transport import Transport
+
+
+def _wait_queued(scheduler, lane, count=1):
+    end = time.monotonic() + 2.
+    while scheduler.stats()['lanes'][lane]['queued'] < count:
+        assert time.monotonic() < end, f'{lane} never queued'
+        time.sleep(0.001)
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def test_token_bucket_refills_at_rate_up_to_burst():
+    bucket = TokenBucket(rate=10., burst=2)
+    now = bucket.updated
+    assert bucket.try_acquire(now)
+    assert bucket.try_acquire(now)
+    assert not bucket.try_acquire(now)
+    assert bucket.delay(now) == pytest.approx(0.1)
+    assert not bucket.try_acquire(now + 0.05)
+    assert bucket.try_acquire(now + 0.11)
+    # A long pause refills to the burst, not beyond
+    assert bucket.try_acquire(now + 10.)
+    assert bucket.try_acquire(now + 10.)
+    assert not bucket.try_acquire(now + 10.)
+
+
+def test_rate_limited_lane_waits_for_a_token():
+    scheduler = RequestScheduler(limits={LANE_PUBLIC_READ: (20., 1)})
+    scheduler.acquire(LANE_PUBLIC_READ)
+    scheduler.release()
+    # The next token is 50 ms away
+    with pytest.raises(ParetoTimeoutError):
+        scheduler.acquire(LANE_PUBLIC_READ, timeout=0.01)
+    start = time.monotonic()
+    scheduler.acquire(LANE_PUBLIC_READ, timeout=1.)
+    assert time.monotonic() - start >= 0.03
+    scheduler.release()
+    # Other lanes are not held back by the limit
+    scheduler.acquire(LANE_CREATE, timeout=0.01)
+    scheduler.release()
+    assert scheduler.stats()['in_flight'] == 0
+
+
+def test_more_urgent_lane_is_admitted_first():
+    scheduler = RequestScheduler(max_in_flight=1)
+    scheduler.acquire(LANE_PUBLIC_READ)
+    admitted = []
+
+    def send(lane):
+        scheduler.acquire(lane, timeout=2.)
+        admitted.append(lane)
+        scheduler.release()
+
+    threads = []
+    for lane in (LANE_PUBLIC_READ, LANE_CREATE, LANE_CANCEL):
+        thread = threading.Thread(target=send, args=(lane,))
+        thread.start()
+        threads.append(thread)
+        _wait_queued(scheduler, lane)
+    scheduler.release()
+    for thread in threads:
+        thread.join()
+    assert admitted == [LANE_CANCEL, LANE_CREATE, LANE_PUBLIC_READ]
+    assert scheduler.stats()['in_flight'] == 0
+
+
+def test_transport_releases_on_timeout():
+    scheduler = RequestScheduler(max_in_flight=1)
+    transport = Transport(scheduler=scheduler)
+    with SimulatedExchange(latency=300) as exchange:
+        with pytest.raises(ParetoTimeoutError):
+            transport.request(f'{exchange.url}/ping', 'GET', deadline=50)
+    assert scheduler.stats()['in_flight'] == 0
+    transport.close()
+
+
+def test_transport_releases_on_errors():
+    scheduler = RequestScheduler(max_in_flight=1)
+    transport = Transport(scheduler=scheduler)
+    with pytest.raises(requests.ConnectionError):
+        transport.request(f'http://127.0.0.1:{_free_port()}/ping', 'GET')
+    assert scheduler.stats()['in_flight'] == 0
+    with SimulatedExchange() as exchange:
+        with pytest.raises(ParetoAPIError):
+            transport.request(f'{exchange.url}/missing', 'GET')
+        assert scheduler.stats()['in_flight'] == 0
+        # The single slot is free again
+        assert transport.request(f'{exchange.url}/ping', 'GET').data == {'pong': True}
+    assert scheduler.stats()['in_flight'] == 0
+    transport.close()
@@ -0,0 +1,71 @@
+import json
+import pytest
+from simplejson.encoder import JSONEncoderForHTML
+from eth_account import Account
+from eth_account.messages import encode_defunct
+from pareto.signer import Signer, coincurve, encode_message, hash_message, recover_address
+
+PRIVATE_KEY = '0x' + '4c0883a69102937d6231471b5dbb6204fe5129617082792ae468d01a3f362318'
+
+MESSAGES = [
+    ('GET', '/user/orders/0?strike=5&isCall=True', {}, 1660000000),
+    ('POST', '/user/create/limit/0',
+     {'strike': 5, 'quantity': 1.25, 'price': 12.5, 'isCall': True, 'isBuy': False}, 1660000001),
+    ('POST', '/user/cancel/batch/0', {'ids': ['a&b', '<script>', 'x>y']}, 1660000002),
+    ('POST', '/user/create/market/0', {'note': '&<>é '}, 1660000003),
+    ('GET', '/user/order/0/<id>&', {}, 0),
+]
+
+
+def reference_sign(method, uri, body, timestamp):
+    r"""Original signing path: simplejson's HTML-safe encoder and eth_account."""
+    message = {
+        'method': method,
+        'requestPath': uri,
+        'body': json.dumps(body),
+        'timestamp': timestamp,
+    }
+    text = JSONEncoderForHTML(separators=(',', ':')).encode(message)
+    return Account.sign_message(encode_defunct(text=text), PRIVATE_KEY).signature.hex()
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_encode_message_escapes_like_simplejson(message):
+    method, uri, body, timestamp = message
+    expected = JSONEncoderForHTML(separators=(',', ':')).encode({
+        'method': method,
+        'requestPath': uri,
+        'body': json.dumps(body),
+        'timestamp': timestamp,
+    })
+    assert encode_message(method, uri, json.dumps(body), timestamp) == expected
+
+
+@pytest.mark.parametrize('message', MESSAGES)
+def test_native_backend_matches_reference(message):
+    signature = Signer(PRIVATE_KEY, backend='native').sign(*message)
+    assert signature == reference_sign(*message)
+
+
+@pytest.mark.skipif(coincurve is None, reason='coincurve is not installed')
+@pytest.mark.parametrize('message', MESSAGES)
+def test_backends_sign_identically(message):
+    native = Signer(PRIVATE_KEY, backend='native')
+    fast = Signer(PRIVATE_KEY, backend='coincurve')
+    signature = fast.sign(*message)
+    assert signature == native.sign(*message)
+    method, uri, body, timestamp = message
+    message_hash = hash_message(method, uri, json.dumps(body), timestamp)
+    assert recover_address(message_hash, signature) == native.address
+
+
+def test_process_pool_is_spawned_and_signs_identically():
+    signer = Signer(PRIVATE_KEY)
+    pool = signer.start_pool(max_workers=2)
+    try:
+        assert pool._executor._mp_context.get_start_method() == 'spawn'
+        items = [(method, uri, json.dumps(body), timestamp)
+                 for method, uri, body, timestamp in MESSAGES]
+        assert list(pool.map(items)) == signer.sign_batch(items)
+    finally:
+        signer.stop_pool()
@@ -0,0 +1,114 @@
+import asyncio
+import threading
+import time
+from pareto import Client, UNDERLYING_ETH
+from pareto.simulator import SimulatedExchange
+from pareto.singleflight import SingleFlight
+
+WAITERS = 8
+
+
+def _wait_for(condition, timeout=2.):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'condition not met in time'
+        time.sleep(0.001)
+
+
+def _concurrently(singleflight, fn):
+    r"""Call `fn` through `singleflight` from `WAITERS` threads at once. Returns
+    the result or exception of each."""
+    outcomes = [None] * WAITERS
+
+    def call(i):
+        try:
+            outcomes[i] = singleflight.do('key', fn)
+        except Exception as error:
+            outcomes[i] = error
+
+    threads = [threading.Thread(target=call, args=(i,)) for i in range(WAITERS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return outcomes
+
+
+def _gated(result=None, error=None):
+    r"""Request function that blocks until every waiter has joined it."""
+    singleflight = SingleFlight()
+    calls = []
+
+    def fn():
+        calls.append(1)
+        _wait_for(lambda: singleflight.stats()['calls'] == WAITERS)
+        if error is not None:
+            raise error
+        return result
+
+    return singleflight, fn, calls
+
+
+def test_concurrent_identical_calls_share_one_request():
+    result = object()
+    singleflight, fn, calls = _gated(result=result)
+    outcomes = _concurrently(singleflight, fn)
+    assert len(calls) == 1
+    assert all(outcome is result for outcome in outcomes)
+    assert singleflight.stats() == {'calls': WAITERS, 'coalesced': WAITERS - 1, 'in_flight': 0}
+    # The key is released once the call completes
+    assert singleflight.do('key', lambda: 'fresh') == 'fresh'
+
+
+def test_error_reaches_every_waiter():
+    error = ConnectionError('refused')
+    singleflight, fn, calls = _gated(error=error)
+    outcomes = _concurrently(singleflight, fn)
+    assert len(calls) == 1
+    assert all(outcome is error for outcome in outcomes)
+    assert singleflight.stats()['in_flight'] == 0
+
+
+def test_async_waiters_share_one_request_and_its_error():
+    singleflight = SingleFlight()
+    calls = []
+
+    async def fn():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        raise ConnectionError('refused')
+
+    async def run():
+        return await asyncio.gather(*[singleflight.do_async('key', fn) for _ in range(WAITERS)],
+                                    return_exceptions=True)
+
+    outcomes = asyncio.run(run())
+    assert len(calls) == 1
+    assert all(isinstance(outcome, ConnectionError) for outcome in outcomes)
+    assert len({id(outcome) for outcome in outcomes}) == 1
+
+
+def test_client_sends_one_request_for_concurrent_identical_gets():
+    received = []
+
+    def latency(method, path):
+        received.append(path)
+        return 200
+
+    with SimulatedExchange(latency=latency) as exchange:
+        client = Client(exchange.url, singleflight=SingleFlight())
+        barrier = threading.Barrier(WAITERS)
+        responses = []
+
+        def get():
+            barrier.wait()
+            responses.append(client.public.get_mark(UNDERLYING_ETH))
+
+        threads = [threading.Thread(target=get) for _ in range(WAITERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert received == ['/public/price/mark/0']
+    assert len(responses) == WAITERS
+    assert all(response is responses[0] for response in responses)
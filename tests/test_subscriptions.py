@@ -0,0 +1,86 @@
+import itertools
+import time
+import pytest
+from pareto.subscriptions import PollScheduler, Subscription, Topic
+from pareto.utils import Response
+
+
+def _response(body):
+    return Response(raw=body)
+
+
+def _wait_for(condition, timeout=2.):
+    end = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < end, 'condition not met in time'
+        time.sleep(0.001)
+
+
+def test_interval_backs_off_while_unchanged_and_resets_on_change():
+    topic = Topic(('mark',), None, 50, 200, 2.)
+    assert topic.observe(_response(b'{"a": 1}'))
+    assert topic.interval == 50
+    intervals = []
+    for _ in range(4):
+        assert not topic.observe(_response(b'{"a": 1}'))
+        intervals.append(topic.interval)
+    assert intervals == [100, 200, 200, 200]
+    assert topic.observe(_response(b'{"a": 2}'))
+    assert topic.interval == 50
+    topic.failed()
+    assert topic.interval == 100
+    assert topic.stats() == {'subscribers': 0, 'interval': 100, 'polls': 7, 'changes': 2,
+                             'errors': 1}
+
+
+def test_unchanged_payloads_are_skipped():
+    bodies = iter([b'a', b'a', b'b', b'b', b'b', b'c'])
+    scheduler = PollScheduler()
+    subscription = scheduler.subscribe(('key',), lambda: _response(next(bodies, b'c')),
+                                       min_interval=1, max_interval=2, max_pending=10)
+    received = [subscription.get(timeout=2.).raw for _ in range(3)]
+    assert received == [b'a', b'b', b'c']
+    _wait_for(lambda: scheduler.stats()[('key',)]['polls'] >= 8)
+    with pytest.raises(TimeoutError):
+        subscription.get(timeout=0.01)
+    scheduler.close()
+
+
+def test_slow_consumer_keeps_only_the_latest_updates():
+    counter = itertools.count()
+    scheduler = PollScheduler()
+    subscription = scheduler.subscribe(('key',), lambda: _response(b'%d' % next(counter)),
+                                       min_interval=1, max_interval=1, max_pending=2)
+    _wait_for(lambda: scheduler.stats()[('key',)]['changes'] >= 10)
+    scheduler.unsubscribe(subscription)
+    assert ('key',) not in scheduler.stats()
+    first, second = subscription.get(timeout=1.), subscription.get(timeout=1.)
+    # Older updates were dropped, the two kept are consecutive
+    assert int(second.raw) == int(first.raw) + 1
+    assert int(first.raw) >= 8
+    scheduler.close()
+
+
+def test_max_pending_drops_the_oldest_update():
+    topic = Topic(('key',), None, 1, 1, 1.)
+    subscription = Subscription(None, topic, max_pending=2)
+    for body in (b'1', b'2', b'3'):
+        subscription._push(_response(body))
+    assert [subscription.get(timeout=0).raw for _ in range(2)] == [b'2', b'3']
+
+
+def test_shared_topic_uses_the_tightest_settings():
+    scheduler = PollScheduler()
+    fetch = lambda: _response(b'same')
+    slow = scheduler.subscribe(('key',), fetch, min_interval=100, max_interval=5000, backoff=3.)
+    topic = slow.topic
+    assert (topic.min_interval, topic.max_interval, topic.backoff) == (100, 5000, 3.)
+    fast = scheduler.subscribe(('key',), fetch, min_interval=200, max_interval=1000, backoff=1.5)
+    assert fast.topic is topic
+    assert (topic.min_interval, topic.max_interval, topic.backoff) == (100, 1000, 1.5)
+    assert topic.interval <= 1000
+    fast.close()
+    assert (topic.min_interval, topic.max_interval, topic.backoff) == (100, 5000, 3.)
+    with pytest.raises(AssertionError):
+        scheduler.subscribe(('key',), fetch, min_interval=100, max_interval=50)
+    scheduler.close()
@@ -0,0 +1,139 @@
+import time
+import numpy as np
+import pytest
+from pareto import ORDER_TYPE_CALL, ORDER_TYPE_PUT, ORDER_SIDE_BUY, ORDER_SIDE_SELL
+from pareto import UNDERLYING_ETH
+from pareto.client import PublicClient
+from pareto.constants import VALID_STRIKE
+from pareto.pricing import black_scholes
+from pareto.surface import VolSurface
+from pareto.utils import Response
+
+STRIKES = [1000. + 100. * i for i in VALID_STRIKE]
+
+
+class StubPublic:
+    r"""Public client serving editable strikes, expiry, marks and sigma, and
+    counting the calls made to each endpoint."""
+    get_chain_snapshot = PublicClient.get_chain_snapshot
+
+    def __init__(self):
+        self.strikes = list(STRIKES)
+        self.expiry = time.time() + 30 * 86400
+        self.mark = {'calls': [100.] * len(STRIKES), 'puts': [50.] * len(STRIKES)}
+        # Sigma rises by 0.01 per strike, buys 0.05 above sells
+        self.sigma = {(strike, order_type, order_side): 0.5 + 0.01 * strike + 0.05 * order_side
+                      for strike in VALID_STRIKE
+                      for order_type in (ORDER_TYPE_CALL, ORDER_TYPE_PUT)
+                      for order_side in (ORDER_SIDE_BUY, ORDER_SIDE_SELL)}
+        self.calls = []
+
+    def get_strikes(self, underlying):
+        self.calls.append('strikes')
+        return Response(data={'strikes': list(self.strikes)})
+
+    def get_expiry(self, underlying):
+        self.calls.append('expiry')
+        return Response(data={'expiry': self.expiry})
+
+    def get_mark(self, underlying):
+        self.calls.append('mark')
+        return Response(data={side: list(marks) for side, marks in self.mark.items()})
+
+    def get_sigma(self, underlying, strike, order_type, order_side):
+        self.calls.append((strike, order_type, order_side))
+        return Response(data={'sigma': self.sigma[strike, order_type, order_side]})
+
+
+def _surface():
+    client = StubPublic()
+    surface = VolSurface(client, UNDERLYING_ETH, spot=1500.)
+    surface.build()
+    client.calls.clear()
+    return client, surface
+
+
+def test_evaluate_interpolates_between_strikes():
+    _, surface = _surface()
+    assert surface.evaluate(1000., ORDER_TYPE_CALL, ORDER_SIDE_SELL) == pytest.approx(0.5)
+    assert surface.evaluate(1150., ORDER_TYPE_CALL, ORDER_SIDE_SELL) == pytest.approx(0.515)
+    assert surface.evaluate(1150., ORDER_TYPE_CALL, ORDER_SIDE_BUY) == pytest.approx(0.565)
+    # Flat beyond the outermost strikes
+    assert surface.evaluate(np.array([500., 5000.]), ORDER_TYPE_PUT,
+                            ORDER_SIDE_SELL).tolist() == pytest.approx([0.5, 0.6])
+    strikes, quantities = np.array([1050., 1475.]), np.array([1., 2.5])
+    sigma = surface.evaluate(strikes, ORDER_TYPE_CALL, ORDER_SIDE_SELL)
+    unit = black_scholes(1500., strikes, sigma, surface.tau, 0., ORDER_TYPE_CALL)['mark']
+    assert surface.prices(strikes, quantities, ORDER_TYPE_CALL,
+                          ORDER_SIDE_SELL).tolist() == pytest.approx((unit * quantities).tolist())
+
+
+def test_refresh_fetches_only_points_whose_mark_moved():
+    client, surface = _surface()
+    assert surface.refresh() == []
+    assert client.calls == ['mark']
+    client.calls.clear()
+    client.mark['puts'][3] = 55.
+    client.sigma[3, ORDER_TYPE_PUT, ORDER_SIDE_SELL] = 0.9
+    assert surface.refresh() == [(3, ORDER_TYPE_PUT, ORDER_SIDE_SELL)]
+    assert sorted(map(str, client.calls)) == sorted(map(str, [
+        'mark', (3, ORDER_TYPE_PUT, ORDER_SIDE_BUY), (3, ORDER_TYPE_PUT, ORDER_SIDE_SELL)]))
+    assert surface.evaluate(1300., ORDER_TYPE_PUT, ORDER_SIDE_SELL) == 0.9
+    client.calls.clear()
+    assert surface.refresh() == [] and client.calls == ['mark']
+
+
+def test_failed_refresh_is_retried():
+    client, surface = _surface()
+    client.mark['calls'][0] = 101.
+    fetch = client.get_sigma
+    client.get_sigma = None
+    with pytest.raises(TypeError):
+        surface.refresh()
+    client.get_sigma = fetch
+    client.calls.clear()
+    surface.refresh()
+    assert len(client.calls) == 3
+
+
+def test_quotes_are_cached_until_their_inputs_change():
+    client, surface = _surface()
+    quote = surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    put = surface.quote(5, 1., ORDER_TYPE_PUT, ORDER_SIDE_BUY)
+    client.sigma[5, ORDER_TYPE_CALL, ORDER_SIDE_BUY] = 0.9
+    # Served from the cache until the sigma is refreshed
+    assert surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY) == quote
+    surface.refresh([(5, ORDER_TYPE_CALL, ORDER_SIDE_BUY)])
+    repriced = surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    assert repriced > quote
+    # Other rows keep their cached quote
+    assert (5, 1., ORDER_TYPE_PUT, ORDER_SIDE_BUY) in surface._quotes
+    assert surface.quote(5, 1., ORDER_TYPE_PUT, ORDER_SIDE_BUY) == put
+
+
+def test_expiry_or_strike_changes_invalidate_quotes():
+    client, surface = _surface()
+    quote = surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    # Rollover to a longer expiry with the same sigma
+    client.expiry += 60 * 86400
+    surface.build()
+    rolled = surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    assert rolled > quote
+    client.strikes = [strike + 200. for strike in STRIKES]
+    surface.build()
+    assert surface._quotes == {}
+    assert surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY) < rolled
+    surface.set_spot(1600.)
+    assert surface._quotes == {}
+
+
+def test_quotes_expire_after_their_ttl():
+    client, surface = _surface()
+    surface.quote_ttl = 0.05
+    surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    cached = surface._quotes[5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY]
+    assert surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY) == cached[0]
+    assert surface._quotes[5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY] is cached
+    time.sleep(0.06)
+    surface.quote(5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY)
+    assert surface._quotes[5, 1., ORDER_TYPE_CALL, ORDER_SIDE_BUY][1] > cached[1]
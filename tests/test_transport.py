@@ -0,0 +1,85 @@
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+import pytest
+from pareto import Client, UNDERLYING_ETH
+from pareto.errors import ParetoTimeoutError
+from pareto.simulator import SimulatedExchange
+from pareto.transport import Transport, deadline, remaining_budget
+
+
+class _TrickleHandler(BaseHTTPRequestHandler):
+    r"""Sends a JSON body one byte every 50 ms."""
+    protocol_version = 'HTTP/1.1'
+    body = b'"abcdef"'
+
+    def do_GET(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.flush()
+        for i in range(len(self.body)):
+            time.sleep(0.05)
+            self.wfile.write(self.body[i:i + 1])
+            self.wfile.flush()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_timeouts_convert_ms_to_seconds():
+    transport = Transport(connect_timeout=250, read_timeout=1500)
+    assert transport.timeouts('http://h/ping') == (0.25, 1.5)
+    # A budget caps both phases
+    connect, read = transport.timeouts('http://h/ping', budget=100)
+    assert 0.09 < connect <= 0.1 and 0.09 < read <= 0.1
+    with deadline(500):
+        connect, read = transport.timeouts('http://h/ping')
+        assert connect == 0.25 and 0.45 < read <= 0.5
+    transport.close()
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    assert remaining_budget('http://h/ping') is None
+    with deadline(100):
+        with deadline(1000):
+            assert remaining_budget('http://h/ping') <= 0.1
+        assert remaining_budget('http://h/ping', budget=50) <= 0.05
+    with deadline(0):
+        with pytest.raises(ParetoTimeoutError):
+            remaining_budget('http://h/ping')
+
+
+def test_tight_deadline_times_out_against_a_slow_exchange():
+    with SimulatedExchange(latency=300) as exchange:
+        client = Client(exchange.url, timeout=5000)
+        start = time.monotonic()
+        with pytest.raises(ParetoTimeoutError), client.deadline(100):
+            client.public.get_mark(UNDERLYING_ETH)
+        assert time.monotonic() - start < 0.3
+        # Without a deadline the read timeout allows it
+        assert client.public.get_mark(UNDERLYING_ETH).data['calls']
+        # A budget shared by several requests runs out part way
+        with pytest.raises(ParetoTimeoutError), client.deadline(500):
+            for _ in range(3):
+                client.public.get_mark(UNDERLYING_ETH)
+
+
+def test_deadline_checked_after_a_trickling_response():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _TrickleHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    transport = Transport()
+    uri = 'http://127.0.0.1:{}/slow'.format(server.server_address[1])
+    try:
+        assert transport.request(uri, 'GET').data == 'abcdef'
+        # Every read is within the budget, the whole response is not
+        with pytest.raises(ParetoTimeoutError) as error, deadline(200):
+            transport.request(uri, 'GET')
+        assert error.value.msg == 'deadline exceeded while receiving'
+    finally:
+        transport.close()
+        server.shutdown()
+        server.server_close()